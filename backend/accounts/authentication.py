@@ -1,10 +1,17 @@
 # accounts/authentication.py
 from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.exceptions import InvalidToken, TokenError
 from django.conf import settings
+from .tokens import verify_access_token
 
 
 class CustomJWTAuthentication(JWTAuthentication):
     def authenticate(self, request):
+        # JWTRefreshMiddleware already verified this request's token
+        validated_token = getattr(request, "validated_access_token", None)
+        if validated_token is not None:
+            return self.get_user(validated_token), validated_token
+
         # Use the refreshed token if available; otherwise, fallback to the cookie.
         token = getattr(request, "new_access_token", None)
         if token is None:
@@ -17,3 +24,9 @@ class CustomJWTAuthentication(JWTAuthentication):
         request.META["HTTP_AUTHORIZATION"] = f"Bearer {token}"
 
         return super().authenticate(request)
+
+    def get_validated_token(self, raw_token):
+        try:
+            return verify_access_token(raw_token)
+        except TokenError as e:
+            raise InvalidToken({"detail": str(e)})
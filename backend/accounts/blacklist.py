@@ -0,0 +1,178 @@
+# accounts/blacklist.py
+"""
+Token blacklist in Redis, fronted by a bloom filter per process.
+
+Logging out blacklists the refresh and access tokens' jtis: a key that
+expires with the token, plus an entry in an index of recent additions.
+Every process keeps a bloom filter of the blacklisted jtis and pulls new
+additions from the index at most every REFRESH_INTERVAL seconds. A jti the
+filter has never seen is not blacklisted, with no network or database call.
+Only a filter hit, real or false positive, asks Redis. A logout on another
+process reaches this one within REFRESH_INTERVAL. The filter is rebuilt
+every REBUILD_INTERVAL so expired jtis drop out.
+"""
+import hashlib
+import logging
+import threading
+import time
+
+import redis
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+BLACKLIST_DEFAULTS = {
+    "REDIS_URL": None,  # None: the CELERY_RESULT_BACKEND Redis
+    "BLOOM_BITS": 1 << 20,  # 128KB per process; ~1% false positives at 100k jtis
+    "BLOOM_HASHES": 7,
+    "REFRESH_INTERVAL": 2,  # seconds between pulls of new additions
+    "REBUILD_INTERVAL": 3600,  # seconds between full rebuilds
+    "MAX_BACKOFF": 60,  # longest wait between retries while Redis is down
+}
+
+PREFIX = "jwt:blacklist"
+ADDED_KEY = f"{PREFIX}:added"  # jti -> time blacklisted
+
+
+def blacklist_setting(name):
+    return getattr(settings, "TOKEN_BLACKLIST", {}).get(name, BLACKLIST_DEFAULTS[name])
+
+
+_client = None
+
+
+def get_client():
+    global _client
+    if _client is None:
+        url = blacklist_setting("REDIS_URL") or settings.CELERY_RESULT_BACKEND
+        _client = redis.Redis.from_url(url)
+    return _client
+
+
+def _jti_key(jti):
+    return f"{PREFIX}:jti:{jti}"
+
+
+def _max_lifetime():
+    return int(settings.SIMPLE_JWT["REFRESH_TOKEN_LIFETIME"].total_seconds())
+
+
+class BloomFilter:
+    def __init__(self, bits, hashes):
+        self.bits = bits
+        self.hashes = hashes
+        self.array = bytearray((bits + 7) // 8)
+
+    def _positions(self, value):
+        digest = hashlib.sha256(value.encode()).digest()
+        h1 = int.from_bytes(digest[:8], "big")
+        h2 = int.from_bytes(digest[8:16], "big") | 1
+        return [(h1 + i * h2) % self.bits for i in range(self.hashes)]
+
+    def add(self, value):
+        for position in self._positions(value):
+            self.array[position >> 3] |= 1 << (position & 7)
+
+    def __contains__(self, value):
+        return all(
+            self.array[position >> 3] & (1 << (position & 7))
+            for position in self._positions(value)
+        )
+
+
+class BlacklistFilter:
+    """The process-local view of the blacklist."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.bloom = None
+        self.synced_until = 0.0  # additions up to this time are in the filter
+        self.next_refresh = 0.0
+        self.next_rebuild = 0.0
+        self.failures = 0  # consecutive failed syncs
+
+    def _rebuild(self, client, now):
+        bloom = BloomFilter(
+            blacklist_setting("BLOOM_BITS"), blacklist_setting("BLOOM_HASHES")
+        )
+        trim_index(now)
+        for jti in client.zrangebyscore(ADDED_KEY, "-inf", "+inf"):
+            bloom.add(jti.decode())
+        self.bloom = bloom
+        self.synced_until = now
+        self.next_rebuild = now + blacklist_setting("REBUILD_INTERVAL")
+
+    def _refresh(self, client, now):
+        # overlaps the last pull by a second to cover clock skew between hosts
+        for jti in client.zrangebyscore(ADDED_KEY, self.synced_until - 1, "+inf"):
+            self.bloom.add(jti.decode())
+        self.synced_until = now
+
+    def sync(self):
+        now = time.time()
+        with self.lock:
+            if now < self.next_refresh:
+                if self.bloom is None:
+                    raise redis.ConnectionError("Token blacklist not loaded yet")
+                return
+            client = get_client()
+            try:
+                if self.bloom is None or now >= self.next_rebuild:
+                    self._rebuild(client, now)
+                else:
+                    self._refresh(client, now)
+            except redis.RedisError as e:
+                # back off, so an outage does not cost every request a timeout
+                self.failures += 1
+                backoff = blacklist_setting("REFRESH_INTERVAL") * 2**self.failures
+                self.next_refresh = now + min(backoff, blacklist_setting("MAX_BACKOFF"))
+                if self.bloom is None:
+                    raise
+                # keep answering from the filter we have
+                logger.warning("Could not refresh the token blacklist: %s", e)
+                return
+            self.failures = 0
+            self.next_refresh = now + blacklist_setting("REFRESH_INTERVAL")
+
+    def might_contain(self, jti):
+        self.sync()
+        return jti in self.bloom
+
+    def add(self, jti):
+        with self.lock:
+            if self.bloom is not None:
+                self.bloom.add(jti)
+
+
+_filter = BlacklistFilter()
+
+
+def blacklist_jti(jti, exp):
+    """Blacklist `jti` until `exp`, the token's own expiry (a Unix time)."""
+    now = time.time()
+    ttl = int(exp - now) + 1
+    if ttl <= 0:
+        return  # expired already: rejected anyway
+    with get_client().pipeline() as pipe:
+        pipe.set(_jti_key(jti), 1, ex=ttl)
+        pipe.zadd(ADDED_KEY, {jti: now})
+        pipe.execute()
+    _filter.add(jti)
+
+
+def trim_index(now=None):
+    """Drop index entries old enough that their tokens have expired."""
+    now = time.time() if now is None else now
+    return get_client().zremrangebyscore(ADDED_KEY, "-inf", now - _max_lifetime())
+
+
+def is_blacklisted(jti, when_unavailable=True):
+    """`when_unavailable` is the answer when Redis cannot be reached."""
+    try:
+        if not _filter.might_contain(jti):
+            return False
+        return bool(get_client().exists(_jti_key(jti)))
+    except redis.RedisError as e:
+        # by default refuse the token rather than honour a revoked one
+        logger.warning("Token blacklist unavailable: %s", e)
+        return when_unavailable
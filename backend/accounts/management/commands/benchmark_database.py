@@ -0,0 +1,119 @@
+import itertools
+import statistics
+import threading
+import time
+import uuid
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from django.db import DatabaseError, connections
+
+from core.routers import replica_reads
+from editor.benchmark import percentile
+
+User = get_user_model()
+
+
+class Command(BaseCommand):
+    help = (
+        "Load-test the database the way web and worker processes use it: user "
+        "lookups (through the replica, if any) and concurrent last_access writes."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--concurrency",
+            default="1,8,32",
+            help="Comma-separated numbers of threads, each with its own connection.",
+        )
+        parser.add_argument(
+            "--operations",
+            type=int,
+            default=500,
+            help="Lookup + write pairs per level.",
+        )
+        parser.add_argument(
+            "--users",
+            type=int,
+            default=20,
+            help="Throwaway users the writes spread over.",
+        )
+
+    def handle(self, *args, **options):
+        try:
+            levels = [int(level) for level in options["concurrency"].split(",")]
+        except ValueError:
+            raise CommandError("--concurrency must be a list like 1,8,32")
+        tag = uuid.uuid4().hex[:8]
+        emails = [f"bench-{tag}-{i}@example.invalid" for i in range(options["users"])]
+        User.objects.bulk_create(
+            [User(email=email, username=email, full_name="bench") for email in emails]
+        )
+        self.stdout.write(
+            f"{'conc':>5} {'ops':>6} {'errors':>6} {'ops/s':>9} "
+            f"{'p50':>9} {'p95':>9} {'p99':>9} {'max':>9}"
+        )
+        try:
+            for concurrency in levels:
+                self.report(self.run_level(emails, concurrency, options["operations"]))
+        finally:
+            User.objects.filter(email__in=emails).delete()
+
+    def run_level(self, emails, concurrency, operations):
+        latencies = []
+        errors = 0
+        lock = threading.Lock()
+
+        def one(i):
+            nonlocal errors
+            started = time.perf_counter()
+            try:
+                with replica_reads():
+                    user = User.objects.get(email=emails[i % len(emails)])
+                # what every authenticated save does: bump the auto_now columns
+                user.save(update_fields=["last_access", "updated_at"])
+                ok = True
+            except DatabaseError:
+                ok = False
+            elapsed_ms = (time.perf_counter() - started) * 1000
+            with lock:
+                latencies.append(elapsed_ms)
+                if not ok:
+                    errors += 1
+
+        counter = itertools.count()
+
+        def worker():
+            # one connection per thread, kept (or pooled) across its operations
+            try:
+                while (i := next(counter)) < operations:
+                    one(i)
+            finally:
+                connections.close_all()
+
+        threads = [threading.Thread(target=worker) for _ in range(concurrency)]
+        wall_started = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        wall = time.perf_counter() - wall_started
+        return {
+            "concurrency": concurrency,
+            "operations": operations,
+            "errors": errors,
+            "throughput": round(operations / wall, 2) if wall else None,
+            "p50": round(percentile(latencies, 50), 2),
+            "p95": round(percentile(latencies, 95), 2),
+            "p99": round(percentile(latencies, 99), 2),
+            "mean": round(statistics.fmean(latencies), 2),
+            "max": round(max(latencies), 2),
+        }
+
+    def report(self, level):
+        self.stdout.write(
+            f"{level['concurrency']:>5} {level['operations']:>6} "
+            f"{level['errors']:>6} {level['throughput']:>9} "
+            f"{level['p50']:>9} {level['p95']:>9} "
+            f"{level['p99']:>9} {level['max']:>9}"
+        )
@@ -0,0 +1,84 @@
+import csv
+from collections import defaultdict
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from django.db import IntegrityError, transaction
+
+from accounts.usernames import MAX_ATTEMPTS, allocate_usernames, base_username
+
+User = get_user_model()
+
+
+class Command(BaseCommand):
+    help = (
+        "Create users from a CSV file with email, full_name and (optional) "
+        "password columns, in batches. Usernames are allocated as on sign-up; "
+        "users without a password must reset it before logging in."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("path", help="CSV file with a header row.")
+        parser.add_argument(
+            "--batch-size", type=int, default=500, help="Users created per query."
+        )
+
+    def handle(self, *args, **options):
+        created = skipped = 0
+        try:
+            with open(options["path"], newline="") as f:
+                batch = []
+                for row in csv.DictReader(f):
+                    batch.append(row)
+                    if len(batch) >= options["batch_size"]:
+                        done = self.import_batch(batch)
+                        created += done
+                        skipped += len(batch) - done
+                        batch = []
+                if batch:
+                    done = self.import_batch(batch)
+                    created += done
+                    skipped += len(batch) - done
+        except OSError as e:
+            raise CommandError(f"Could not read {options['path']}: {e}")
+        except KeyError as e:
+            raise CommandError(f"Missing column {e}")
+        self.stdout.write(f"Created {created} users, skipped {skipped}")
+
+    def import_batch(self, rows):
+        """Create the batch's new users; returns how many were created."""
+        emails = {User.objects.normalize_email(row["email"].strip()) for row in rows}
+        existing = set(
+            User.objects.filter(email__in=emails).values_list("email", flat=True)
+        )
+        users = {}
+        for row in rows:
+            email = User.objects.normalize_email(row["email"].strip())
+            if not email or email in existing or email in users:
+                continue
+            user = User(email=email, full_name=row["full_name"].strip())
+            if row.get("password"):
+                user.set_password(row["password"])
+            else:
+                user.set_unusable_password()
+            users[email] = user
+        if not users:
+            return 0
+
+        by_base = defaultdict(list)
+        for user in users.values():
+            by_base[base_username(user.full_name)].append(user)
+        for attempt in range(MAX_ATTEMPTS):
+            # one query per distinct name; a sign-up racing us fails the batch
+            for base, group in by_base.items():
+                for user, username in zip(
+                    group, allocate_usernames(base, len(group))
+                ):
+                    user.username = username
+            try:
+                with transaction.atomic():
+                    User.objects.bulk_create(users.values())
+                return len(users)
+            except IntegrityError:
+                if attempt == MAX_ATTEMPTS - 1:
+                    raise
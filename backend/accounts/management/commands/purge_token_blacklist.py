@@ -0,0 +1,53 @@
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+from rest_framework_simplejwt.token_blacklist.models import (
+    BlacklistedToken,
+    OutstandingToken,
+)
+
+from accounts.blacklist import blacklist_jti, trim_index
+
+
+class Command(BaseCommand):
+    help = (
+        "Delete expired rows from the token_blacklist tables in batches and trim "
+        "the Redis blacklist index."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--batch-size", type=int, default=1000, help="Rows deleted per query."
+        )
+        parser.add_argument(
+            "--sync-redis",
+            action="store_true",
+            help=(
+                "Copy tokens still blacklisted in the database into Redis first "
+                "(migration accounts 0002 does this once)."
+            ),
+        )
+
+    def handle(self, *args, **options):
+        now = timezone.now()
+        if options["sync_redis"]:
+            # tokens blacklisted before the blacklist moved to Redis
+            synced = 0
+            rows = BlacklistedToken.objects.filter(token__expires_at__gt=now)
+            for jti, expires_at in rows.values_list(
+                "token__jti", "token__expires_at"
+            ).iterator():
+                blacklist_jti(jti, expires_at.timestamp())
+                synced += 1
+            self.stdout.write(f"Copied {synced} blacklisted tokens to Redis")
+
+        expired = OutstandingToken.objects.filter(expires_at__lte=now)
+        deleted = 0
+        while True:
+            ids = list(expired.values_list("id", flat=True)[: options["batch_size"]])
+            if not ids:
+                break
+            # blacklisted rows go with their outstanding token (on_delete CASCADE)
+            OutstandingToken.objects.filter(id__in=ids).delete()
+            deleted += len(ids)
+        self.stdout.write(f"Deleted {deleted} expired tokens")
+        self.stdout.write(f"Trimmed {trim_index()} entries from the Redis index")
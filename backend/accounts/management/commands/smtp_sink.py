@@ -0,0 +1,82 @@
+import socketserver
+import threading
+import time
+
+from django.core.management.base import BaseCommand
+
+
+class SMTPSinkHandler(socketserver.StreamRequestHandler):
+    """Just enough SMTP to accept and drop messages; no TLS or AUTH checks."""
+
+    def reply(self, line):
+        self.wfile.write(f"{line}\r\n".encode())
+
+    def handle(self):
+        self.reply("220 smtp-sink ready")
+        while True:
+            line = self.rfile.readline()
+            if not line:
+                return
+            verb = line.decode(errors="replace").strip().split(" ", 1)[0].upper()
+            if verb == "EHLO":
+                self.reply("250-smtp-sink")
+                self.reply("250-AUTH PLAIN LOGIN")
+                self.reply("250 8BITMIME")
+            elif verb == "AUTH":
+                self.reply("235 accepted")
+            elif verb == "DATA":
+                self.reply("354 end with <CRLF>.<CRLF>")
+                while self.rfile.readline() not in (b".\r\n", b".\n", b""):
+                    pass
+                # stands in for the provider's processing time
+                time.sleep(self.server.delay)
+                self.server.count()
+                self.reply("250 queued")
+            elif verb == "QUIT":
+                self.reply("221 bye")
+                return
+            else:  # HELO, MAIL, RCPT, RSET, NOOP
+                self.reply("250 ok")
+
+
+class SMTPSink(socketserver.ThreadingTCPServer):
+    allow_reuse_address = True
+    daemon_threads = True
+
+    def __init__(self, address, delay):
+        super().__init__(address, SMTPSinkHandler)
+        self.delay = delay
+        self.received = 0
+        self.lock = threading.Lock()
+
+    def count(self):
+        with self.lock:
+            self.received += 1
+
+
+class Command(BaseCommand):
+    help = (
+        "Run a local SMTP server that accepts and discards mail, for development "
+        "and benchmarks (EMAIL_HOST=localhost EMAIL_PORT=1025 EMAIL_USE_TLS=False)."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--host", default="localhost")
+        parser.add_argument("--port", type=int, default=1025)
+        parser.add_argument(
+            "--delay",
+            type=float,
+            default=0.0,
+            help="Seconds to hold each message before accepting it.",
+        )
+
+    def handle(self, *args, **options):
+        server = SMTPSink((options["host"], options["port"]), options["delay"])
+        self.stdout.write(f"SMTP sink on {options['host']}:{options['port']}")
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            server.server_close()
+            self.stdout.write(f"{server.received} messages received")
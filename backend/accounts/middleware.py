@@ -1,52 +1,57 @@
+import logging
+
 from django.utils.deprecation import MiddlewareMixin
-from rest_framework_simplejwt.tokens import RefreshToken, AccessToken
 from django.conf import settings
-from datetime import datetime, timezone
-import jwt
 from rest_framework_simplejwt.exceptions import TokenError
+from core.tracing import traced
+from .tokens import (
+    RefreshToken,
+    remember_access_token,
+    skip_paths,
+    verify_access_token,
+)
+
+logger = logging.getLogger(__name__)
 
 
 class JWTRefreshMiddleware(MiddlewareMixin):
+    @traced("auth.jwt_refresh")
     def process_request(self, request):
-        print("Middleware called")
+        # static files, the API docs and the admin never read the JWT cookies
+        if request.path.startswith(skip_paths()):
+            return
         refresh_token = request.COOKIES.get(settings.SIMPLE_JWT["AUTH_COOKIE_REFRESH"])
         access_token = request.COOKIES.get(settings.SIMPLE_JWT["AUTH_COOKIE"])
 
+        if access_token:
+            try:
+                # verified once here (or taken from the cache) and handed to
+                # CustomJWTAuthentication, which does not verify it again
+                request.validated_access_token = verify_access_token(access_token)
+                return  # Token is valid, no need to refresh
+            except TokenError:
+                pass  # Access token is expired or invalid
+
         if not refresh_token:
             return  # No way to refresh without refresh token
 
-        try:
-            # Check if the access token is expired using SimpleJWT's built-in check
-            if access_token:
-                token = AccessToken(access_token)
-                token.check_exp()  # Raises TokenError if expired
-                return  # Token is valid, no need to refresh
-        except TokenError:
-            pass  # Access token is expired
         # Try refreshing the access token
         try:
-            # Manually decode refresh token to check its validity
-            decoded = jwt.decode(
-                refresh_token,
-                settings.SIMPLE_JWT["SIGNING_KEY"],
-                algorithms=["HS256"],  # Adjust based on your JWT settings
-            )
-            # Generate a new access token
+            # verifies signature, expiry and the blacklist (accounts.blacklist)
             refresh = RefreshToken(refresh_token)
-            new_access_token = str(refresh.access_token)
-
-            # Add new access token to request
-            request.META["HTTP_AUTHORIZATION"] = f"Bearer {new_access_token}"
-
-            # Store new access token for response
-            request.new_access_token = new_access_token
-            # print("New access token issued via refresh token")
-        except jwt.ExpiredSignatureError:
-            print("Refresh token is expired")
-        except jwt.InvalidTokenError:
-            print("Invalid refresh token")
         except TokenError as e:
-            print(f"Refresh token error: {e}")
+            logger.debug("Refresh token error: %s", e)
+            return
+        access = refresh.access_token
+        new_access_token = str(access)
+        remember_access_token(new_access_token, access)
+
+        # Add new access token to request
+        request.META["HTTP_AUTHORIZATION"] = f"Bearer {new_access_token}"
+        request.validated_access_token = access
+
+        # Store new access token for response
+        request.new_access_token = new_access_token
 
     def process_response(self, request, response):
         if hasattr(request, "new_access_token"):
@@ -0,0 +1,30 @@
+from django.db import migrations
+from django.utils import timezone
+
+
+def copy_token_blacklist_to_redis(apps, schema_editor):
+    # tokens blacklisted while the blacklist lived in the database; without
+    # them in Redis they would be honoured again. Redis is only needed when
+    # there are unexpired rows
+    from accounts.blacklist import blacklist_jti
+
+    BlacklistedToken = apps.get_model("token_blacklist", "BlacklistedToken")
+    rows = BlacklistedToken.objects.using(schema_editor.connection.alias).filter(
+        token__expires_at__gt=timezone.now()
+    )
+    for jti, expires_at in rows.values_list(
+        "token__jti", "token__expires_at"
+    ).iterator():
+        blacklist_jti(jti, expires_at.timestamp())
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("accounts", "0001_initial"),
+        ("token_blacklist", "0012_alter_outstandingtoken_user"),
+    ]
+
+    operations = [
+        migrations.RunPython(copy_token_blacklist_to_redis, migrations.RunPython.noop),
+    ]
@@ -1,7 +1,12 @@
 from rest_framework import serializers
 from django.contrib.auth import get_user_model
 from django.contrib.auth.password_validation import validate_password
-from django.utils.text import slugify
+from rest_framework_simplejwt.serializers import (
+    TokenObtainPairSerializer as BaseTokenObtainPairSerializer,
+)
+
+from .tokens import RefreshToken
+from .usernames import base_username, matches_base, save_with_username
 
 User = get_user_model()
 
@@ -34,39 +39,31 @@ class UserSerializer(serializers.ModelSerializer):
         validated_data.pop("password2", None)  # Remove password2 from data
 
         # Generate a username from full_name
-        full_name = validated_data.get("full_name", "")
-        base_username = slugify(full_name.replace(" ", "_"))
-        username = base_username
-        counter = 1
-        while User.objects.filter(username=username).exists():
-            username = f"{base_username}_{counter}"
-            counter += 1
-
-        validated_data["username"] = username
-
-        user = User.objects.create_user(
-            username=validated_data["username"],
-            email=validated_data["email"],
-            full_name=validated_data.get("full_name"),
+        def save(username):
+            return User.objects.create_user(
+                username=username,
+                email=validated_data["email"],
+                password=validated_data["password"],
+                full_name=validated_data.get("full_name"),
+            )
+
+        return save_with_username(
+            base_username(validated_data.get("full_name", "")), save
         )
-        user.set_password(validated_data["password"])
-        user.save()
-        return user
 
     def update(self, instance, validated_data):
         # Check if the full_name is being updated.
         if "full_name" in validated_data:
-            full_name = validated_data["full_name"]
-            base_username = slugify(full_name.replace(" ", "_"))
-            username = base_username
-            counter = 1
-            # Exclude the current instance from the uniqueness check.
-            while (
-                User.objects.filter(username=username).exclude(pk=instance.pk).exists()
-            ):
-                username = f"{base_username}_{counter}"
-                counter += 1
-            validated_data["username"] = username
+            base = base_username(validated_data["full_name"])
+            # an unchanged name keeps its username, without a query
+            if not matches_base(instance.username, base):
+                update = super().update
+
+                def save(username):
+                    validated_data["username"] = username
+                    return update(instance, validated_data)
+
+                return save_with_username(base, save, exclude_pk=instance.pk)
 
         # Proceed with the normal update.
         return super().update(instance, validated_data)
@@ -81,3 +78,8 @@ class PasswordResetConfirmSerializer(serializers.Serializer):
         write_only=True, validators=[validate_password]
     )
     token = serializers.CharField()
+
+
+class TokenObtainPairSerializer(BaseTokenObtainPairSerializer):
+    # refresh tokens whose blacklist lives in Redis (accounts.blacklist)
+    token_class = RefreshToken
@@ -0,0 +1,115 @@
+# accounts/tasks.py
+"""
+Email delivery, on the `email` queue so it never waits behind executions.
+
+Each worker process keeps one SMTP connection open and sends every message
+over it, reconnecting when the server has dropped it or it has sat idle for
+longer than IDLE_TIMEOUT. Templates are compiled once per process. A send
+that still fails is retried with exponential backoff.
+"""
+import smtplib
+import threading
+import time
+
+from celery import shared_task
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.contrib.auth.tokens import default_token_generator
+from django.core import mail
+from django.template.loader import get_template
+
+EMAIL_DELIVERY_DEFAULTS = {
+    "IDLE_TIMEOUT": 60,  # seconds before a kept connection is reopened
+    "MAX_RETRIES": 5,
+    "RETRY_BACKOFF_MAX": 600,  # seconds
+}
+
+PASSWORD_RESET_TEMPLATE = "accounts/password_reset_email.html"
+
+
+def email_setting(name):
+    return getattr(settings, "EMAIL_DELIVERY", {}).get(
+        name, EMAIL_DELIVERY_DEFAULTS[name]
+    )
+
+
+_templates = {}
+
+
+def email_template(name):
+    template = _templates.get(name)
+    if template is None:
+        template = _templates[name] = get_template(name)
+    return template
+
+
+_connection = None
+_last_used = 0.0
+_connection_lock = threading.Lock()
+
+
+def _close_connection():
+    global _connection
+    if _connection is not None:
+        try:
+            _connection.close()
+        except Exception:
+            pass  # already gone
+        _connection = None
+
+
+def _send(message):
+    global _connection, _last_used
+    if (
+        _connection is not None
+        and time.monotonic() - _last_used > email_setting("IDLE_TIMEOUT")
+    ):
+        _close_connection()
+    if _connection is None:
+        # EMAIL_BACKEND and EMAIL_HOST etc.; the test runner swaps in locmem
+        _connection = mail.get_connection()
+        _connection.open()
+    try:
+        _connection.send_messages([message])
+    except Exception:
+        _close_connection()
+        raise
+    _last_used = time.monotonic()
+
+
+def send_email(message):
+    """Send `message` over this process's SMTP connection."""
+    with _connection_lock:
+        try:
+            _send(message)
+        except smtplib.SMTPServerDisconnected:
+            # the server closed the kept connection; one fresh attempt
+            _send(message)
+
+
+@shared_task(
+    autoretry_for=(smtplib.SMTPException, OSError),
+    max_retries=email_setting("MAX_RETRIES"),
+    retry_backoff=True,
+    retry_backoff_max=email_setting("RETRY_BACKOFF_MAX"),
+    retry_jitter=True,
+)
+def send_password_reset_email(user_id):
+    try:
+        user = get_user_model().objects.get(pk=user_id)
+    except get_user_model().DoesNotExist:
+        return  # deleted since the request
+    token = default_token_generator.make_token(user)
+    context = {
+        "user": user,
+        "reset_url": f"https://yourfrontend.com/reset-password?token={token}?email={user.email}",
+        "valid_hours": 24,
+    }
+    message = mail.EmailMessage(
+        subject="Reset Your Password",
+        body=email_template(PASSWORD_RESET_TEMPLATE).render(context),
+        to=[user.email],
+        from_email=settings.DEFAULT_FROM_EMAIL,
+    )
+    message.content_subtype = "html"
+    send_email(message)
@@ -1,3 +1,324 @@
-from django.test import TestCase
+import smtplib
+import time
+from datetime import timedelta
+from importlib import import_module
+from unittest import mock
 
-# Create your tests here.
+from django.apps import apps as django_apps
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core import mail
+from django.db import IntegrityError, connection
+from django.http import HttpResponse
+from django.test import RequestFactory, SimpleTestCase, TestCase
+from django.utils import timezone
+from rest_framework_simplejwt.exceptions import TokenError
+from rest_framework_simplejwt.token_blacklist.models import (
+    BlacklistedToken,
+    OutstandingToken,
+)
+from rest_framework_simplejwt.tokens import AccessToken
+
+from accounts import blacklist, tasks, tokens
+from accounts.middleware import JWTRefreshMiddleware
+from accounts.tokens import RefreshToken, verify_access_token
+from accounts.usernames import allocate_usernames, highest_suffix, save_with_username
+from core.routers import REPLICA, ReadReplicaRouter, replica_reads
+
+
+class FakeRedis:
+    """The few Redis commands accounts.blacklist uses, in memory."""
+
+    def __init__(self):
+        self.values = {}
+        self.sorted_sets = {}
+
+    def pipeline(self):
+        return self
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+    def execute(self):
+        return []
+
+    def set(self, key, value, ex=None):
+        self.values[key] = value
+
+    def exists(self, key):
+        return int(key in self.values)
+
+    def zadd(self, key, mapping):
+        self.sorted_sets.setdefault(key, {}).update(mapping)
+
+    def zrangebyscore(self, key, low, high):
+        low, high = float(low), float(high)
+        members = self.sorted_sets.get(key, {})
+        return [m.encode() for m, score in members.items() if low <= score <= high]
+
+    def zremrangebyscore(self, key, low, high):
+        members = self.sorted_sets.get(key, {})
+        removed = self.zrangebyscore(key, low, high)
+        for member in removed:
+            del members[member.decode()]
+        return len(removed)
+
+
+class BlacklistTestMixin:
+    """A fresh in-memory blacklist and verified-token cache per test."""
+
+    def setUp(self):
+        super().setUp()
+        self.redis = FakeRedis()
+        for target, value in (
+            ("accounts.blacklist.get_client", mock.Mock(return_value=self.redis)),
+            ("accounts.blacklist._filter", blacklist.BlacklistFilter()),
+            ("accounts.tokens._cache", None),
+        ):
+            patcher = mock.patch(target, value)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+
+class VerifiedTokenCacheTests(BlacklistTestMixin, SimpleTestCase):
+    def setUp(self):
+        super().setUp()
+        self.token = AccessToken()
+        self.token["user_id"] = "7"
+        self.raw_token = str(self.token)
+
+    def test_cache_hit_skips_verification(self):
+        with mock.patch("accounts.tokens.AccessToken", wraps=AccessToken) as verify:
+            first = verify_access_token(self.raw_token)
+            second = verify_access_token(self.raw_token)
+        verify.assert_called_once_with(self.raw_token)
+        self.assertIs(first, second)
+        self.assertEqual(second["user_id"], "7")
+
+    def test_entry_expires_with_the_token(self):
+        verify_access_token(self.raw_token)
+        key = tokens._token_key(self.raw_token)
+        with mock.patch("time.time", return_value=self.token["exp"] + 1):
+            self.assertIsNone(tokens.get_cache().get(key))
+
+    def test_cache_hit_after_blacklisting_is_refused(self):
+        verify_access_token(self.raw_token)
+        tokens.revoke_access_token(self.token)
+        with self.assertRaises(TokenError):
+            verify_access_token(self.raw_token)
+
+    def test_blacklist_outage_lets_access_tokens_through(self):
+        verify_access_token(self.raw_token)
+        self.redis.exists = mock.Mock(side_effect=blacklist.redis.RedisError)
+        tokens.revoke_access_token(self.token)
+        with self.assertLogs("accounts.blacklist", "WARNING"):
+            self.assertEqual(verify_access_token(self.raw_token)["user_id"], "7")
+
+
+class LogoutTests(BlacklistTestMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        user = get_user_model().objects.create_user(
+            username="ada", email="ada@example.com", password="pw"
+        )
+        self.refresh = RefreshToken.for_user(user)
+        self.access = self.refresh.access_token
+        self.client.cookies[settings.SIMPLE_JWT["AUTH_COOKIE"]] = str(self.access)
+        self.client.cookies[settings.SIMPLE_JWT["AUTH_COOKIE_REFRESH"]] = str(
+            self.refresh
+        )
+
+    def refresh_with(self, refresh_token):
+        request = RequestFactory().get("/api/v1/editor/languages")
+        request.COOKIES[settings.SIMPLE_JWT["AUTH_COOKIE_REFRESH"]] = refresh_token
+        middleware = JWTRefreshMiddleware(lambda request: HttpResponse())
+        middleware.process_request(request)
+        return getattr(request, "new_access_token", None)
+
+    def test_refresh_caches_the_new_access_token(self):
+        new_access_token = self.refresh_with(str(self.refresh))
+        self.assertIsNotNone(new_access_token)
+        with mock.patch("accounts.tokens.AccessToken") as verify:
+            verify_access_token(new_access_token)
+        verify.assert_not_called()
+
+    def test_logout_revokes_both_tokens(self):
+        verify_access_token(str(self.access))  # cached as verified
+        response = self.client.post("/api/v1/auth/logout")
+        self.assertEqual(response.status_code, 200)
+        with self.assertRaises(TokenError):
+            RefreshToken(str(self.refresh))
+        with self.assertRaises(TokenError):
+            verify_access_token(str(self.access))
+        # the refresh cookie can no longer mint an access token either
+        self.assertIsNone(self.refresh_with(str(self.refresh)))
+        response = self.client.post("/api/v1/auth/logout")
+        self.assertEqual(response.status_code, 401)
+
+
+class BlacklistTests(BlacklistTestMixin, TestCase):
+    def test_unseen_jti_needs_no_redis_lookup(self):
+        with mock.patch.object(self.redis, "exists") as exists:
+            self.assertFalse(blacklist.is_blacklisted("never-seen"))
+        exists.assert_not_called()
+
+    def test_false_positive_falls_through_to_redis(self):
+        blacklist.blacklist_jti("revoked", time.time() + 60)
+        exists = mock.Mock(wraps=self.redis.exists)
+        with mock.patch.object(
+            blacklist.BloomFilter, "__contains__", return_value=True
+        ), mock.patch.object(self.redis, "exists", exists):
+            self.assertFalse(blacklist.is_blacklisted("not-revoked"))
+            self.assertTrue(blacklist.is_blacklisted("revoked"))
+        self.assertEqual(exists.call_count, 2)
+
+    def test_sync_backs_off_while_redis_is_down(self):
+        zrangebyscore = mock.Mock(side_effect=blacklist.redis.ConnectionError)
+        with mock.patch.object(self.redis, "zrangebyscore", zrangebyscore):
+            with self.assertLogs("accounts.blacklist", "WARNING"):
+                self.assertTrue(blacklist.is_blacklisted("any"))
+            # within the backoff: answered without trying Redis again
+            with self.assertLogs("accounts.blacklist", "WARNING"):
+                self.assertFalse(blacklist.is_blacklisted("any", False))
+            self.assertEqual(zrangebyscore.call_count, 1)
+            with mock.patch("time.time", return_value=time.time() + 5):
+                with self.assertLogs("accounts.blacklist", "WARNING"):
+                    blacklist.is_blacklisted("any")
+            self.assertEqual(zrangebyscore.call_count, 2)
+        with mock.patch("time.time", return_value=time.time() + 60):
+            self.assertFalse(blacklist.is_blacklisted("any"))
+        self.assertEqual(blacklist._filter.failures, 0)
+
+    def test_migration_copies_database_rows(self):
+        user = get_user_model().objects.create_user(
+            username="ada", email="ada@example.com", password="pw"
+        )
+        now = timezone.now()
+        for jti, expires_at in (
+            ("live", now + timedelta(hours=1)),
+            ("expired", now - timedelta(hours=1)),
+        ):
+            token = OutstandingToken.objects.create(
+                user=user, jti=jti, token=jti, expires_at=expires_at
+            )
+            BlacklistedToken.objects.create(token=token)
+        migration = import_module(
+            "accounts.migrations.0002_copy_token_blacklist_to_redis"
+        )
+        migration.copy_token_blacklist_to_redis(django_apps, connection.schema_editor())
+        self.assertTrue(blacklist.is_blacklisted("live"))
+        self.assertFalse(blacklist.is_blacklisted("expired"))
+
+
+class UsernameTests(TestCase):
+    def create(self, username):
+        return get_user_model().objects.create_user(
+            username=username, email=f"{username}@example.com"
+        )
+
+    def test_next_suffix_follows_the_highest_numeric_one(self):
+        self.assertEqual(allocate_usernames("bob"), ["bob"])
+        for username in ("bob", "bob_2", "bob_10", "bob_x", "bob_2a", "bobby_30"):
+            self.create(username)
+        self.assertEqual(highest_suffix("bob"), 10)
+        self.assertEqual(allocate_usernames("bob", 2), ["bob_11", "bob_12"])
+
+    def test_suffixes_beyond_integer_range(self):
+        self.create("bob_99999999999")
+        # too long to be one of ours; would overflow the cast
+        self.create("bob_" + "9" * 30)
+        self.assertEqual(highest_suffix("bob"), 99999999999)
+
+    def test_taken_name_is_allocated_again(self):
+        self.create("ann")
+        self.create("ann_1")
+
+        def save(username):
+            return get_user_model().objects.create_user(
+                username=username, email="new@example.com"
+            )
+
+        # another sign-up took ann_1 after the suffix was read
+        with mock.patch(
+            "accounts.usernames.highest_suffix", side_effect=[0, 1]
+        ) as highest:
+            user = save_with_username("ann", save)
+        self.assertEqual(user.username, "ann_2")
+        self.assertEqual(highest.call_count, 2)
+
+    def test_other_integrity_errors_are_raised(self):
+        save = mock.Mock(side_effect=IntegrityError("duplicate email"))
+        with self.assertRaises(IntegrityError):
+            save_with_username("ann", save)
+        save.assert_called_once_with("ann")
+
+
+class ReadReplicaRouterTests(SimpleTestCase):
+    def setUp(self):
+        self.router = ReadReplicaRouter()
+        self.user_model = get_user_model()
+        patcher = mock.patch.object(
+            settings, "DATABASES", {**settings.DATABASES, REPLICA: {}}
+        )
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_reads_use_the_replica_only_when_asked(self):
+        self.assertIsNone(self.router.db_for_read(self.user_model))
+        with replica_reads():
+            self.assertEqual(self.router.db_for_read(self.user_model), REPLICA)
+            self.assertEqual(self.router.db_for_write(self.user_model), "default")
+        self.assertIsNone(self.router.db_for_read(self.user_model))
+
+    def test_reads_fall_back_without_a_replica(self):
+        del settings.DATABASES[REPLICA]
+        with replica_reads():
+            self.assertIsNone(self.router.db_for_read(self.user_model))
+
+    def test_replica_is_never_migrated(self):
+        self.assertFalse(self.router.allow_migrate(REPLICA, "accounts"))
+        self.assertTrue(self.router.allow_migrate("default", "accounts"))
+
+
+class PasswordResetEmailTests(TestCase):
+    def setUp(self):
+        self.user = get_user_model().objects.create_user(
+            username="ada", email="ada@example.com", password="pw"
+        )
+        patcher = mock.patch("accounts.tasks._connection", None)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.addCleanup(tasks._close_connection)
+
+    def test_failed_send_is_retried(self):
+        send_email = mock.Mock(side_effect=[smtplib.SMTPException, None])
+        with mock.patch("accounts.tasks.send_email", send_email):
+            result = tasks.send_password_reset_email.apply((self.user.pk,))
+        self.assertTrue(result.successful())
+        self.assertEqual(send_email.call_count, 2)
+
+    def test_retries_give_up_after_max_retries(self):
+        send_email = mock.Mock(side_effect=OSError("connection refused"))
+        with mock.patch("accounts.tasks.send_email", send_email):
+            result = tasks.send_password_reset_email.apply((self.user.pk,))
+        self.assertTrue(result.failed())
+        self.assertEqual(send_email.call_count, tasks.email_setting("MAX_RETRIES") + 1)
+
+    def test_dropped_connection_is_reopened_once(self):
+        tasks.send_password_reset_email.apply((self.user.pk,))
+        with mock.patch.object(
+            tasks._connection,
+            "send_messages",
+            side_effect=smtplib.SMTPServerDisconnected,
+        ):
+            tasks.send_password_reset_email.apply((self.user.pk,))
+        self.assertEqual([m.to for m in mail.outbox], [["ada@example.com"]] * 2)
+
+    def test_deleted_user_gets_no_email(self):
+        user_id = self.user.pk
+        self.user.delete()
+        self.assertTrue(tasks.send_password_reset_email.apply((user_id,)).successful())
+        self.assertEqual(mail.outbox, [])
@@ -0,0 +1,129 @@
+# accounts/tokens.py
+"""
+Verified access tokens, shared by JWTRefreshMiddleware and
+CustomJWTAuthentication.
+
+A token is verified (signature, expiry, type) once. The result is kept in a
+bounded in-process LRU keyed by the token's hash until the token's own
+`exp`, so the next request carrying the same cookie skips verification.
+Logging out blacklists the access token as well as the refresh token, and
+the blacklist is checked on every request, cached or not; for a jti the
+bloom filter has never seen that costs no network call.
+
+RefreshToken replaces SimpleJWT's: its blacklist lives in Redis behind a
+bloom filter (accounts.blacklist) instead of the token_blacklist tables.
+"""
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+from django.utils.translation import gettext_lazy as _
+from rest_framework_simplejwt import tokens as simplejwt_tokens
+from rest_framework_simplejwt.exceptions import TokenError
+from rest_framework_simplejwt.settings import api_settings
+from rest_framework_simplejwt.tokens import AccessToken, Token
+
+from .blacklist import blacklist_jti, is_blacklisted
+
+TOKEN_CACHE_DEFAULTS = {
+    "MAX_ENTRIES": 10000,  # verified tokens kept per process
+}
+
+# Paths JWTRefreshMiddleware leaves alone: nothing there reads the JWT cookies
+SKIP_PATHS_DEFAULT = ("/static/", "/media/", "/admin/", "/swagger", "/redoc")
+
+
+def token_cache_setting(name):
+    return getattr(settings, "JWT_TOKEN_CACHE", {}).get(
+        name, TOKEN_CACHE_DEFAULTS[name]
+    )
+
+
+def skip_paths():
+    return tuple(getattr(settings, "JWT_MIDDLEWARE_SKIP_PATHS", SKIP_PATHS_DEFAULT))
+
+
+class VerifiedTokenCache:
+    def __init__(self, max_entries):
+        self.max_entries = max_entries
+        self.entries = OrderedDict()  # token hash -> (token, exp)
+        self.lock = threading.Lock()
+
+    def get(self, key):
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                return None
+            token, exp = entry
+            if exp <= time.time():
+                del self.entries[key]
+                return None
+            self.entries.move_to_end(key)
+            return token
+
+    def put(self, key, token, exp):
+        with self.lock:
+            self.entries[key] = (token, exp)
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_cache():
+    global _cache
+    with _cache_lock:
+        if _cache is None:
+            _cache = VerifiedTokenCache(token_cache_setting("MAX_ENTRIES"))
+        return _cache
+
+
+def _token_key(raw_token):
+    if isinstance(raw_token, str):
+        raw_token = raw_token.encode()
+    return hashlib.sha256(raw_token).hexdigest()
+
+
+def remember_access_token(raw_token, token):
+    get_cache().put(_token_key(raw_token), token, token["exp"])
+
+
+def verify_access_token(raw_token):
+    """The validated AccessToken for `raw_token`; raises TokenError if invalid."""
+    token = get_cache().get(_token_key(raw_token))
+    if token is None:
+        token = AccessToken(raw_token)
+        remember_access_token(raw_token, token)
+    # short-lived, so let through rather than log everyone out if Redis is down
+    if is_blacklisted(token[api_settings.JTI_CLAIM], when_unavailable=False):
+        raise TokenError(_("Token is blacklisted"))
+    return token
+
+
+def revoke_access_token(token):
+    blacklist_jti(token[api_settings.JTI_CLAIM], token["exp"])
+
+
+class RefreshToken(simplejwt_tokens.RefreshToken):
+    """SimpleJWT's RefreshToken, with the blacklist in Redis instead of the DB."""
+
+    def check_blacklist(self):
+        if is_blacklisted(self.payload[api_settings.JTI_CLAIM]):
+            raise TokenError(_("Token is blacklisted"))
+
+    def blacklist(self):
+        blacklist_jti(self.payload[api_settings.JTI_CLAIM], self.payload["exp"])
+
+    def outstand(self):
+        # no OutstandingToken rows: the Redis entry is all a logout needs
+        return None
+
+    @classmethod
+    def for_user(cls, user):
+        # skips BlacklistMixin.for_user, which writes an OutstandingToken row
+        return Token.for_user.__func__(cls, user)
@@ -0,0 +1,75 @@
+# accounts/usernames.py
+"""
+Usernames derived from full names: "John Smith" becomes `john_smith`, then
+`john_smith_1`, `john_smith_2`, ... once taken.
+
+The next free name comes from one query: the highest suffix in use for the
+base, found with a prefix scan over the username index. Two sign-ups can
+still pick the same name at once; the unique constraint rejects the second,
+which allocates again.
+"""
+import re
+
+from django.contrib.auth import get_user_model
+from django.db import IntegrityError, transaction
+from django.db.models import BigIntegerField, Case, Max, Q, Value, When
+from django.db.models.functions import Cast, Substr
+from django.utils.text import slugify
+
+User = get_user_model()
+
+MAX_ATTEMPTS = 5  # allocations tried before a conflict is raised
+# digits of a suffix that counts; longer ones would overflow a bigint
+MAX_SUFFIX_DIGITS = 18
+
+
+def base_username(full_name):
+    return slugify((full_name or "").replace(" ", "_"))
+
+
+def matches_base(username, base):
+    """Whether `username` is `base` or `base` with a numeric suffix."""
+    return bool(username and re.fullmatch(rf"{re.escape(base)}(_[0-9]+)?", username))
+
+
+def highest_suffix(base, exclude_pk=None):
+    """The highest suffix taken for `base`: 0 for the bare name, None if free."""
+    # a slug is [a-z0-9_-], nothing a regex would read as special
+    suffixed = rf"^{base}_[0-9]{{1,{MAX_SUFFIX_DIGITS}}}$"
+    users = User.objects.filter(
+        Q(username=base)
+        | Q(username__startswith=f"{base}_", username__regex=suffixed)
+    )
+    if exclude_pk is not None:
+        users = users.exclude(pk=exclude_pk)
+    suffix = Case(
+        When(username=base, then=Value(0)),
+        default=Cast(Substr("username", len(base) + 2), BigIntegerField()),
+        output_field=BigIntegerField(),
+    )
+    return users.aggregate(suffix=Max(suffix))["suffix"]
+
+
+def allocate_usernames(base, count=1, exclude_pk=None):
+    """`count` consecutive free usernames for `base`."""
+    highest = highest_suffix(base, exclude_pk)
+    start = 0 if highest is None else highest + 1
+    return [base if n == 0 else f"{base}_{n}" for n in range(start, start + count)]
+
+
+def save_with_username(base, save, exclude_pk=None):
+    """
+    Call `save(username)` with the next free username for `base`, in a
+    transaction, allocating again if another user took the name meanwhile.
+    """
+    for attempt in range(MAX_ATTEMPTS):
+        (username,) = allocate_usernames(base, exclude_pk=exclude_pk)
+        try:
+            with transaction.atomic():
+                return save(username)
+        except IntegrityError:
+            taken = User.objects.filter(username=username)
+            if exclude_pk is not None:
+                taken = taken.exclude(pk=exclude_pk)
+            if attempt == MAX_ATTEMPTS - 1 or not taken.exists():
+                raise  # out of attempts, or another constraint (e.g. email)
@@ -2,19 +2,20 @@ from rest_framework import status
 from rest_framework.response import Response
 from rest_framework.views import APIView
 from rest_framework_simplejwt.views import TokenObtainPairView
-from rest_framework_simplejwt.tokens import RefreshToken
 from rest_framework.permissions import IsAuthenticated
 from django.contrib.auth.tokens import default_token_generator
 from django.conf import settings
-from django.core.mail import EmailMessage, get_connection
-from django.template.loader import render_to_string
 from .serializers import (
     UserSerializer,
     PasswordResetSerializer,
     PasswordResetConfirmSerializer,
+    TokenObtainPairSerializer,
 )
+from .tasks import send_password_reset_email
+from .tokens import RefreshToken, revoke_access_token
 from django.contrib.auth import get_user_model
 from django.contrib.auth.hashers import check_password
+from core.routers import replica_reads
 
 User = get_user_model()
 
@@ -42,6 +43,9 @@ class LogoutView(APIView):
             if refresh_token:
                 token = RefreshToken(refresh_token)
                 token.blacklist()
+            # still valid until its exp, and cached as verified until then
+            if request.auth is not None:
+                revoke_access_token(request.auth)
             response = Response(
                 {"message": "Logout successful"}, status=status.HTTP_200_OK
             )
@@ -76,37 +80,11 @@ class PasswordResetView(APIView):
         if serializer.is_valid():
             email = serializer.validated_data["email"]
             try:
-                user = User.objects.get(email=email)
-                token = default_token_generator.make_token(user)
-                context = {
-                    "user": user,
-                    "reset_url": f"https://yourfrontend.com/reset-password?token={token}?email={email}",
-                    "valid_hours": 24,
-                }
-                html_message = render_to_string(
-                    "accounts/password_reset_email.html", context
-                )
-                plain_message = html_message
-                subject = "Reset Your Password"
-                recipient_list = [email]
-                from_email = settings.DEFAULT_FROM_EMAIL
+                with replica_reads():
+                    user = User.objects.get(email=email)
                 try:
-                    with get_connection(
-                        host=settings.MAILERSEND_SMTP_HOST,
-                        port=settings.MAILERSEND_SMTP_PORT,
-                        username=settings.MAILERSEND_SMTP_USERNAME,
-                        password=settings.MAILERSEND_API_KEY,
-                        use_tls=True,
-                    ) as connection:
-                        email = EmailMessage(
-                            subject=subject,
-                            body=plain_message,
-                            to=recipient_list,
-                            from_email=from_email,
-                            connection=connection,
-                        )
-                        email.content_subtype = "html"
-                        email.send()
+                    # delivered by a worker on the email queue (accounts.tasks)
+                    send_password_reset_email.delay(user.pk)
                     return Response(
                         {"message": "Password reset email sent"},
                         status=status.HTTP_200_OK,
@@ -148,8 +126,12 @@ class PasswordResetConfirmView(APIView):
 
 
 class CustomTokenObtainPairView(TokenObtainPairView):
+    serializer_class = TokenObtainPairSerializer
+
     def post(self, request, *args, **kwargs):
-        response = super().post(request, *args, **kwargs)
+        # the credential lookup may hit the replica; last_login goes to the primary
+        with replica_reads():
+            response = super().post(request, *args, **kwargs)
         if response.status_code == 200:
             tokens = response.data
             response = Response({"message": "Login successful"})
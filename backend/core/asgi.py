@@ -2,6 +2,8 @@
 ASGI config for core project.
 
 It exposes the ASGI callable as a module-level variable named ``application``.
+WebSocket and ``/stream/`` requests are handled by the streaming execution
+consumers in ``editor.consumers``; everything else goes to Django.
 
 For more information on this file, see
 https://docs.djangoproject.com/en/5.1/howto/deployment/asgi/
@@ -13,4 +15,13 @@ from django.core.asgi import get_asgi_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'core.settings')
 
-application = get_asgi_application()
+django_application = get_asgi_application()
+
+# imported after Django is set up, since the consumers read settings
+from editor.consumers import is_stream_request, stream_application  # noqa: E402
+
+
+async def application(scope, receive, send):
+    if is_stream_request(scope):
+        return await stream_application(scope, receive, send)
+    return await django_application(scope, receive, send)
@@ -7,5 +7,8 @@ app = Celery("core")
 app.config_from_object("django.conf:settings", namespace="CELERY")
 app.autodiscover_tasks()
 
+# propagates trace context through task headers, in web and worker processes
+from . import tracing  # noqa: E402,F401
+
 # celery -A core worker -l INFO
 # celery -A core worker -l INFO -P solo
@@ -0,0 +1,321 @@
+# core/tracing.py
+"""
+Request tracing across the web tier, the broker and the workers.
+
+A trace starts in TracingMiddleware (or in a worker, for a task published
+outside a request). Code marks its phases with `span(...)`, or `traced(...)`
+on a method, and spans nest through a context variable, so nothing is passed
+around. Publishing a task adds a W3C `traceparent` header to the message, and
+the worker continues the same trace: its task span hangs off the publish
+span, with the time the message sat in the queue as a span of its own.
+
+Finished traces go to the exporter named in TRACING["EXPORTER"], a dotted
+path to a class with `export(spans)`; ConsoleExporter and FileExporter
+(JSON lines) work offline. With TIMING_HEADER on, responses carry an
+`X-Timing` header summing the request's phases, e.g.
+`total;dur=41.2, auth.jwt_refresh;dur=0.3, view.execute;dur=12.8`.
+"""
+import contextvars
+import json
+import logging
+import random
+import secrets
+import sys
+import threading
+import time
+from contextlib import ExitStack, contextmanager
+from functools import wraps
+
+from celery.signals import (
+    after_task_publish,
+    before_task_publish,
+    task_postrun,
+    task_prerun,
+)
+from django.conf import settings
+from django.utils.module_loading import import_string
+
+logger = logging.getLogger(__name__)
+
+TRACING_DEFAULTS = {
+    "ENABLED": False,
+    "SAMPLE_RATE": 1.0,  # share of requests traced
+    "EXPORTER": "core.tracing.ConsoleExporter",
+    "EXPORTER_OPTIONS": {},  # keyword arguments for the exporter
+    "TIMING_HEADER": False,  # add X-Timing to traced responses
+}
+
+TIMING_HEADER = "X-Timing"
+TRACEPARENT = "traceparent"
+
+_current = contextvars.ContextVar("tracing_span", default=None)
+_publishing = contextvars.ContextVar("tracing_publish", default=None)
+
+
+def tracing_setting(name):
+    return getattr(settings, "TRACING", {}).get(name, TRACING_DEFAULTS[name])
+
+
+class Trace:
+    def __init__(self, trace_id=None):
+        self.trace_id = trace_id or secrets.token_hex(16)
+        self.spans = []
+
+
+class Span:
+    def __init__(self, name, trace, parent_id=None, attributes=None, start=None):
+        self.name = name
+        self.trace = trace
+        self.span_id = secrets.token_hex(8)
+        self.parent_id = parent_id
+        self.attributes = dict(attributes or {})
+        # wall clock for exporters, monotonic for the duration
+        self.start = time.time() if start is None else start
+        self._started = time.monotonic()
+        self.duration_ms = None
+
+    def finish(self, end=None):
+        """End the span now, or at wall-clock time `end`."""
+        if end is None:
+            elapsed = time.monotonic() - self._started
+        else:
+            elapsed = end - self.start
+        self.duration_ms = round(max(elapsed, 0.0) * 1000, 3)
+        self.trace.spans.append(self)
+
+    @property
+    def traceparent(self):
+        return f"00-{self.trace.trace_id}-{self.span_id}-01"
+
+    def as_dict(self):
+        return {
+            "trace_id": self.trace.trace_id,
+            "span_id": self.span_id,
+            "parent_id": self.parent_id,
+            "name": self.name,
+            "start": self.start,
+            "duration_ms": self.duration_ms,
+            "attributes": self.attributes,
+        }
+
+
+def parse_traceparent(value):
+    """(trace_id, parent span id) from a traceparent header, or None."""
+    parts = (value or "").split("-")
+    if len(parts) != 4 or len(parts[1]) != 32 or len(parts[2]) != 16:
+        return None
+    return parts[1], parts[2]
+
+
+def current_span():
+    return _current.get()
+
+
+@contextmanager
+def start_trace(name, parent=None, **attributes):
+    """
+    Open the root span of a trace, exported when the block ends.
+
+    `parent` is a (trace_id, span_id) pair to continue a remote trace.
+    Yields None when tracing is off or the trace is not sampled.
+    """
+    if not tracing_setting("ENABLED") or (
+        parent is None and random.random() >= tracing_setting("SAMPLE_RATE")
+    ):
+        yield None
+        return
+    trace_id, parent_id = parent or (None, None)
+    root = Span(name, Trace(trace_id), parent_id, attributes)
+    token = _current.set(root)
+    try:
+        yield root
+    finally:
+        _current.reset(token)
+        root.finish()
+        export(root.trace.spans)
+
+
+@contextmanager
+def span(name, **attributes):
+    """Time a phase of the current trace; a no-op outside one."""
+    parent = _current.get()
+    if parent is None:
+        yield None
+        return
+    child = Span(name, parent.trace, parent.span_id, attributes)
+    token = _current.set(child)
+    try:
+        yield child
+    except BaseException as e:
+        child.attributes["error"] = type(e).__name__
+        raise
+    finally:
+        _current.reset(token)
+        child.finish()
+
+
+def traced(name):
+    """Decorator running a function (e.g. a view method) in a span."""
+
+    def decorator(func):
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            with span(name):
+                return func(*args, **kwargs)
+
+        return wrapper
+
+    return decorator
+
+
+# -- exporters ----------------------------------------------------------------
+
+
+class ConsoleExporter:
+    """One JSON object per span on stderr."""
+
+    def __init__(self, stream=None):
+        self.stream = stream or sys.stderr
+        self.lock = threading.Lock()
+
+    def export(self, spans):
+        lines = "".join(json.dumps(s.as_dict()) + "\n" for s in spans)
+        with self.lock:
+            self.stream.write(lines)
+            self.stream.flush()
+
+
+class FileExporter:
+    """Appends one JSON object per span to `path`."""
+
+    def __init__(self, path="traces.jsonl"):
+        self.path = path
+        self.lock = threading.Lock()
+
+    def export(self, spans):
+        lines = "".join(json.dumps(s.as_dict()) + "\n" for s in spans)
+        # a single append per trace keeps processes sharing the file apart
+        with self.lock, open(self.path, "a") as f:
+            f.write(lines)
+
+
+_exporter = None
+_exporter_lock = threading.Lock()
+
+
+def get_exporter():
+    global _exporter
+    with _exporter_lock:
+        if _exporter is None:
+            exporter_class = import_string(tracing_setting("EXPORTER"))
+            _exporter = exporter_class(**tracing_setting("EXPORTER_OPTIONS"))
+        return _exporter
+
+
+def export(spans):
+    try:
+        get_exporter().export(spans)
+    except Exception as e:
+        # tracing must never fail a request or a task
+        logger.warning("Could not export trace: %s", e)
+
+
+def timing_summary(root):
+    """X-Timing value: the total, then the time spent per phase."""
+    phases = {}
+    for s in root.trace.spans:
+        if s is not root and s.duration_ms is not None:
+            phases[s.name] = phases.get(s.name, 0.0) + s.duration_ms
+    parts = [f"total;dur={root.duration_ms:.1f}"]
+    parts += [f"{name};dur={ms:.1f}" for name, ms in phases.items()]
+    return ", ".join(parts)
+
+
+# -- web tier -----------------------------------------------------------------
+
+
+class TracingMiddleware:
+    """Root span per request; first in MIDDLEWARE so it covers the others."""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        parent = parse_traceparent(request.META.get("HTTP_TRACEPARENT"))
+        with start_trace(
+            "http.request", parent, method=request.method, path=request.path
+        ) as root:
+            response = self.get_response(request)
+            if root is not None:
+                root.attributes["status"] = response.status_code
+        if root is not None and tracing_setting("TIMING_HEADER"):
+            response[TIMING_HEADER] = timing_summary(root)
+        return response
+
+
+# -- Celery -------------------------------------------------------------------
+
+
+def _header(request, name):
+    value = getattr(request, name, None)
+    if value is None:
+        value = (getattr(request, "headers", None) or {}).get(name)
+    return value
+
+
+@before_task_publish.connect
+def inject_trace_context(sender=None, headers=None, routing_key=None, **kwargs):
+    parent = _current.get()
+    if parent is None or headers is None:
+        return
+    publish = Span(
+        "celery.publish",
+        parent.trace,
+        parent.span_id,
+        {"task": sender, "queue": routing_key},
+    )
+    _publishing.set(publish)
+    headers[TRACEPARENT] = publish.traceparent
+
+
+@after_task_publish.connect
+def finish_publish_span(**kwargs):
+    publish = _publishing.get()
+    if publish is not None:
+        _publishing.set(None)
+        publish.finish()
+
+
+# task id -> the open trace of a running task (prerun and postrun share a thread)
+_task_traces = {}
+
+
+@task_prerun.connect
+def start_task_trace(task_id=None, task=None, **kwargs):
+    if task is None or not tracing_setting("ENABLED"):
+        return
+    stack = ExitStack()
+    root = stack.enter_context(
+        start_trace(
+            "celery.task",
+            parse_traceparent(_header(task.request, TRACEPARENT)),
+            task=task.name,
+            task_id=task_id,
+        )
+    )
+    if root is None:
+        stack.close()
+        return
+    enqueued_at = _header(task.request, "enqueued_at")
+    if enqueued_at is not None:
+        wait = Span("queue.wait", root.trace, root.parent_id, start=float(enqueued_at))
+        wait.finish(end=root.start)
+    _task_traces[task_id] = (stack, root)
+
+
+@task_postrun.connect
+def finish_task_trace(task_id=None, state=None, **kwargs):
+    stack, root = _task_traces.pop(task_id, (None, None))
+    if stack is not None:
+        root.attributes["state"] = state
+        stack.close()
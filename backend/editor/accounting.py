@@ -0,0 +1,98 @@
+# editor/accounting.py
+"""
+Per-execution resource accounting.
+
+The delivery wrapper reads the container's cgroup v2 counters (cpu.stat and
+memory.events) right before and after the program runs, plus memory.peak,
+and appends them to stderr behind a per-run marker which the worker strips
+off again. Reading them from inside the container works the same for
+one-off and pooled containers, wherever the Docker daemon runs. On hosts
+still on cgroup v1 the files are missing and those fields come back as None.
+"""
+import json
+import logging
+import uuid
+
+logger = logging.getLogger(__name__)
+
+CGROUP_COUNTERS = "/sys/fs/cgroup/cpu.stat /sys/fs/cgroup/memory.events"
+CGROUP_PEAK = "/sys/fs/cgroup/memory.peak"
+
+
+def new_marker():
+    return f"__editor_usage_{uuid.uuid4().hex}__"
+
+
+def wrap_with_accounting(command, marker):
+    """Shell snippet running `command` between two cgroup readings."""
+    return (
+        f'before=$(cat {CGROUP_COUNTERS} 2>/dev/null | tr "\\n" " "); '
+        f"{command}; rc=$?; "
+        f'after=$(cat {CGROUP_COUNTERS} 2>/dev/null | tr "\\n" " "); '
+        f"peak=$(cat {CGROUP_PEAK} 2>/dev/null); "
+        f'printf "\\n{marker} before %s after %s peak %s\\n" "$before" "$after" "$peak" >&2; '
+        "exit $rc"
+    )
+
+
+def _counters(text):
+    tokens = text.split()
+    counters = {}
+    for name, value in zip(tokens[::2], tokens[1::2]):
+        if value.isdigit():
+            counters[name] = int(value)
+    return counters
+
+
+def _delta(before, after, name):
+    if name in before and name in after:
+        return after[name] - before[name]
+    return None
+
+
+def split_usage(stderr, marker):
+    """Strip the usage line off raw stderr; returns (stderr, usage dict)."""
+    token = ("\n" + marker).encode()
+    index = stderr.rfind(token)
+    if index == -1:
+        # killed before the wrapper could report (timeout, OOM of the shell)
+        return stderr, {}
+    line = stderr[index + len(token) :].decode(errors="replace")
+    before_text, _, rest = line.partition(" after ")
+    after_text, _, peak = rest.partition(" peak ")
+    before = _counters(before_text.replace("before", "", 1))
+    after = _counters(after_text)
+    cpu_usec = _delta(before, after, "usage_usec")
+    peak = peak.strip()
+    return stderr[:index], {
+        "cpu_time_ms": round(cpu_usec / 1000, 1) if cpu_usec is not None else None,
+        # for pooled containers this is the container's high-water mark
+        "peak_memory_bytes": int(peak) if peak.isdigit() else None,
+        "oom_kills": _delta(before, after, "oom_kill"),
+    }
+
+
+def build_metrics(timings, usage, stdout_bytes=0, stderr_bytes=0):
+    """`stdout_bytes` and `stderr_bytes` count all output, not just what was kept."""
+    oom_kills = usage.get("oom_kills")
+    return {
+        "queue_wait_ms": timings.get("queue_wait_ms"),
+        "compile_ms": timings.get("compile_ms"),
+        "container_start_ms": timings.get("container_start_ms"),
+        "run_wall_ms": timings.get("run_wall_ms"),
+        "cpu_time_ms": usage.get("cpu_time_ms"),
+        "peak_memory_bytes": usage.get("peak_memory_bytes"),
+        "stdout_bytes": stdout_bytes,
+        "stderr_bytes": stderr_bytes,
+        "oom_killed": bool(timings.get("oom_killed") or oom_kills),
+        "warm_container": timings.get("warm_container", False),
+    }
+
+
+def log_metrics(language, status, metrics):
+    # one JSON object per line so log shippers can index the fields
+    logger.info(
+        json.dumps(
+            {"event": "execution", "language": language, "status": status, **metrics}
+        )
+    )
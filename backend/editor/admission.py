@@ -0,0 +1,261 @@
+# editor/admission.py
+"""
+Admission control and fair share for executions.
+
+Two checks run before anything is queued:
+
+  rate         a token bucket per user and one per client address, kept in
+               Redis so every web process shares them (ExecutionThrottle)
+  concurrency  at most MAX_CONCURRENT queued or running executions per
+               user, tracked as a sorted set of task ids (reserve_slot)
+
+Either one answers 429 with a Retry-After hint.
+
+Fair share rides on the broker's message priorities. An execution is
+published with the number of executions its user already has in flight as
+its priority, so under contention every user's first run is taken before
+anyone's second, and so on. Runs interleave across users instead of going
+strictly FIFO, and one user pressing Run in a loop only queues behind
+themselves.
+
+Every execution also records who may poll, stream or cancel it: its
+subscribers, starting with the owner that submitted it.
+"""
+import logging
+import time
+import uuid
+
+from celery.signals import task_postrun, task_revoked
+from django.conf import settings
+from rest_framework.exceptions import Throttled
+from rest_framework.throttling import BaseThrottle
+
+from .cache import get_client
+
+logger = logging.getLogger(__name__)
+
+ADMISSION_DEFAULTS = {
+    "ENABLED": True,
+    "USER_RATE": 1.0,  # tokens per second, one token per execution request
+    "USER_BURST": 10,
+    "IP_RATE": 2.0,  # shared by everyone behind one address
+    "IP_BURST": 30,
+    "MAX_CONCURRENT": 4,  # queued + running executions per user
+    "SLOT_TTL": 300,  # seconds a slot is held if its release is lost
+    "CONCURRENCY_RETRY_AFTER": 2,  # seconds suggested when all slots are busy
+}
+
+# Highest broker priority used; see CELERY_BROKER_TRANSPORT_OPTIONS
+MAX_PRIORITY = 9
+
+OWNER_HEADER = "execution_owner"
+
+BUCKET_KEY = "admission:bucket:{name}"
+SLOTS_KEY = "admission:slots:{owner}"
+SUBSCRIBERS_KEY = "admission:subscribers:{task_id}"
+
+# KEYS: one bucket per key; ARGV: now, then rate and burst per key. Takes a
+# token from every bucket, or from none; returns {allowed, wait seconds}
+TAKE_TOKENS = """
+local now = tonumber(ARGV[1])
+local levels = {}
+local wait = 0
+for i, key in ipairs(KEYS) do
+  local rate = tonumber(ARGV[i * 2])
+  local burst = tonumber(ARGV[i * 2 + 1])
+  local state = redis.call("HMGET", key, "tokens", "ts")
+  local tokens = tonumber(state[1]) or burst
+  local ts = tonumber(state[2]) or now
+  tokens = math.min(burst, tokens + math.max(0, now - ts) * rate)
+  levels[i] = tokens
+  if tokens < 1 then
+    wait = math.max(wait, (1 - tokens) / rate)
+  end
+end
+local allowed = wait == 0 and 1 or 0
+for i, key in ipairs(KEYS) do
+  local rate = tonumber(ARGV[i * 2])
+  local burst = tonumber(ARGV[i * 2 + 1])
+  redis.call("HSET", key, "tokens", levels[i] - allowed, "ts", now)
+  redis.call("EXPIRE", key, math.ceil(burst / rate) + 1)
+end
+return {allowed, tostring(wait)}
+"""
+
+# KEYS[1]: the owner's slots; ARGV: now, ttl, max, task id. Returns how many
+# slots were already held, or -1 if none is free
+RESERVE_SLOT = """
+local now = tonumber(ARGV[1])
+redis.call("ZREMRANGEBYSCORE", KEYS[1], "-inf", now)
+local held = redis.call("ZCARD", KEYS[1])
+if held >= tonumber(ARGV[3]) then
+  return -1
+end
+redis.call("ZADD", KEYS[1], now + tonumber(ARGV[2]), ARGV[4])
+redis.call("EXPIRE", KEYS[1], ARGV[2])
+return held
+"""
+
+
+def admission_setting(name):
+    return getattr(settings, "EXECUTION_ADMISSION", {}).get(
+        name, ADMISSION_DEFAULTS[name]
+    )
+
+
+def client_address(request):
+    return request.META.get("REMOTE_ADDR") or "unknown"
+
+
+def execution_owner(request):
+    """Who an execution is accounted to: the user, else the client address."""
+    if request.user.is_authenticated:
+        return f"user:{request.user.pk}"
+    return f"addr:{client_address(request)}"
+
+
+class ExecutionThrottle(BaseThrottle):
+    """Token buckets per user and per client address, shared through Redis."""
+
+    def allow_request(self, request, view):
+        self.retry_after = None
+        if not admission_setting("ENABLED"):
+            return True
+        keys = [BUCKET_KEY.format(name=f"addr:{client_address(request)}")]
+        args = [time.time()]
+        args += [admission_setting("IP_RATE"), admission_setting("IP_BURST")]
+        if request.user.is_authenticated:
+            keys.append(BUCKET_KEY.format(name=f"user:{request.user.pk}"))
+            args += [admission_setting("USER_RATE"), admission_setting("USER_BURST")]
+        try:
+            allowed, wait = get_client().eval(TAKE_TOKENS, len(keys), *keys, *args)
+        except Exception as e:
+            # fail open: a Redis hiccup must not take the editor down
+            logger.warning("Admission control unavailable: %s", e)
+            return True
+        self.retry_after = float(wait)
+        return bool(allowed)
+
+    def wait(self):
+        return self.retry_after
+
+
+def reserve_slot(owner, task_id):
+    """
+    Hold one of the owner's execution slots for `task_id`.
+
+    Returns the broker priority to publish with. Raises Throttled when the
+    owner already has MAX_CONCURRENT executions queued or running.
+    """
+    if not admission_setting("ENABLED"):
+        return 0
+    try:
+        held = get_client().eval(
+            RESERVE_SLOT,
+            1,
+            SLOTS_KEY.format(owner=owner),
+            time.time(),
+            admission_setting("SLOT_TTL"),
+            admission_setting("MAX_CONCURRENT"),
+            task_id,
+        )
+    except Exception as e:
+        logger.warning("Admission control unavailable: %s", e)
+        return 0
+    if held < 0:
+        raise Throttled(
+            wait=admission_setting("CONCURRENCY_RETRY_AFTER"),
+            detail=(
+                f"At most {admission_setting('MAX_CONCURRENT')} executions can be "
+                "queued or running at once."
+            ),
+        )
+    return min(held, MAX_PRIORITY)
+
+
+def release_slot(owner, task_id):
+    try:
+        get_client().zrem(SLOTS_KEY.format(owner=owner), task_id)
+    except Exception as e:
+        # the slot expires after SLOT_TTL anyway
+        logger.warning("Could not release execution slot: %s", e)
+
+
+def add_subscriber(task_id, owner):
+    """Let `owner` read the task's output and result, and cancel it."""
+    key = SUBSCRIBERS_KEY.format(task_id=task_id)
+    with get_client().pipeline() as pipe:
+        pipe.sadd(key, owner)
+        # as long as Celery keeps the result
+        pipe.expire(key, getattr(settings, "CELERY_RESULT_EXPIRES", None) or 86400)
+        pipe.execute()
+
+
+def is_subscriber(task_id, owner):
+    key = SUBSCRIBERS_KEY.format(task_id=task_id)
+    return bool(get_client().sismember(key, owner))
+
+
+def remove_subscriber(task_id, owner):
+    """Drop `owner` from the task; returns how many subscribers are left."""
+    key = SUBSCRIBERS_KEY.format(task_id=task_id)
+    with get_client().pipeline() as pipe:
+        pipe.srem(key, owner)
+        pipe.scard(key)
+        _, left = pipe.execute()
+    return left
+
+
+def publish_execution(
+    task, args, kwargs, owner, task_id=None, priority=None, **options
+):
+    """
+    Publish `task` as an execution of `owner`'s, who may then poll, stream
+    and cancel it.
+
+    Takes one of the owner's slots unless `priority` comes from a
+    reserve_slot already made for `task_id`; raises Throttled like it. The
+    slot is given back if the broker cannot be reached.
+    """
+    if task_id is None:
+        task_id = str(uuid.uuid4())
+    if priority is None:
+        priority = reserve_slot(owner, task_id)
+    try:
+        result = task.apply_async(
+            args,
+            kwargs,
+            task_id=task_id,
+            priority=priority,
+            # tells the worker whose slot to release when the task is done
+            headers={OWNER_HEADER: owner},
+            **options,
+        )
+    except Exception:
+        release_slot(owner, task_id)
+        raise
+    # before we answer, so the owner can poll as soon as they have the id
+    add_subscriber(task_id, owner)
+    return result
+
+
+def _task_owner(request):
+    owner = getattr(request, OWNER_HEADER, None)
+    if owner is None:
+        owner = (getattr(request, "headers", None) or {}).get(OWNER_HEADER)
+    return owner
+
+
+@task_postrun.connect
+def release_finished(task_id=None, task=None, **kwargs):
+    owner = _task_owner(task.request) if task is not None else None
+    if owner is not None:
+        release_slot(owner, task_id)
+
+
+@task_revoked.connect
+def release_revoked(request=None, **kwargs):
+    # cancelled while queued or running, or expired before it started
+    owner = _task_owner(request) if request is not None else None
+    if owner is not None:
+        release_slot(owner, request.id)
@@ -4,3 +4,8 @@ from django.apps import AppConfig
 class EditorConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'editor'
+
+    def ready(self):
+        # connects the queue-wait, admission and metrics signal handlers in web
+        # and worker processes
+        from . import admission, metrics, queues  # noqa: F401
@@ -0,0 +1,46 @@
+# editor/backends.py
+"""
+Executor backends behind execute_code.
+
+A backend is a callable with the signature of editor.tasks.run_code,
+`(code, language, stdin="", queue_wait_ms=None)`, returning an
+execution_result dict. Backends are registered by name in EXECUTOR_BACKENDS
+and picked per run: a tenant mapping (by user group) wins over a language
+mapping, which wins over EXECUTOR_BACKEND.
+"""
+from django.conf import settings
+from django.utils.module_loading import import_string
+
+BACKEND_DEFAULTS = {
+    "docker": "editor.tasks.run_code",
+    "native": "editor.sandbox.run_code",
+    "fake": "editor.benchmark.fake_run_code",
+}
+
+
+def backend_paths():
+    return {**BACKEND_DEFAULTS, **getattr(settings, "EXECUTOR_BACKENDS", {})}
+
+
+def get_backend(name):
+    try:
+        return import_string(backend_paths()[name])
+    except KeyError:
+        raise ValueError(f"Unknown executor backend '{name}'")
+
+
+def select_backend(language, user=None):
+    """Name of the backend a run should use."""
+    tenants = getattr(settings, "EXECUTOR_TENANT_BACKENDS", {})
+    if tenants and user is not None and user.is_authenticated:
+        group = (
+            user.groups.filter(name__in=tenants)
+            .order_by("name")
+            .values_list("name", flat=True)
+            .first()
+        )
+        if group is not None:
+            return tenants[group]
+    return getattr(settings, "EXECUTOR_LANGUAGE_BACKENDS", {}).get(
+        language.lower(), getattr(settings, "EXECUTOR_BACKEND", "docker")
+    )
@@ -0,0 +1,204 @@
+# editor/benchmark.py
+"""
+Load/benchmark harness for code execution.
+
+Drives either the HTTP endpoint (POST /api/v1/editor/execute, then polling
+until the run is final) or the execute_code task directly, at a list of
+concurrency levels, and reports latency percentiles and throughput. Results
+are written as JSON so runs from different commits can be compared.
+
+Any executor backend can be used (editor.backends), in particular:
+
+  fake    an in-process stand-in for Docker (fake_run_code) with a fixed
+          simulated run time, for measuring the view -> Celery path alone
+  docker  the real executor; needs Docker and the executor images
+  native  the namespace/rlimit sandbox; needs NATIVE_SANDBOX roots
+
+With --eager, Celery runs tasks in the calling thread and keeps results in
+memory, so no worker is needed; the api target still needs Redis, where the
+web tier records who submitted each run. Admission control (rate and
+concurrency limits) is switched off for the benchmark. Without it, tasks go
+through the configured broker to running workers; the backend travels with
+each task, so the workers need no extra configuration.
+"""
+import json
+import logging
+import platform
+import statistics
+import subprocess
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from celery.result import allow_join_result
+from django.conf import settings
+from django.test import Client
+
+from .accounting import build_metrics
+
+logger = logging.getLogger(__name__)
+
+FINAL_STATES = {
+    "finished",
+    "timed_out",
+    "oom_killed",
+    "truncated",
+    "failed",
+    "cancelled",
+}
+
+
+def fake_run_code(code, language, stdin="", queue_wait_ms=None):
+    """Stand-in for run_code: echoes stdin after a simulated run time."""
+    from .tasks import FINISHED, execution_result
+
+    latency_ms = getattr(settings, "FAKE_SANDBOX_LATENCY_MS", 5)
+    started = time.monotonic()
+    time.sleep(latency_ms / 1000)
+    result = execution_result(FINISHED, exit_code=0, stdout=stdin or "ok\n")
+    timings = {
+        "queue_wait_ms": queue_wait_ms,
+        "container_start_ms": 0.0,
+        "run_wall_ms": round((time.monotonic() - started) * 1000, 1),
+        "warm_container": True,
+    }
+    result["metrics"] = build_metrics(timings, {}, len(result["stdout"].encode()))
+    return result
+
+
+def use_backend(name, eager):
+    # every run of the benchmark goes to the same backend
+    settings.EXECUTOR_BACKEND = name
+    settings.EXECUTOR_LANGUAGE_BACKENDS = {}
+    settings.EXECUTOR_TENANT_BACKENDS = {}
+    # every request comes from 127.0.0.1: rate and concurrency limits would
+    # turn the measurement into one of 429s
+    settings.EXECUTION_ADMISSION = {
+        **getattr(settings, "EXECUTION_ADMISSION", {}),
+        "ENABLED": False,
+    }
+    if eager:
+        # the Celery app reads these from django settings on every lookup;
+        # result backends are created per thread on first use, so the pool
+        # threads below get the in-memory one
+        settings.CELERY_TASK_ALWAYS_EAGER = True
+        settings.CELERY_TASK_STORE_EAGER_RESULT = True
+        settings.CELERY_RESULT_BACKEND = "cache+memory://"
+
+
+def percentile(samples, pct):
+    ordered = sorted(samples)
+    index = max(0, min(len(ordered) - 1, round(pct / 100 * len(ordered)) - 1))
+    return ordered[index]
+
+
+def _via_api(payload, poll_interval):
+    client = Client()
+    response = client.post(
+        "/api/v1/editor/execute", data=payload, content_type="application/json"
+    )
+    body = response.json()
+    if response.status_code not in (200, 202):
+        return False
+    while body.get("status") not in FINAL_STATES:
+        time.sleep(poll_interval)
+        body = client.get(f"/api/v1/editor/execute/{body['task_id']}").json()
+    return body["status"] == "finished"
+
+
+def _via_task(payload, timeout):
+    from .tasks import execute_code
+
+    # eager runs on other pool threads flip Celery's process-wide "inside a
+    # task" flag; this thread never is one
+    result = execute_code.apply_async(
+        (payload["code"], payload["language"], payload.get("stdin", "")),
+        {"backend": settings.EXECUTOR_BACKEND},
+    ).get(timeout=timeout, disable_sync_subtasks=False)
+    return result["status"] == "finished"
+
+
+def run_level(target, payload, concurrency, requests, poll_interval=0.01, timeout=60):
+    latencies = []
+    errors = 0
+    lock = threading.Lock()
+
+    def one(_):
+        nonlocal errors
+        started = time.perf_counter()
+        try:
+            if target == "api":
+                ok = _via_api(payload, poll_interval)
+            else:
+                ok = _via_task(payload, timeout)
+        except Exception:
+            logger.exception("Benchmark request failed")
+            ok = False
+        elapsed_ms = (time.perf_counter() - started) * 1000
+        with lock:
+            latencies.append(elapsed_ms)
+            if not ok:
+                errors += 1
+
+    wall_started = time.perf_counter()
+    # the eager runs' saves and restores of that flag interleave across
+    # threads and can leave it set; this puts it back afterwards
+    with allow_join_result(), ThreadPoolExecutor(max_workers=concurrency) as pool:
+        list(pool.map(one, range(requests)))
+    wall = time.perf_counter() - wall_started
+
+    return {
+        "concurrency": concurrency,
+        "requests": requests,
+        "errors": errors,
+        "duration_s": round(wall, 3),
+        "throughput_rps": round(requests / wall, 2) if wall else None,
+        "latency_ms": {
+            "p50": round(percentile(latencies, 50), 2),
+            "p95": round(percentile(latencies, 95), 2),
+            "p99": round(percentile(latencies, 99), 2),
+            "mean": round(statistics.fmean(latencies), 2),
+            "max": round(max(latencies), 2),
+        },
+    }
+
+
+def git_revision():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            capture_output=True,
+            text=True,
+            timeout=5,
+        ).stdout.strip() or None
+    except (OSError, subprocess.SubprocessError):
+        return None
+
+
+def run_benchmark(
+    target, backend, eager, payload, concurrency_levels, requests, warmup=5
+):
+    use_backend(backend, eager)
+    if warmup:
+        run_level(target, payload, 1, warmup)
+    return {
+        "meta": {
+            "commit": git_revision(),
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+            "target": target,
+            "backend": backend,
+            "eager": eager,
+            "language": payload["language"],
+            "python": platform.python_version(),
+            "host": platform.node(),
+        },
+        "results": [
+            run_level(target, payload, concurrency, requests)
+            for concurrency in concurrency_levels
+        ],
+    }
+
+
+def write_report(report, path):
+    with open(path, "w") as f:
+        json.dump(report, f, indent=2)
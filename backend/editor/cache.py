@@ -0,0 +1,173 @@
+# editor/cache.py
+"""
+Content-addressed cache for execution results.
+
+Results live in the Redis instance behind CELERY_RESULT_BACKEND, keyed by a
+hash of the exact source (CRLF folded to LF), the language, stdin and the
+digest of the image that ran it, so rebuilding an image invalidates its
+entries. Entries expire after TTL seconds and the least recently used ones
+are evicted once there are more than MAX_ENTRIES (tracked in a sorted set, since the Redis
+instance is shared with the broker and must not use allkeys-lru itself).
+
+Concurrent identical requests are coalesced: the first one claims an
+"inflight" key holding its task id and later ones are handed that task id.
+The claim is dropped when the run ends, including when it is revoked.
+"""
+import hashlib
+import json
+import logging
+import time
+
+import redis
+from celery.signals import task_revoked
+from django.conf import settings
+
+from .docker_client import DockerError, get_client as get_docker_client
+
+logger = logging.getLogger(__name__)
+
+CACHE_DEFAULTS = {
+    "ENABLED": True,
+    "TTL": 3600,  # seconds a result is kept
+    "MAX_ENTRIES": 10000,  # LRU bound on stored results
+    "INFLIGHT_TTL": 120,  # seconds a coalescing claim is held at most
+}
+
+PREFIX = "execcache"
+LRU_KEY = f"{PREFIX}:lru"
+HITS_KEY = f"{PREFIX}:hits"
+MISSES_KEY = f"{PREFIX}:misses"
+COALESCED_KEY = f"{PREFIX}:coalesced"
+
+# KEYS[1]: an inflight key; ARGV[1]: a task id. Drops the claim only while
+# that task still holds it
+RELEASE_CLAIM = """
+if redis.call("GET", KEYS[1]) == ARGV[1] then
+  return redis.call("DEL", KEYS[1])
+end
+return 0
+"""
+
+_client = None
+
+
+def cache_setting(name):
+    return getattr(settings, "EXECUTION_CACHE", {}).get(name, CACHE_DEFAULTS[name])
+
+
+def get_client():
+    global _client
+    if _client is None:
+        _client = redis.Redis.from_url(settings.CELERY_RESULT_BACKEND)
+    return _client
+
+
+def _result_key(key):
+    return f"{PREFIX}:result:{key}"
+
+
+def _inflight_key(key):
+    return f"{PREFIX}:inflight:{key}"
+
+
+def _image_key(image_name):
+    return f"{PREFIX}:image:{image_name}"
+
+
+def normalize_source(code):
+    # only CRLF is folded: blank lines move traceback line numbers, and
+    # trailing spaces can sit inside string literals
+    return code.replace("\r\n", "\n")
+
+
+def publish_image_digest(image_name, digest=None):
+    """Record the local image id so the web tier can build cache keys."""
+    if digest is None:
+        try:
+            digest = get_docker_client().inspect_image(image_name)["Id"]
+        except (DockerError, OSError) as e:
+            logger.warning("Could not inspect image %s: %s", image_name, e)
+            return None
+    get_client().set(_image_key(image_name), digest)
+    return digest
+
+
+def cache_key(code, language, stdin, image_name):
+    """Return the cache key for a run, or None while the image digest is unknown."""
+    digest = get_client().get(_image_key(image_name))
+    if digest is None:
+        return None
+    payload = "\0".join(
+        [digest.decode(), language, normalize_source(code), stdin]
+    ).encode()
+    return hashlib.sha256(payload).hexdigest()
+
+
+def lookup(key):
+    """Return the cached result dict for `key`, counting the hit or miss."""
+    client = get_client()
+    cached = client.get(_result_key(key))
+    if cached is None:
+        client.incr(MISSES_KEY)
+        return None
+    client.incr(HITS_KEY)
+    client.zadd(LRU_KEY, {key: time.time()})
+    return json.loads(cached)
+
+
+def claim(key, task_id):
+    """
+    Claim `key` for `task_id`. Returns None if the caller should run it, or the
+    id of the task already running the same payload.
+    """
+    client = get_client()
+    inflight = _inflight_key(key)
+    if client.set(inflight, task_id, nx=True, ex=cache_setting("INFLIGHT_TTL")):
+        return None
+    running = client.get(inflight)
+    if running is None:
+        # the other run finished between the two calls; just run this one
+        return None
+    client.incr(COALESCED_KEY)
+    return running.decode()
+
+
+def store(key, result):
+    client = get_client()
+    with client.pipeline() as pipe:
+        pipe.set(_result_key(key), json.dumps(result), ex=cache_setting("TTL"))
+        pipe.zadd(LRU_KEY, {key: time.time()})
+        # entries that expired on their own also drop out of the index here
+        pipe.zremrangebyscore(LRU_KEY, "-inf", time.time() - cache_setting("TTL"))
+        pipe.execute()
+    overflow = client.zcard(LRU_KEY) - cache_setting("MAX_ENTRIES")
+    if overflow > 0:
+        evicted = [member for member, _ in client.zpopmin(LRU_KEY, overflow)]
+        client.delete(*[_result_key(member.decode()) for member in evicted])
+
+
+def release(key, task_id):
+    get_client().eval(RELEASE_CLAIM, 1, _inflight_key(key), task_id)
+
+
+@task_revoked.connect
+def release_revoked(request=None, **kwargs):
+    # a terminated execute_code never reaches the release in its finally
+    cache_key = (getattr(request, "kwargs", None) or {}).get("cache_key")
+    if cache_key:
+        release(cache_key, request.id)
+
+
+def stats():
+    client = get_client()
+    hits, misses, coalesced = (
+        int(value or 0) for value in client.mget(HITS_KEY, MISSES_KEY, COALESCED_KEY)
+    )
+    lookups = hits + misses
+    return {
+        "hits": hits,
+        "misses": misses,
+        "coalesced": coalesced,
+        "hit_ratio": round(hits / lookups, 4) if lookups else 0.0,
+        "entries": client.zcard(LRU_KEY),
+    }
@@ -0,0 +1,213 @@
+# editor/compiled.py
+"""
+Compiled languages: a separate compile step in front of the run.
+
+The source is compiled in a one-off container of the language's image with
+no network. The compiler writes into /app/out, and that directory comes back
+as a tar stream on stdout while diagnostics go to stderr.
+
+Artifacts are kept on the worker's local disk, keyed by the compiler image
+digest, the compile command (so changing flags changes the key) and the
+source. Running unchanged code again, with any stdin, never compiles twice
+on a host. The directory is an LRU bounded by MAX_BYTES: a hit touches the
+file's mtime, and the oldest files go after each store.
+
+The artifact reaches the run container the way scripts do: over stdin,
+ahead of the program's input, and unpacked into /app.
+"""
+import hashlib
+import logging
+import os
+import tempfile
+import time
+import uuid
+
+from django.conf import settings
+
+from .docker_client import STDERR, Capture, get_client
+from .reaper import RUN, execution_labels
+
+logger = logging.getLogger(__name__)
+
+COMPILE_DEFAULTS = {
+    "CACHE_DIR": os.path.join(tempfile.gettempdir(), "editor-artifacts"),
+    "MAX_BYTES": 1024 * 1024 * 1024,  # artifacts kept on disk per worker host
+    "TIMEOUT": 30,  # seconds a compile may take
+    "MEMORY": 1024 * 1024 * 1024,  # compilers need far more than programs do
+    "NANO_CPUS": 1_000_000_000,
+    "PIDS": 256,  # build tools start many threads and subprocesses
+    "DIAGNOSTICS_BYTES": 64 * 1024,  # compiler output kept for the result
+}
+
+# Scratch space for the compilers; Go keeps its build cache under HOME
+COMPILE_ENV = ["HOME=/tmp", "GOCACHE=/tmp/go-build", "GOPATH=/tmp/go", "CGO_ENABLED=0"]
+
+
+def compile_setting(name):
+    return getattr(settings, "COMPILE_CACHE", {}).get(name, COMPILE_DEFAULTS[name])
+
+
+def artifact_program(artifact, language):
+    """(payload, install, run) for delivering an artifact; see delivery_command."""
+    return artifact, f"head -c {len(artifact)} | tar -x -C /app", language.entrypoint
+
+
+class CompileCapture(Capture):
+    """Keeps the whole artifact but only the start of the diagnostics."""
+
+    def write(self, stream_id, data):
+        if stream_id == STDERR:
+            room = compile_setting("DIAGNOSTICS_BYTES") - len(self.output[STDERR])
+            data = data[: max(room, 0)]
+        super().write(stream_id, data)
+
+
+def artifact_key(language, code):
+    # the digest is pinned at worker start (editor.languages.pin_images)
+    digest = language.digest or get_client().inspect_image(language.image)["Id"]
+    payload = "\0".join([digest, language.compile, code])
+    return hashlib.sha256(payload.encode()).hexdigest()
+
+
+def _artifact_path(key):
+    return os.path.join(compile_setting("CACHE_DIR"), key[:2], f"{key}.tar")
+
+
+def load_artifact(key):
+    path = _artifact_path(key)
+    try:
+        with open(path, "rb") as f:
+            artifact = f.read()
+        # mtime is the LRU clock
+        os.utime(path)
+    except FileNotFoundError:
+        return None
+    except OSError as e:
+        logger.warning("Could not read artifact %s: %s", key, e)
+        return None
+    return artifact
+
+
+def store_artifact(key, artifact):
+    path = _artifact_path(key)
+    try:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        # written aside and renamed, so a concurrent reader never sees half a file
+        fd, partial = tempfile.mkstemp(dir=os.path.dirname(path), suffix=".partial")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                f.write(artifact)
+            os.replace(partial, path)
+        except BaseException:
+            # e.g. the disk filled up; a half-written file would never be evicted
+            try:
+                os.unlink(partial)
+            except OSError:
+                pass
+            raise
+    except OSError as e:
+        logger.warning("Could not store artifact %s: %s", key, e)
+        return
+    evict(compile_setting("MAX_BYTES"))
+
+
+def evict(max_bytes):
+    """Remove the least recently used artifacts until the cache fits `max_bytes`."""
+    entries = []
+    for root, _, files in os.walk(compile_setting("CACHE_DIR")):
+        for name in files:
+            if not name.endswith(".tar"):
+                continue
+            path = os.path.join(root, name)
+            try:
+                stat = os.stat(path)
+            except FileNotFoundError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, path))
+    total = sum(size for _, size, _ in entries)
+    removed = 0
+    for _, size, path in sorted(entries):
+        if total <= max_bytes:
+            break
+        try:
+            os.unlink(path)
+        except FileNotFoundError:
+            pass
+        total -= size
+        removed += 1
+    return removed
+
+
+def compile_command(language, code_bytes):
+    return [
+        "sh",
+        "-c",
+        "mkdir -p /app/src /app/out && cd /app/src && "
+        f"head -c {len(code_bytes)} > {language.source} || exit 125; "
+        f"{language.compile} >&2 && tar -C /app/out -cf - .",
+    ]
+
+
+def _compile(language, code_bytes):
+    client = get_client()
+    timeout = compile_setting("TIMEOUT")
+    container_id = client.create_container(
+        {
+            "Image": language.container_image,
+            "Entrypoint": compile_command(language, code_bytes),
+            "Env": COMPILE_ENV,
+            "Labels": execution_labels(RUN),
+            "OpenStdin": True,
+            "StdinOnce": True,
+            "AttachStdin": True,
+            "AttachStdout": True,
+            "AttachStderr": True,
+            "HostConfig": {
+                **language.host_config,
+                "Memory": compile_setting("MEMORY"),
+                "NanoCpus": compile_setting("NANO_CPUS"),
+                "PidsLimit": compile_setting("PIDS"),
+                "Tmpfs": {"/app": "rw,size=256m", "/tmp": "rw,exec,size=512m"},
+            },
+        },
+        name=f"executor-compile-{uuid.uuid4().hex[:12]}",
+    )
+    try:
+        stream = client.attach(container_id, timeout=timeout)
+        try:
+            client.start_container(container_id)
+            stream.send_stdin_in_background(code_bytes)
+            stdout, stderr = stream.collect(
+                time.monotonic() + timeout, CompileCapture()
+            )
+        finally:
+            stream.close()
+        exit_code = client.wait_container(container_id)
+    finally:
+        client.remove_container(container_id)
+    return exit_code, stdout, stderr
+
+
+def compile_program(language, code):
+    """
+    Compile `code`, or take it from the artifact cache.
+
+    Returns (artifact, info): artifact is None if the compiler rejected the
+    code, and info carries cached, compile_ms, exit_code and diagnostics.
+    Raises TimeoutError when the compile runs past TIMEOUT.
+    """
+    started = time.monotonic()
+    key = artifact_key(language, code)
+    artifact = load_artifact(key)
+    info = {"cached": artifact is not None, "exit_code": 0, "diagnostics": ""}
+    if artifact is None:
+        exit_code, artifact, diagnostics = _compile(language, code.encode("utf-8"))
+        info["exit_code"] = exit_code
+        info["diagnostics"] = diagnostics.decode("utf-8", errors="replace")
+        if exit_code == 0:
+            store_artifact(key, artifact)
+        else:
+            artifact = None
+    info["compile_ms"] = round((time.monotonic() - started) * 1000, 1)
+    return artifact, info
+
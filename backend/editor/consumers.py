@@ -0,0 +1,199 @@
+# editor/consumers.py
+"""
+ASGI side of streaming execution, mounted by core.asgi.
+
+  ws://<host>/ws/editor/execute/<task_id>       output out, stdin in
+  http://<host>/stream/editor/execute/<task_id> output only (Server-Sent Events)
+
+Both relay the chunks published by editor.streams and acknowledge each chunk
+only after it has been handed to the ASGI server, whose own send() applies
+socket backpressure. Only whoever submitted the execution may connect, the
+same check as for polling it; anyone else gets a 404.
+"""
+import asyncio
+import json
+import re
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.http.cookie import parse_cookie
+from redis import asyncio as aioredis
+from rest_framework_simplejwt.exceptions import TokenError
+from rest_framework_simplejwt.settings import api_settings
+
+from accounts.tokens import verify_access_token
+
+from .admission import is_subscriber
+from .streams import (
+    STDIN_EOF,
+    acked_key,
+    output_channel,
+    redis_url,
+    stdin_channel,
+)
+
+WEBSOCKET_PATH = re.compile(r"^/ws/editor/execute/(?P<task_id>[\w-]+)/?$")
+EVENTS_PATH = re.compile(r"^/stream/editor/execute/(?P<task_id>[\w-]+)/?$")
+
+# the handshake key outlives a client that never receives the exit event
+ACK_KEY_TTL = 3600
+
+
+def stream_owner(scope):
+    """execution_owner() for an ASGI scope; None for an invalid access token."""
+    headers = dict(scope.get("headers") or [])
+    cookies = parse_cookie(headers.get(b"cookie", b"").decode("latin-1"))
+    raw_token = cookies.get(settings.SIMPLE_JWT["AUTH_COOKIE"])
+    if raw_token:
+        try:
+            token = verify_access_token(raw_token)
+        except TokenError:
+            return None
+        return f"user:{token[api_settings.USER_ID_CLAIM]}"
+    client = scope.get("client")
+    return f"addr:{client[0] if client else 'unknown'}"
+
+
+def may_stream(scope, execution_id):
+    owner = stream_owner(scope)
+    return owner is not None and is_subscriber(execution_id, owner)
+
+
+async def _relay_output(client, execution_id, deliver):
+    """Forward published chunks to `deliver` until the exit event arrives."""
+    pubsub = client.pubsub(ignore_subscribe_messages=True)
+    await pubsub.subscribe(output_channel(execution_id))
+    # creating the counter tells the worker someone is listening
+    await client.set(acked_key(execution_id), 0, ex=ACK_KEY_TTL, nx=True)
+    try:
+        async for message in pubsub.listen():
+            if message["type"] != "message":
+                continue
+            payload = message["data"].decode()
+            chunk = json.loads(payload)
+            await deliver(payload)
+            if chunk.get("bytes"):
+                await client.incrby(acked_key(execution_id), chunk["bytes"])
+            if chunk.get("event") == "exit":
+                return
+    finally:
+        await pubsub.unsubscribe()
+        await pubsub.aclose()
+
+
+async def _first_completed(*coroutines):
+    tasks = [asyncio.ensure_future(coroutine) for coroutine in coroutines]
+    try:
+        await asyncio.wait(tasks, return_when=asyncio.FIRST_COMPLETED)
+    finally:
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+
+async def websocket_execution(scope, receive, send, execution_id):
+    event = await receive()
+    if event["type"] != "websocket.connect":
+        return
+    await send({"type": "websocket.accept"})
+    client = aioredis.Redis.from_url(redis_url())
+
+    async def deliver(payload):
+        await send({"type": "websocket.send", "text": payload})
+
+    disconnected = False
+
+    async def relay_stdin():
+        nonlocal disconnected
+        while True:
+            event = await receive()
+            if event["type"] == "websocket.disconnect":
+                disconnected = True
+                return
+            # clients send {"stdin": "..."} to type and {"eof": true} to close stdin
+            try:
+                message = json.loads(event.get("text") or event.get("bytes") or "")
+            except ValueError:
+                continue
+            if not isinstance(message, dict):
+                continue
+            if message.get("eof"):
+                await client.publish(stdin_channel(execution_id), STDIN_EOF)
+            elif message.get("stdin"):
+                await client.publish(stdin_channel(execution_id), message["stdin"])
+
+    code = 1000
+    try:
+        await _first_completed(
+            _relay_output(client, execution_id, deliver), relay_stdin()
+        )
+    except OSError:
+        code = 1011  # Redis went away
+    finally:
+        await client.aclose()
+    if not disconnected:
+        await send({"type": "websocket.close", "code": code})
+
+
+async def event_stream_execution(scope, receive, send, execution_id):
+    await send(
+        {
+            "type": "http.response.start",
+            "status": 200,
+            "headers": [
+                (b"content-type", b"text/event-stream"),
+                (b"cache-control", b"no-cache"),
+                (b"x-accel-buffering", b"no"),
+            ],
+        }
+    )
+    client = aioredis.Redis.from_url(redis_url())
+
+    async def deliver(payload):
+        body = f"data: {payload}\n\n".encode()
+        await send({"type": "http.response.body", "body": body, "more_body": True})
+
+    async def wait_for_disconnect():
+        while (await receive())["type"] != "http.disconnect":
+            pass
+
+    try:
+        await _first_completed(
+            _relay_output(client, execution_id, deliver), wait_for_disconnect()
+        )
+    finally:
+        await client.aclose()
+        await send({"type": "http.response.body", "body": b"", "more_body": False})
+
+
+async def not_found(scope, receive, send):
+    if scope["type"] == "websocket":
+        await receive()
+        await send({"type": "websocket.close", "code": 4404})
+        return
+    await send(
+        {
+            "type": "http.response.start",
+            "status": 404,
+            "headers": [(b"content-type", b"text/plain")],
+        }
+    )
+    await send({"type": "http.response.body", "body": b"Not Found"})
+
+
+def is_stream_request(scope):
+    return scope["type"] == "websocket" or (
+        scope["type"] == "http" and scope["path"].startswith("/stream/")
+    )
+
+
+async def stream_application(scope, receive, send):
+    if scope["type"] == "websocket":
+        path, consumer = WEBSOCKET_PATH, websocket_execution
+    else:
+        path, consumer = EVENTS_PATH, event_stream_execution
+    match = path.match(scope["path"])
+    # the token check and the subscriber lookup are blocking calls
+    if match and await sync_to_async(may_stream)(scope, match.group("task_id")):
+        return await consumer(scope, receive, send, match.group("task_id"))
+    return await not_found(scope, receive, send)
@@ -0,0 +1,399 @@
+# editor/docker_client.py
+"""
+Minimal Docker Engine API client over the daemon's unix socket.
+
+Forking the `docker` CLI for every call costs a process spawn, a config read
+and a fresh socket connection. This client keeps a small pool of keep-alive
+HTTP connections per worker process instead. Requests whose connection the
+daemon hijacks for a raw stream (attach, exec start) get a dedicated socket,
+since those can never be reused.
+"""
+import http.client
+import json
+import os
+import queue
+import socket
+import struct
+import threading
+import time
+from urllib.parse import quote, urlencode
+
+from django.conf import settings
+
+DOCKER_DEFAULTS = {
+    "SOCKET": "/var/run/docker.sock",
+    "API_VERSION": "v1.41",
+    "POOL_SIZE": 8,  # idle keep-alive connections kept per process
+    "TIMEOUT": 30,  # seconds for ordinary API calls
+}
+
+# Stream ids in the multiplexed attach/exec stream
+STDIN, STDOUT, STDERR = 0, 1, 2
+FRAME_HEADER = struct.Struct(">BxxxL")
+
+
+def docker_setting(name):
+    return getattr(settings, "DOCKER_ENGINE", {}).get(name, DOCKER_DEFAULTS[name])
+
+
+class DockerError(Exception):
+    def __init__(self, status, message):
+        super().__init__(f"Docker API error {status}: {message}")
+        self.status = status
+        self.message = message
+
+
+class NotFound(DockerError):
+    pass
+
+
+class UnixHTTPConnection(http.client.HTTPConnection):
+    def __init__(self, socket_path, timeout):
+        super().__init__("localhost", timeout=timeout)
+        self.socket_path = socket_path
+
+    def connect(self):
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        sock.settimeout(self.timeout)
+        sock.connect(self.socket_path)
+        self.sock = sock
+
+
+class FrameParser:
+    """Split Docker's multiplexed stream into (stream id, payload) frames."""
+
+    def __init__(self):
+        self.buffer = bytearray()
+
+    def feed(self, data):
+        self.buffer.extend(data)
+        frames = []
+        while len(self.buffer) >= FRAME_HEADER.size:
+            stream_id, size = FRAME_HEADER.unpack_from(self.buffer)
+            end = FRAME_HEADER.size + size
+            if len(self.buffer) < end:
+                break
+            frames.append((stream_id, bytes(self.buffer[FRAME_HEADER.size : end])))
+            del self.buffer[:end]
+        return frames
+
+
+class Capture:
+    """Keeps all of stdout and stderr; see editor.output for a bounded one."""
+
+    def __init__(self):
+        self.output = {STDOUT: bytearray(), STDERR: bytearray()}
+
+    def write(self, stream_id, data):
+        if stream_id in self.output:
+            self.output[stream_id].extend(data)
+
+    def value(self, stream_id):
+        return bytes(self.output[stream_id])
+
+
+class RawStream:
+    """A hijacked connection carrying a multiplexed stdout/stderr stream."""
+
+    def __init__(self, sock, buffered=b""):
+        self.sock = sock
+        self.parser = FrameParser()
+        self.pending = buffered
+
+    def fileno(self):
+        return self.sock.fileno()
+
+    def read_frames(self, size=65536):
+        """Return the next complete frames, or None once the stream has ended."""
+        if self.pending:
+            data, self.pending = self.pending, b""
+        else:
+            data = self.sock.recv(size)
+            if not data:
+                return None
+        return self.parser.feed(data)
+
+    def write_stdin(self, data):
+        self.sock.sendall(data)
+
+    def close_stdin(self):
+        try:
+            self.sock.shutdown(socket.SHUT_WR)
+        except OSError:
+            pass
+
+    def send_stdin_in_background(self, data):
+        # written from a thread so a program that prints before reading its
+        # input can never deadlock against us
+        def feed():
+            try:
+                if data:
+                    self.write_stdin(data)
+            except OSError:
+                pass
+            self.close_stdin()
+
+        threading.Thread(target=feed, daemon=True).start()
+
+    def collect(self, deadline, capture=None):
+        """
+        Read the stream to the end into `capture`; returns (stdout, stderr).
+
+        Raises TimeoutError past `deadline`. Exceptions raised by the
+        capture's write() stop the read and propagate.
+        """
+        capture = capture or Capture()
+        while True:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                raise TimeoutError("execution deadline exceeded")
+            self.sock.settimeout(remaining)
+            try:
+                frames = self.read_frames()
+            except socket.timeout:
+                raise TimeoutError("execution deadline exceeded")
+            if frames is None:
+                return capture.value(STDOUT), capture.value(STDERR)
+            for stream_id, payload in frames:
+                capture.write(stream_id, payload)
+
+    def close(self):
+        self.sock.close()
+
+
+class DockerClient:
+    def __init__(self, socket_path, api_version, pool_size, timeout):
+        self.socket_path = socket_path
+        self.api_version = api_version
+        self.timeout = timeout
+        self._idle = queue.LifoQueue(maxsize=pool_size)
+
+    # -- transport -----------------------------------------------------------
+
+    def _url(self, path, params=None):
+        url = f"/{self.api_version}{path}"
+        if params:
+            url += "?" + urlencode(params)
+        return url
+
+    def _checkout(self):
+        try:
+            return self._idle.get_nowait(), True
+        except queue.Empty:
+            return UnixHTTPConnection(self.socket_path, self.timeout), False
+
+    def _checkin(self, connection):
+        try:
+            self._idle.put_nowait(connection)
+        except queue.Full:
+            connection.close()
+
+    def request(self, method, path, params=None, body=None, timeout=None):
+        payload = json.dumps(body).encode() if body is not None else None
+        headers = {"Content-Type": "application/json"} if payload is not None else {}
+        for attempt in range(2):
+            connection, reused = self._checkout()
+            connection.timeout = timeout or self.timeout
+            if connection.sock is not None:
+                connection.sock.settimeout(connection.timeout)
+            try:
+                connection.request(
+                    method, self._url(path, params), body=payload, headers=headers
+                )
+                response = connection.getresponse()
+                data = response.read()
+            except (http.client.RemoteDisconnected, BrokenPipeError, ConnectionResetError):
+                connection.close()
+                # the daemon closed an idle keep-alive connection; retry on a new one
+                if reused and attempt == 0:
+                    continue
+                raise
+            except Exception:
+                connection.close()
+                raise
+            if response.will_close:
+                connection.close()
+            else:
+                self._checkin(connection)
+            break
+
+        if response.status >= 400:
+            raise _error(response.status, data)
+        if data and response.getheader("Content-Type", "").startswith(
+            "application/json"
+        ):
+            return json.loads(data)
+        return data
+
+    def hijack(self, method, path, params=None, body=None, timeout=None):
+        """Send a request the daemon upgrades to a raw stream and return it."""
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        sock.settimeout(timeout or self.timeout)
+        sock.connect(self.socket_path)
+        payload = json.dumps(body).encode() if body is not None else b""
+        head = (
+            f"{method} {self._url(path, params)} HTTP/1.1\r\n"
+            "Host: docker\r\n"
+            "Content-Type: application/json\r\n"
+            f"Content-Length: {len(payload)}\r\n"
+            "Connection: Upgrade\r\n"
+            "Upgrade: tcp\r\n\r\n"
+        )
+        try:
+            sock.sendall(head.encode() + payload)
+            received = b""
+            while b"\r\n\r\n" not in received:
+                chunk = sock.recv(4096)
+                if not chunk:
+                    raise DockerError(0, "connection closed during upgrade")
+                received += chunk
+            header, _, rest = received.partition(b"\r\n\r\n")
+            status = int(header.split(b" ", 2)[1])
+            if status not in (101, 200):
+                raise _error(status, _read_error_body(sock, header, rest))
+        except Exception:
+            sock.close()
+            raise
+        return RawStream(sock, rest)
+
+    # -- images and containers -----------------------------------------------
+
+    def inspect_image(self, name):
+        return self.request("GET", f"/images/{quote(name, safe='')}/json")
+
+    def create_container(self, config, name=None):
+        params = {"name": name} if name else None
+        return self.request("POST", "/containers/create", params=params, body=config)[
+            "Id"
+        ]
+
+    def start_container(self, container_id):
+        self.request("POST", f"/containers/{container_id}/start")
+
+    def inspect_container(self, container_id):
+        return self.request("GET", f"/containers/{container_id}/json")
+
+    def container_changes(self, container_id):
+        return self.request("GET", f"/containers/{container_id}/changes") or []
+
+    def wait_container(self, container_id, timeout=None):
+        return self.request(
+            "POST", f"/containers/{container_id}/wait", timeout=timeout
+        )["StatusCode"]
+
+    def kill_container(self, container_id):
+        try:
+            self.request("POST", f"/containers/{container_id}/kill")
+        except DockerError as e:
+            # 404: already removed, 409: not running any more
+            if e.status not in (404, 409):
+                raise
+
+    def remove_container(self, container_id):
+        try:
+            self.request(
+                "DELETE", f"/containers/{container_id}", params={"force": "true"}
+            )
+        except NotFound:
+            pass
+
+    def list_containers(self, filters, all=True):
+        return self.request(
+            "GET",
+            "/containers/json",
+            params={"all": str(all).lower(), "filters": json.dumps(filters)},
+        )
+
+    def attach(self, container_id, stdin=True, timeout=None):
+        return self.hijack(
+            "POST",
+            f"/containers/{container_id}/attach",
+            params={
+                "stream": "1",
+                "stdin": "1" if stdin else "0",
+                "stdout": "1",
+                "stderr": "1",
+            },
+            timeout=timeout,
+        )
+
+    def exec_start(self, container_id, cmd, stdin=False, timeout=None):
+        """Create and start an exec; returns (exec id, RawStream)."""
+        exec_id = self.request(
+            "POST",
+            f"/containers/{container_id}/exec",
+            body={
+                "AttachStdin": stdin,
+                "AttachStdout": True,
+                "AttachStderr": True,
+                "Tty": False,
+                "Cmd": cmd,
+            },
+        )["Id"]
+        stream = self.hijack(
+            "POST",
+            f"/exec/{exec_id}/start",
+            body={"Detach": False, "Tty": False},
+            timeout=timeout,
+        )
+        return exec_id, stream
+
+    def exec_exit_code(self, exec_id):
+        return self.request("GET", f"/exec/{exec_id}/json")["ExitCode"]
+
+    def exec_run(self, container_id, cmd, stdin=None, timeout=None, capture=None):
+        """Run `cmd` in a container; returns (exit code, stdout, stderr) as bytes."""
+        deadline = time.monotonic() + (timeout or self.timeout)
+        exec_id, stream = self.exec_start(
+            container_id, cmd, stdin=stdin is not None, timeout=timeout
+        )
+        try:
+            if stdin is not None:
+                stream.send_stdin_in_background(stdin)
+            stdout, stderr = stream.collect(deadline, capture)
+        finally:
+            stream.close()
+        return self.exec_exit_code(exec_id), stdout, stderr
+
+
+def _error(status, data):
+    try:
+        message = json.loads(data).get("message", "")
+    except (ValueError, AttributeError):
+        message = data.decode(errors="replace") if isinstance(data, bytes) else data
+    return (NotFound if status == 404 else DockerError)(status, message)
+
+
+def _read_error_body(sock, header, received):
+    length = 0
+    for line in header.split(b"\r\n")[1:]:
+        name, _, value = line.partition(b":")
+        if name.strip().lower() == b"content-length":
+            length = int(value.strip())
+    body = bytearray(received)
+    while len(body) < length:
+        chunk = sock.recv(4096)
+        if not chunk:
+            break
+        body.extend(chunk)
+    return bytes(body)
+
+
+# One client (and connection pool) per process; forked workers get their own
+_client = None
+_client_pid = None
+_client_lock = threading.Lock()
+
+
+def get_client():
+    global _client, _client_pid
+    with _client_lock:
+        if _client is None or _client_pid != os.getpid():
+            _client = DockerClient(
+                docker_setting("SOCKET"),
+                docker_setting("API_VERSION"),
+                docker_setting("POOL_SIZE"),
+                docker_setting("TIMEOUT"),
+            )
+            _client_pid = os.getpid()
+        return _client
@@ -0,0 +1,294 @@
+# editor/judge.py
+"""
+Batch (judge) runs: one program against many test cases in one container.
+
+The code is written into a single container once. Each case is then an exec
+of the interpreter with that case's stdin, so N cases cost one container
+start instead of N. Up to CPUS cases run at once, and the container gets
+that many CPUs.
+
+A small shell harness runs each case. It enforces the case's time and
+memory limits, samples the interpreter's peak RSS (VmHWM) and CPU ticks from
+/proc, and reports them on stderr behind a marker, like the accounting
+wrapper does. Cases share the container's memory, so a case over its own
+limit is killed by the harness rather than left to the container's OOM
+killer, which could pick a neighbouring case.
+"""
+import math
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+
+from .accounting import new_marker
+from .docker_client import DockerError, get_client
+from .output import BoundedCapture, OutputLimitExceeded
+from .reaper import JUDGE, execution_labels
+
+JUDGE_DEFAULTS = {
+    "MAX_CASES": 100,
+    "CPUS": 2,  # cases run in parallel, and CPUs given to the container
+    "MEMORY": 512 * 1024 * 1024,  # memory of the whole container
+    "MAX_TIME_LIMIT": 10,  # largest per-case time limit a request may ask for
+    "MAX_OUTPUT_BYTES": 64 * 1024,  # stdout kept per case for comparison
+}
+
+ACCEPTED = "accepted"
+WRONG_ANSWER = "wrong_answer"
+RUNTIME_ERROR = "runtime_error"
+TIME_LIMIT_EXCEEDED = "time_limit_exceeded"
+MEMORY_LIMIT_EXCEEDED = "memory_limit_exceeded"
+OUTPUT_LIMIT_EXCEEDED = "output_limit_exceeded"
+COMPILE_ERROR = "compile_error"
+SKIPPED = "skipped"  # not run because an earlier case failed (stop_on_failure)
+
+EXACT = "exact"
+LINES = "lines"  # ignore trailing whitespace on each line and at the end
+COMPARISONS = (LINES, EXACT)
+
+# Kernel clock ticks per second, the unit of utime/stime in /proc/<pid>/stat
+CLOCK_TICKS = 100
+
+# Runs one case: $1 is the program file. The interpreter is started in the
+# background with the case's stdin, and polled every 10ms until it exits or
+# runs over the time limit (in hundredths of a second, via /proc/uptime) or
+# the memory limit (in kB, like VmHWM). The CPU rlimit is a backstop: SIGXCPU
+# at the soft limit, SIGKILL a second later
+CASE_HARNESS = """\
+ulimit -t {cpu_hard} && ulimit -St {cpu_soft} || exit 125
+exec 3<&0
+{interpreter} "$1" <&3 3<&- &
+exec 3<&-
+pid=$!
+read -r now _ < /proc/uptime
+start=${{now%.*}}${{now#*.}}
+peak=0
+ticks=0
+tle=0
+mle=0
+while :; do
+  state=
+  {{ while read -r key value _; do
+      case $key in State:) state=$value ;; VmHWM:) peak=$value ;; esac
+    done < /proc/$pid/status
+    read -r stat < /proc/$pid/stat; }} 2>/dev/null
+  case $state in ""|Z|X) break ;; esac
+  set -- $stat
+  [ $# -ge 15 ] && ticks=$((${{14}} + ${{15}}))
+  read -r now _ < /proc/uptime
+  if [ $((${{now%.*}}${{now#*.}} - start)) -gt {limit_cs} ]; then
+    kill -9 $pid; tle=1; break
+  fi
+  if [ "${{peak:-0}}" -gt {limit_kb} ]; then
+    kill -9 $pid; mle=1; break
+  fi
+  sleep 0.01
+done
+wait $pid
+rc=$?
+printf '\\n{marker} %s %s %s %s %s\\n' "$rc" "$tle" "$mle" "$peak" "$ticks" >&2
+"""
+
+
+def judge_setting(name):
+    return getattr(settings, "EXECUTION_JUDGE", {}).get(name, JUDGE_DEFAULTS[name])
+
+
+def task_time_limit():
+    """Worst case for a full batch, for Celery's hard time limit."""
+    rounds = math.ceil(judge_setting("MAX_CASES") / judge_setting("CPUS"))
+    return rounds * (judge_setting("MAX_TIME_LIMIT") + 5) + 60
+
+
+def cpu_limit(time_limit):
+    """Soft CPU rlimit in seconds; the hard one is a second above it."""
+    return math.ceil(time_limit) + 1  # backstop for the wall-clock check
+
+
+def case_script(interpreter, time_limit, memory_limit, marker):
+    return CASE_HARNESS.format(
+        cpu_soft=cpu_limit(time_limit),
+        cpu_hard=cpu_limit(time_limit) + 1,
+        interpreter=interpreter,
+        limit_cs=int(time_limit * 100),
+        limit_kb=memory_limit // 1024,
+        marker=marker,
+    )
+
+
+def outputs_match(actual, expected, comparison):
+    if comparison == EXACT:
+        return actual == expected
+
+    def lines(text):
+        return [line.rstrip() for line in text.rstrip().splitlines()]
+
+    return lines(actual) == lines(expected)
+
+
+def _split_report(stderr, marker):
+    index = stderr.rfind(("\n" + marker).encode())
+    if index == -1:
+        return stderr, None
+    fields = stderr[index + len(marker) + 1 :].split()
+    try:
+        rc, tle, mle, peak_kb, ticks = (int(field) for field in fields[:5])
+    except ValueError:
+        return stderr[:index], None
+    return stderr[:index], {
+        "exit_code": rc,
+        "timed_out": bool(tle),
+        "memory_exceeded": bool(mle),
+        "memory_bytes": peak_kb * 1024,
+        "cpu_time_ms": round(ticks * 1000 / CLOCK_TICKS),
+    }
+
+
+def _run_case(
+    container_id, interpreter, program, case, time_limit, memory_limit, comparison
+):
+    marker = new_marker()
+    capture = BoundedCapture(limit=judge_setting("MAX_OUTPUT_BYTES"), tail=256)
+    outcome = {"verdict": None, "time_ms": None}
+    started = time.monotonic()
+    try:
+        exit_code, stdout, stderr = get_client().exec_run(
+            container_id,
+            [
+                "sh",
+                "-c",
+                case_script(interpreter, time_limit, memory_limit, marker),
+                "sh",
+                program,
+            ],
+            stdin=case["stdin"].encode("utf-8"),
+            # the harness enforces the limit; this only catches a stuck harness
+            timeout=time_limit + 10,
+            capture=capture,
+        )
+    except TimeoutError:
+        outcome["verdict"] = TIME_LIMIT_EXCEEDED
+        return outcome
+    except OutputLimitExceeded:
+        outcome["verdict"] = OUTPUT_LIMIT_EXCEEDED
+        return outcome
+    finally:
+        outcome["time_ms"] = round((time.monotonic() - started) * 1000, 1)
+
+    stderr, report = _split_report(stderr, marker)
+    stdout = stdout.decode("utf-8", errors="replace")
+    outcome["stdout"] = stdout
+    outcome["stderr"] = stderr.decode("utf-8", errors="replace")
+    if report is None:
+        # the harness itself was killed, e.g. by the container's OOM killer
+        outcome.update(verdict=RUNTIME_ERROR, exit_code=exit_code)
+        return outcome
+    outcome.update(report)
+    rc = report["exit_code"]
+    timed_out = report.pop("timed_out")
+    memory_exceeded = report.pop("memory_exceeded")
+    if rc == 128 + 9 and not (timed_out or memory_exceeded):
+        # a SIGKILL the harness did not send: the hard CPU rlimit, after a
+        # SIGXCPU the program caught, or else the container's OOM killer
+        if report["cpu_time_ms"] >= cpu_limit(time_limit) * 1000:
+            timed_out = True
+        else:
+            memory_exceeded = True
+    if timed_out or rc == 128 + 24:  # SIGXCPU
+        outcome["verdict"] = TIME_LIMIT_EXCEEDED
+    elif memory_exceeded or report["memory_bytes"] > memory_limit:
+        outcome["verdict"] = MEMORY_LIMIT_EXCEEDED
+    elif rc != 0:
+        outcome["verdict"] = RUNTIME_ERROR
+    elif capture.truncated or not outputs_match(
+        stdout, case["expected_output"], comparison
+    ):
+        outcome["verdict"] = WRONG_ANSWER
+    else:
+        outcome["verdict"] = ACCEPTED
+    return outcome
+
+
+def run_judge(
+    image_name,
+    interpreter,
+    file_extension,
+    host_config,
+    code,
+    cases,
+    time_limit,
+    memory_limit,
+    comparison=LINES,
+    stop_on_failure=False,
+):
+    """Run `code` against every case; returns the per-case outcomes in order."""
+    client = get_client()
+    cpus = judge_setting("CPUS")
+    program = f"/app/script.{file_extension}"
+    container_id = client.create_container(
+        {
+            "Image": image_name,
+            "Entrypoint": ["sleep"],
+            "Cmd": ["infinity"],
+            "Labels": execution_labels(JUDGE),
+            "HostConfig": {
+                **host_config,
+                "NanoCpus": cpus * 1_000_000_000,
+                "Memory": judge_setting("MEMORY"),
+            },
+        },
+        name=f"executor-judge-{uuid.uuid4().hex[:12]}",
+    )
+    try:
+        client.start_container(container_id)
+        code_bytes = code.encode("utf-8")
+        exit_code, _, stderr = client.exec_run(
+            container_id,
+            ["sh", "-c", f"head -c {len(code_bytes)} > {program}"],
+            stdin=code_bytes,
+        )
+        if exit_code != 0:
+            raise DockerError(exit_code, stderr.decode(errors="replace"))
+
+        failed = threading.Event()
+
+        def judge_case(case):
+            if stop_on_failure and failed.is_set():
+                return {"verdict": SKIPPED}
+            outcome = _run_case(
+                container_id,
+                interpreter,
+                program,
+                case,
+                time_limit,
+                memory_limit,
+                comparison,
+            )
+            if outcome["verdict"] != ACCEPTED:
+                failed.set()
+            return outcome
+
+        with ThreadPoolExecutor(max_workers=cpus) as executor:
+            outcomes = list(executor.map(judge_case, cases))
+    finally:
+        client.remove_container(container_id)
+
+    for index, outcome in enumerate(outcomes):
+        outcome["case"] = index
+        if outcome["verdict"] in (ACCEPTED, SKIPPED):
+            # only failing cases carry their output, to keep results small
+            outcome.pop("stdout", None)
+            outcome.pop("stderr", None)
+    return outcomes
+
+
+def summarize(outcomes):
+    """Overall verdict: accepted, or the verdict of the first failing case."""
+    passed = sum(outcome["verdict"] == ACCEPTED for outcome in outcomes)
+    verdict = next(
+        (o["verdict"] for o in outcomes if o["verdict"] not in (ACCEPTED, SKIPPED)),
+        ACCEPTED,
+    )
+    return {"verdict": verdict, "passed": passed, "total": len(outcomes)}
@@ -0,0 +1,177 @@
+# editor/languages.py
+"""
+Language registry: one resource profile per language (EXECUTION_LANGUAGES).
+
+A profile names the image, the entrypoint and the file extension, and sets
+the run limits (wall-clock and CPU time, memory, CPUs, processes), the warm
+pool size and the concurrency of the language's queues. Fields a profile
+leaves out come from the "default" entry, then from PROFILE_DEFAULTS.
+Compiled languages also set SOURCE and COMPILE, and their entrypoint runs
+the artifact (see editor.compiled).
+
+The registry is built and validated once per process. Workers also pin it at
+start: every image is resolved to its local id, languages whose image is
+missing are dropped with an error, and containers are then created from the
+pinned id. A rebuilt image is picked up on the next worker restart, and a
+request never pays for an image lookup.
+"""
+import logging
+import threading
+
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from django.core.signals import setting_changed
+from django.dispatch import receiver
+
+from .docker_client import DockerError, NotFound, get_client
+
+logger = logging.getLogger(__name__)
+
+PROFILE_DEFAULTS = {
+    "WALL_TIME": 40,  # seconds before the container is killed
+    "CPU_TIME": 10,  # CPU seconds before the kernel kills the program
+    "MEMORY": 128 * 1024 * 1024,
+    "CPUS": 0.5,
+    "PIDS": 64,  # processes and threads in the container
+    "POOL_MIN_SIZE": None,  # None: EXECUTOR_POOL's MIN_SIZE / MAX_SIZE
+    "POOL_MAX_SIZE": None,
+    "QUEUE": {"interactive": 1, "batch": 1},  # worker concurrency per lane
+}
+
+REQUIRED_FIELDS = ("IMAGE", "ENTRYPOINT")
+
+
+class Language:
+    """A validated registry entry."""
+
+    def __init__(self, name, profile):
+        self.name = name
+        self.image = profile["IMAGE"]
+        self.entrypoint = profile["ENTRYPOINT"]
+        self.extension = profile.get("EXTENSION")
+        self.source = profile.get("SOURCE")
+        self.compile = profile.get("COMPILE")
+        self.limits = {
+            "WALL_TIME": profile["WALL_TIME"],
+            "CPU_TIME": profile["CPU_TIME"],
+        }
+        self.memory = profile["MEMORY"]
+        self.cpus = profile["CPUS"]
+        self.pids = profile["PIDS"]
+        self.pool_min_size = profile["POOL_MIN_SIZE"]
+        self.pool_max_size = profile["POOL_MAX_SIZE"]
+        self.queue = dict(profile["QUEUE"])
+        self.digest = None  # local image id, once pinned
+
+    @property
+    def compiled(self):
+        return self.compile is not None
+
+    @property
+    def container_image(self):
+        """What containers are created from: the pinned id, else the tag."""
+        return self.digest or self.image
+
+    @property
+    def host_config(self):
+        """Engine API HostConfig for one-off and pooled run containers."""
+        return {
+            "NetworkMode": "none",  # IMPORTANT: Disable network access for security
+            "Memory": self.memory,
+            "NanoCpus": int(self.cpus * 1_000_000_000),
+            "PidsLimit": self.pids,
+            # Nothing on the host is mounted: the image is read-only and the
+            # code is written to in-memory scratch space, so no disk I/O per
+            # request and the daemon may live on another host. A compiled
+            # artifact must be executable from /app
+            "ReadonlyRootfs": True,
+            "Tmpfs": {
+                "/app": "rw,exec,size=64m" if self.compiled else "rw,size=16m",
+                "/tmp": "rw,size=16m",
+            },
+        }
+
+
+def _check(name, profile):
+    for field in REQUIRED_FIELDS:
+        if not profile.get(field):
+            raise ImproperlyConfigured(f"EXECUTION_LANGUAGES['{name}'] needs {field}")
+    if profile.get("COMPILE"):
+        if not profile.get("SOURCE"):
+            raise ImproperlyConfigured(
+                f"EXECUTION_LANGUAGES['{name}'] compiles, so it needs SOURCE"
+            )
+    elif not profile.get("EXTENSION"):
+        raise ImproperlyConfigured(f"EXECUTION_LANGUAGES['{name}'] needs EXTENSION")
+    for field in ("WALL_TIME", "CPU_TIME", "MEMORY", "CPUS", "PIDS"):
+        value = profile[field]
+        if not isinstance(value, (int, float)) or value <= 0:
+            raise ImproperlyConfigured(
+                f"EXECUTION_LANGUAGES['{name}']['{field}'] must be a positive number"
+            )
+    if profile["CPU_TIME"] > profile["WALL_TIME"]:
+        raise ImproperlyConfigured(
+            f"EXECUTION_LANGUAGES['{name}']: CPU_TIME is longer than WALL_TIME"
+        )
+
+
+def build_registry(config):
+    """Validate EXECUTION_LANGUAGES; returns {name: Language}."""
+    base = {**PROFILE_DEFAULTS, **config.get("default", {})}
+    registry = {}
+    for name, profile in config.items():
+        if name == "default":
+            continue
+        profile = {**base, **profile}
+        _check(name, profile)
+        registry[name] = Language(name, profile)
+    return registry
+
+
+_registry = None
+_registry_lock = threading.Lock()
+
+
+def get_languages():
+    global _registry
+    with _registry_lock:
+        if _registry is None:
+            _registry = build_registry(getattr(settings, "EXECUTION_LANGUAGES", {}))
+        return _registry
+
+
+def get_language(name):
+    """Return the Language called `name`, or None if it is not supported."""
+    return get_languages().get(name.lower())
+
+
+def pin_images():
+    """Resolve every image to its local id; drops languages without one."""
+    global _registry
+    client = get_client()
+    registry = dict(get_languages())
+    for name, language in list(registry.items()):
+        try:
+            language.digest = client.inspect_image(language.image)["Id"]
+        except NotFound:
+            logger.error(
+                "Image %s for %s is not present; %s is disabled on this worker",
+                language.image,
+                name,
+                name,
+            )
+            del registry[name]
+        except (DockerError, OSError) as e:
+            # the daemon is unreachable; runs will fail with a clear error anyway
+            logger.warning("Could not pin image %s: %s", language.image, e)
+    with _registry_lock:
+        _registry = registry
+    return registry
+
+
+@receiver(setting_changed)
+def reset_registry(setting, **kwargs):
+    global _registry
+    if setting == "EXECUTION_LANGUAGES":
+        with _registry_lock:
+            _registry = None
@@ -0,0 +1,82 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from editor.backends import backend_paths
+from editor.benchmark import run_benchmark, write_report
+
+
+class Command(BaseCommand):
+    help = (
+        "Load-test code execution at several concurrency levels and report "
+        "latency percentiles and throughput."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--target",
+            choices=("api", "task"),
+            default="api",
+            help="Drive the HTTP endpoint (with polling) or the execute_code task.",
+        )
+        parser.add_argument(
+            "--backend",
+            choices=sorted(backend_paths()),
+            default="fake",
+            help="Sandbox to run snippets in; 'fake' needs no Docker.",
+        )
+        parser.add_argument(
+            "--eager",
+            action="store_true",
+            help="Run tasks in-process with an in-memory result backend "
+            "(no broker or worker needed).",
+        )
+        parser.add_argument(
+            "--concurrency",
+            default="1,4,16",
+            help="Comma-separated concurrency levels.",
+        )
+        parser.add_argument(
+            "--requests", type=int, default=100, help="Requests per level."
+        )
+        parser.add_argument("--warmup", type=int, default=5)
+        parser.add_argument("--language", default="python")
+        parser.add_argument("--code", default="print(input())")
+        parser.add_argument("--stdin", default="hello\n")
+        parser.add_argument("--output", help="Write the report as JSON to this file.")
+
+    def handle(self, *args, **options):
+        try:
+            levels = [int(level) for level in options["concurrency"].split(",")]
+        except ValueError:
+            raise CommandError("--concurrency must be a list like 1,4,16")
+        payload = {
+            "code": options["code"],
+            "language": options["language"],
+            "stdin": options["stdin"],
+            # every request must reach the executor, not the result cache
+            "cache": False,
+        }
+        report = run_benchmark(
+            options["target"],
+            options["backend"],
+            options["eager"],
+            payload,
+            levels,
+            options["requests"],
+            warmup=options["warmup"],
+        )
+
+        self.stdout.write(
+            f"{'conc':>5} {'reqs':>6} {'errors':>6} {'rps':>9} "
+            f"{'p50':>9} {'p95':>9} {'p99':>9} {'max':>9}"
+        )
+        for level in report["results"]:
+            latency = level["latency_ms"]
+            self.stdout.write(
+                f"{level['concurrency']:>5} {level['requests']:>6} "
+                f"{level['errors']:>6} {level['throughput_rps']:>9} "
+                f"{latency['p50']:>9} {latency['p95']:>9} "
+                f"{latency['p99']:>9} {latency['max']:>9}"
+            )
+        if options["output"]:
+            write_report(report, options["output"])
+            self.stdout.write(f"Report written to {options['output']}")
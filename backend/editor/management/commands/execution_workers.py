@@ -0,0 +1,33 @@
+from django.core.management.base import BaseCommand
+
+from editor.queues import LANES, execution_queue, execution_queues
+
+
+class Command(BaseCommand):
+    help = "Print one Celery worker command per execution queue (EXECUTION_LANGUAGES)."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--loglevel", default="info", help="Celery log level for every worker."
+        )
+
+    def handle(self, *args, **options):
+        loglevel = options["loglevel"]
+        # everything that is not routed by language (e.g. unknown languages)
+        self.stdout.write(
+            f"celery -A core worker -l {loglevel} -Q celery -c 1 -n default@%h"
+        )
+        # password reset emails (accounts.tasks), mostly waiting on SMTP
+        self.stdout.write(
+            f"celery -A core worker -l {loglevel} -Q email -c 2 -n email@%h"
+        )
+        for language, lanes in execution_queues().items():
+            for lane in LANES:
+                concurrency = lanes.get(lane, 0)
+                if not concurrency:
+                    continue
+                self.stdout.write(
+                    f"celery -A core worker -l {loglevel} "
+                    f"-Q {execution_queue(language, lane)} -c {concurrency} "
+                    f"-n {language}-{lane}@%h"
+                )
@@ -0,0 +1,271 @@
+# editor/metrics.py
+"""
+Prometheus metrics for the execution service.
+
+Workers record every execution task from task_postrun. The task's result
+is what is measured: per language, the status (which counts timeouts, OOM
+kills and truncated output), queue wait, container start and run time.
+Counters and histogram buckets are kept in Redis, so every worker process
+adds to the same series and nothing is lost when a process is recycled.
+Warm-pool occupancy lives in each worker process and is published to a
+short-lived key per process.
+
+GET /api/v1/editor/metrics renders all of it in the Prometheus text format,
+with queue depth and result cache totals read at scrape time. Only staff, or
+a scraper sending TOKEN as a bearer token, may read it.
+"""
+import hmac
+import json
+import logging
+import os
+import time
+
+from celery.signals import task_postrun
+from django.conf import settings
+from rest_framework.permissions import BasePermission
+
+from .cache import get_client, stats as cache_stats
+from .pool import pool_stats
+from .queues import EXECUTION_TASKS, queue_stats
+
+logger = logging.getLogger(__name__)
+
+METRICS_DEFAULTS = {
+    "ENABLED": True,
+    "POOL_PUBLISH_INTERVAL": 5,  # seconds between pool occupancy updates
+    "TOKEN": None,  # bearer token for the scraper; staff only without one
+}
+
+# Histogram buckets, in seconds
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+COUNTER = "counter"
+HISTOGRAM = "histogram"
+GAUGE = "gauge"
+
+# name -> (type, help)
+METRICS = {
+    "editor_executions_total": (
+        COUNTER,
+        "Executions finished, by language and status.",
+    ),
+    "editor_output_truncated_total": (
+        COUNTER,
+        "Executions whose output was cut to the stored limit.",
+    ),
+    "editor_execution_run_seconds": (
+        HISTOGRAM,
+        "Wall-clock time of the program, by language.",
+    ),
+    "editor_queue_wait_seconds": (
+        HISTOGRAM,
+        "Time between publishing an execution and a worker starting it.",
+    ),
+    "editor_container_start_seconds": (
+        HISTOGRAM,
+        "Time to get a container, by language and whether it came warm.",
+    ),
+    "editor_compile_seconds": (
+        HISTOGRAM,
+        "Compile step of compiled languages, including artifact cache hits.",
+    ),
+}
+
+PREFIX = "metrics"
+POOL_KEY = f"{PREFIX}:pool:{{process}}"
+
+_last_pool_publish = 0.0
+
+
+def metrics_setting(name):
+    return getattr(settings, "EXECUTION_METRICS", {}).get(
+        name, METRICS_DEFAULTS[name]
+    )
+
+
+def _key(name):
+    return f"{PREFIX}:{name}"
+
+
+def _field(suffix, labels):
+    return json.dumps([suffix, sorted(labels.items())])
+
+
+def inc(pipe, name, labels, amount=1):
+    pipe.hincrbyfloat(_key(name), _field("", labels), amount)
+
+
+def observe(pipe, name, labels, seconds):
+    bucket = next((b for b in BUCKETS if seconds <= b), "+Inf")
+    pipe.hincrby(_key(name), _field(str(bucket), labels), 1)
+    pipe.hincrby(_key(name), _field("count", labels), 1)
+    pipe.hincrbyfloat(_key(name), _field("sum", labels), seconds)
+
+
+def record_execution(pipe, language, result):
+    """Queue the updates for one execution result on `pipe`."""
+    labels = {"language": language}
+    inc(pipe, "editor_executions_total", {**labels, "status": result.get("status")})
+    if result.get("truncated") or result.get("status") == "truncated":
+        inc(pipe, "editor_output_truncated_total", labels)
+    metrics = result.get("metrics") or {}
+    for name, field in (
+        ("editor_execution_run_seconds", "run_wall_ms"),
+        ("editor_queue_wait_seconds", "queue_wait_ms"),
+        ("editor_compile_seconds", "compile_ms"),
+    ):
+        if metrics.get(field) is not None:
+            observe(pipe, name, labels, metrics[field] / 1000)
+    if metrics.get("container_start_ms") is not None:
+        observe(
+            pipe,
+            "editor_container_start_seconds",
+            {**labels, "warm": str(bool(metrics.get("warm_container"))).lower()},
+            metrics["container_start_ms"] / 1000,
+        )
+
+
+def publish_pool_stats(pipe, node):
+    """Queue this process's warm-pool occupancy, at most every few seconds."""
+    global _last_pool_publish
+    interval = metrics_setting("POOL_PUBLISH_INTERVAL")
+    now = time.monotonic()
+    if now - _last_pool_publish < interval:
+        return
+    _last_pool_publish = now
+    key = POOL_KEY.format(process=f"{node}:{os.getpid()}")
+    pipe.set(key, json.dumps(pool_stats()), ex=max(interval * 6, 60))
+
+
+@task_postrun.connect
+def record_task(task=None, args=None, kwargs=None, retval=None, state=None, **kw):
+    if task is None or task.name not in EXECUTION_TASKS:
+        return
+    if not metrics_setting("ENABLED"):
+        return
+    language = (kwargs or {}).get("language") or (
+        args[1] if args and len(args) > 1 else ""
+    )
+    if state != "SUCCESS" or not isinstance(retval, dict):
+        # crashed or hit Celery's time limit
+        retval = {"status": "failed"}
+    try:
+        with get_client().pipeline(transaction=False) as pipe:
+            record_execution(pipe, str(language).lower(), retval)
+            publish_pool_stats(pipe, task.request.hostname or "worker")
+            pipe.execute()
+    except Exception as e:
+        # metrics must never fail an execution
+        logger.warning("Could not record execution metrics: %s", e)
+
+
+# -- exposition ---------------------------------------------------------------
+
+
+class HasMetricsToken(BasePermission):
+    """The request carries `Authorization: Bearer <TOKEN>`."""
+
+    def has_permission(self, request, view):
+        token = metrics_setting("TOKEN")
+        if not token:
+            return False
+        header = request.META.get("HTTP_AUTHORIZATION", "")
+        scheme, _, credentials = header.partition(" ")
+        return scheme.lower() == "bearer" and hmac.compare_digest(
+            credentials.strip().encode(), token.encode()
+        )
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _labels(labels):
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape(value)}"' for name, value in labels) + "}"
+
+
+def _number(value):
+    return str(int(value)) if value == int(value) else repr(value)
+
+
+def _header(lines, name, kind, help_text):
+    lines.append(f"# HELP {name} {help_text}")
+    lines.append(f"# TYPE {name} {kind}")
+
+
+def _render_counter(lines, name, fields):
+    for field, value in sorted(fields.items()):
+        _, labels = json.loads(field)
+        lines.append(f"{name}{_labels(labels)} {_number(float(value))}")
+
+
+def _render_histogram(lines, name, fields):
+    series = {}
+    for field, value in fields.items():
+        suffix, labels = json.loads(field)
+        series.setdefault(json.dumps(labels), {})[suffix] = float(value)
+    for labels_json, values in sorted(series.items()):
+        labels = [tuple(pair) for pair in json.loads(labels_json)]
+        cumulative = 0
+        for bucket in [*BUCKETS, "+Inf"]:
+            cumulative += values.get(str(bucket), 0)
+            le = labels + [("le", bucket)]
+            lines.append(f"{name}_bucket{_labels(le)} {_number(cumulative)}")
+        lines.append(f"{name}_sum{_labels(labels)} {_number(values.get('sum', 0))}")
+        lines.append(f"{name}_count{_labels(labels)} {_number(values.get('count', 0))}")
+
+
+def _render_gauges(lines):
+    queues = queue_stats()
+    _header(lines, "editor_queue_depth", GAUGE, "Executions waiting per queue.")
+    for queue, stats in sorted(queues.items()):
+        labels = _labels([("queue", queue)])
+        lines.append(f"editor_queue_depth{labels} {stats['depth']}")
+
+    client = get_client()
+    pools = {}
+    for key in client.scan_iter(match=POOL_KEY.format(process="*"), count=100):
+        for language, stats in json.loads(client.get(key) or "{}").items():
+            totals = pools.setdefault(language, {"idle": 0, "live": 0})
+            totals["idle"] += stats["idle"]
+            totals["live"] += stats["live"]
+    _header(
+        lines,
+        "editor_pool_containers",
+        GAUGE,
+        "Warm containers across worker processes, by language and state.",
+    )
+    for language, totals in sorted(pools.items()):
+        for state in ("idle", "live"):
+            labels = _labels([("language", language), ("state", state)])
+            lines.append(f"editor_pool_containers{labels} {totals[state]}")
+
+    cache = cache_stats()
+    _header(lines, "editor_cache_lookups_total", COUNTER, "Result cache lookups.")
+    for result, count in (("hit", cache["hits"]), ("miss", cache["misses"])):
+        labels = _labels([("result", result)])
+        lines.append(f"editor_cache_lookups_total{labels} {count}")
+    _header(lines, "editor_cache_hit_ratio", GAUGE, "Result cache hits per lookup.")
+    lines.append(f"editor_cache_hit_ratio {cache['hit_ratio']}")
+    _header(lines, "editor_cache_entries", GAUGE, "Results held in the cache.")
+    lines.append(f"editor_cache_entries {cache['entries']}")
+
+
+def render():
+    """Every metric in the Prometheus text exposition format."""
+    client = get_client()
+    lines = []
+    for name, (kind, help_text) in METRICS.items():
+        fields = {
+            field.decode(): value
+            for field, value in client.hgetall(_key(name)).items()
+        }
+        _header(lines, name, kind, help_text)
+        if kind == HISTOGRAM:
+            _render_histogram(lines, name, fields)
+        else:
+            _render_counter(lines, name, fields)
+    _render_gauges(lines)
+    return "\n".join(lines) + "\n"
@@ -0,0 +1,77 @@
+# editor/output.py
+"""
+Bounded capture of a program's stdout and stderr.
+
+Output is consumed frame by frame as the attach/exec stream delivers it.
+Only the first MAX_STREAM_BYTES of each stream and its last TAIL_BYTES are
+kept; the middle is dropped and replaced by a marker. Once a program has
+printed MAX_TOTAL_BYTES in total it is stopped, so neither the worker nor
+the result backend ever holds more than a few kilobytes per run.
+"""
+from django.conf import settings
+
+from .docker_client import STDERR, STDOUT
+
+OUTPUT_DEFAULTS = {
+    "MAX_STREAM_BYTES": 64 * 1024,  # kept from the start of each stream
+    # kept from the end of a truncated stream; also keeps the accounting
+    # line the worker appends to stderr
+    "TAIL_BYTES": 4096,
+    "MAX_TOTAL_BYTES": 8 * 1024 * 1024,  # printed in total before the run is stopped
+}
+
+
+def output_setting(name):
+    return getattr(settings, "EXECUTION_OUTPUT", {}).get(name, OUTPUT_DEFAULTS[name])
+
+
+def truncated_marker(omitted):
+    return f"\n[output truncated: {omitted} bytes omitted]\n".encode()
+
+
+class OutputLimitExceeded(Exception):
+    """The program printed more than MAX_TOTAL_BYTES."""
+
+
+class BoundedCapture:
+    """Sink for RawStream.collect keeping the head and tail of each stream."""
+
+    def __init__(self, limit=None, tail=None, ceiling=None):
+        self.limit = output_setting("MAX_STREAM_BYTES") if limit is None else limit
+        self.tail_bytes = output_setting("TAIL_BYTES") if tail is None else tail
+        self.ceiling = output_setting("MAX_TOTAL_BYTES") if ceiling is None else ceiling
+        self.heads = {STDOUT: bytearray(), STDERR: bytearray()}
+        self.tails = {STDOUT: bytearray(), STDERR: bytearray()}
+        self.dropped = {STDOUT: 0, STDERR: 0}
+        self.written = {STDOUT: 0, STDERR: 0}  # kept or not
+        self.total = 0
+
+    def write(self, stream_id, data):
+        if stream_id not in self.heads:
+            return
+        self.written[stream_id] += len(data)
+        self.total += len(data)
+        head = self.heads[stream_id]
+        room = self.limit - len(head)
+        if room > 0:
+            head.extend(data[:room])
+            data = data[room:]
+        if data:
+            self.dropped[stream_id] += len(data)
+            tail = self.tails[stream_id]
+            tail.extend(data)
+            if len(tail) > self.tail_bytes:
+                del tail[: len(tail) - self.tail_bytes]
+        if self.total > self.ceiling:
+            raise OutputLimitExceeded(f"output exceeded {self.ceiling} bytes")
+
+    @property
+    def truncated(self):
+        return any(self.dropped.values())
+
+    def value(self, stream_id):
+        head, tail = self.heads[stream_id], self.tails[stream_id]
+        dropped = self.dropped[stream_id]
+        if not dropped:
+            return bytes(head)
+        return bytes(head) + truncated_marker(dropped - len(tail)) + bytes(tail)
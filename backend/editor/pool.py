@@ -0,0 +1,254 @@
+# editor/pool.py
+"""
+Warm container pool for code execution.
+
+Instead of creating a container on every request, each worker process keeps a
+few idle, network-isolated containers per language running `sleep`. Snippets
+are run inside them through the Engine API's exec endpoint. A container is
+replaced after MAX_RUNS executions or after any run that left it dirty
+(timeout, stray files or processes).
+"""
+import logging
+import os
+import threading
+import time
+import uuid
+
+from django.conf import settings
+
+from .docker_client import DockerError, get_client
+from .reaper import POOL, execution_labels
+
+logger = logging.getLogger(__name__)
+
+POOL_DEFAULTS = {
+    "ENABLED": True,
+    "MIN_SIZE": 1,  # idle containers kept ready per language
+    "MAX_SIZE": 4,  # live containers (idle + busy) per language
+    "MAX_RUNS": 50,  # executions before a container is recycled
+    "HEALTH_CHECK_INTERVAL": 30,  # seconds between liveness checks
+    "DOCKER_TIMEOUT": 15,  # seconds allowed for a docker housekeeping call
+}
+
+# Paths a snippet is allowed to touch; anything else marks the container dirty
+SCRATCH_PATHS = ("/app", "/tmp")
+
+# Kill anything the snippet left running and wipe the scratch directories
+SCRUB_COMMAND = "kill -9 -1 2>/dev/null; rm -rf /app/* /app/.[!.]* /tmp/* /tmp/.[!.]*; true"
+
+
+def pool_setting(name):
+    return getattr(settings, "EXECUTOR_POOL", {}).get(name, POOL_DEFAULTS[name])
+
+
+class WarmContainer:
+    def __init__(self, name, language):
+        self.name = name
+        self.language = language
+        self.runs = 0
+        self.last_checked = time.monotonic()
+
+    def is_healthy(self):
+        try:
+            state = get_client().inspect_container(self.name)["State"]
+        except (DockerError, OSError):
+            return False
+        self.last_checked = time.monotonic()
+        return state.get("Running", False)
+
+
+class ContainerPool:
+    """Idle containers for one language, owned by a single worker process."""
+
+    def __init__(
+        self, language, image, host_config=None, min_size=None, max_size=None
+    ):
+        self.language = language
+        self.image = image
+        # per-language sizes from the registry, else EXECUTOR_POOL's
+        self.min_size = pool_setting("MIN_SIZE") if min_size is None else min_size
+        self.max_size = pool_setting("MAX_SIZE") if max_size is None else max_size
+        # pooled containers are just as isolated as one-off ones
+        self.host_config = {"NetworkMode": "none", **(host_config or {})}
+        self.lock = threading.Lock()
+        self.idle = []
+        self.live = 0  # idle + checked out + being started
+        self.hits = 0
+        self.misses = 0
+        self.recycled = 0
+        self.failed_starts = 0
+
+    # -- lifecycle -----------------------------------------------------------
+
+    def _start_container(self):
+        name = f"executor-{self.language}-{uuid.uuid4().hex[:12]}"
+        client = get_client()
+        try:
+            client.create_container(
+                {
+                    "Image": self.image,
+                    "Entrypoint": ["sleep"],
+                    "Cmd": ["infinity"],
+                    # lets the reaper find containers of a worker that died
+                    "Labels": execution_labels(POOL),
+                    "HostConfig": self.host_config,
+                },
+                name=name,
+            )
+            client.start_container(name)
+        except (DockerError, OSError) as e:
+            logger.warning("Could not start warm %s container: %s", self.language, e)
+            self._remove_container(WarmContainer(name, self.language))
+            return None
+        return WarmContainer(name, self.language)
+
+    def _remove_container(self, container):
+        try:
+            get_client().remove_container(container.name)
+        except (DockerError, OSError) as e:
+            logger.warning("Could not remove container %s: %s", container.name, e)
+
+    def _grow(self, count):
+        for _ in range(count):
+            container = self._start_container()
+            with self.lock:
+                if container is None:
+                    self.live -= 1
+                    self.failed_starts += 1
+                else:
+                    self.idle.append(container)
+
+    def fill(self, wait=False):
+        """Start containers in the background until MIN_SIZE are idle."""
+        with self.lock:
+            wanted = self.min_size - len(self.idle)
+            wanted = min(wanted, self.max_size - self.live)
+            if wanted <= 0:
+                return
+            self.live += wanted
+        if wait:
+            self._grow(wanted)
+        else:
+            threading.Thread(target=self._grow, args=(wanted,), daemon=True).start()
+
+    def acquire(self):
+        """Return a healthy idle container, or None on a pool miss."""
+        interval = pool_setting("HEALTH_CHECK_INTERVAL")
+        while True:
+            with self.lock:
+                if not self.idle:
+                    self.misses += 1
+                    # grow towards MAX_SIZE so the next request is a hit
+                    if self.live < self.max_size:
+                        self.live += 1
+                        threading.Thread(
+                            target=self._grow, args=(1,), daemon=True
+                        ).start()
+                    return None
+                container = self.idle.pop()
+            if time.monotonic() - container.last_checked < interval or (
+                container.is_healthy()
+            ):
+                with self.lock:
+                    self.hits += 1
+                return container
+            logger.info("Dropping unhealthy warm container %s", container.name)
+            self._discard(container)
+
+    def release(self, container, dirty=False):
+        """Hand a container back after a run; scrubbing happens off the hot path."""
+        container.runs += 1
+        if dirty or container.runs >= pool_setting("MAX_RUNS"):
+            self._discard(container)
+            self.fill()
+            return
+        threading.Thread(target=self._scrub, args=(container,), daemon=True).start()
+
+    def _scrub(self, container):
+        client = get_client()
+        try:
+            client.exec_run(
+                container.name,
+                ["sh", "-c", SCRUB_COMMAND],
+                timeout=pool_setting("DOCKER_TIMEOUT"),
+            )
+            changes = client.container_changes(container.name)
+        except (DockerError, OSError, TimeoutError):
+            self._discard(container)
+            self.fill()
+            return
+        if _touched_outside_scratch(change["Path"] for change in changes):
+            self._discard(container)
+            self.fill()
+            return
+        with self.lock:
+            self.idle.append(container)
+
+    def _discard(self, container):
+        with self.lock:
+            self.live -= 1
+            self.recycled += 1
+        threading.Thread(
+            target=self._remove_container, args=(container,), daemon=True
+        ).start()
+
+    def drain(self):
+        with self.lock:
+            idle, self.idle = self.idle, []
+            self.live -= len(idle)
+        for container in idle:
+            self._remove_container(container)
+
+    def stats(self):
+        with self.lock:
+            return {
+                "language": self.language,
+                "idle": len(self.idle),
+                "live": self.live,
+                "hits": self.hits,
+                "misses": self.misses,
+                "recycled": self.recycled,
+                "failed_starts": self.failed_starts,
+            }
+
+
+def _touched_outside_scratch(changed_paths):
+    for path in changed_paths:
+        if path in SCRATCH_PATHS:
+            continue
+        if not any(path.startswith(scratch + "/") for scratch in SCRATCH_PATHS):
+            return True
+    return False
+
+
+# Pools are per process: a forked Celery child must not reuse its parent's
+_pools = {}
+_pools_pid = None
+_pools_lock = threading.Lock()
+
+
+def get_pool(language, image, host_config=None, min_size=None, max_size=None):
+    global _pools, _pools_pid
+    with _pools_lock:
+        if _pools_pid != os.getpid():
+            _pools, _pools_pid = {}, os.getpid()
+        pool = _pools.get(language)
+        if pool is None:
+            pool = _pools[language] = ContainerPool(
+                language, image, host_config, min_size, max_size
+            )
+            pool.fill()
+        return pool
+
+
+def drain_pools():
+    with _pools_lock:
+        pools = list(_pools.values()) if _pools_pid == os.getpid() else []
+    for pool in pools:
+        pool.drain()
+
+
+def pool_stats():
+    with _pools_lock:
+        pools = list(_pools.values()) if _pools_pid == os.getpid() else []
+    return {pool.language: pool.stats() for pool in pools}
@@ -0,0 +1,132 @@
+# editor/queues.py
+"""
+Per-language Celery queues with priority lanes.
+
+Every language gets one queue per lane, e.g. `execute.python.interactive` and
+`execute.python.batch`, so a slow Ruby job never sits in front of a Python
+one and long judge runs never delay someone pressing Run. Each queue is
+consumed by its own worker with the concurrency set in the language's
+registry profile (EXECUTION_LANGUAGES "QUEUE"); see
+`python manage.py execution_workers` for the command lines.
+
+Within a queue, executions carry a broker priority for fair share across
+users (see editor.admission); the Redis transport keeps one list per step.
+"""
+import time
+
+import redis
+from celery.signals import before_task_publish, task_prerun
+from django.conf import settings
+
+from .languages import get_languages
+
+INTERACTIVE = "interactive"
+BATCH = "batch"
+LANES = (INTERACTIVE, BATCH)
+
+# Tasks routed by language; anything else goes to Celery's default queue
+EXECUTION_TASKS = (
+    "editor.tasks.execute_code",
+    "editor.tasks.stream_code",
+    "editor.tasks.judge_code",
+    "editor.tasks.run_session_cell",
+)
+
+WAIT_STATS_KEY = "execqueue:wait:{queue}"
+
+_client = None
+
+
+def get_client():
+    global _client
+    if _client is None:
+        _client = redis.Redis.from_url(settings.CELERY_BROKER_URL)
+    return _client
+
+
+def execution_queues():
+    """Worker concurrency per lane for every language in the registry."""
+    return {name: language.queue for name, language in get_languages().items()}
+
+
+def execution_queue(language, lane=INTERACTIVE):
+    """Queue name for a language and lane, or None for unknown languages."""
+    language = language.lower()
+    if language not in execution_queues() or lane not in LANES:
+        return None
+    return f"execute.{language}.{lane}"
+
+
+def consumed_languages(app):
+    """Languages whose queues this worker consumes (all of them without -Q)."""
+    consume_from = app.amqp.queues.consume_from
+    if not consume_from:
+        return set(execution_queues())
+    return {
+        language
+        for language in execution_queues()
+        if any(execution_queue(language, lane) in consume_from for lane in LANES)
+    }
+
+
+def route_execution(name, args, kwargs, options, task=None, **kw):
+    # listed in CELERY_TASK_ROUTES; an explicit queue= on apply_async wins
+    if name not in EXECUTION_TASKS:
+        return None
+    language = kwargs.get("language") or (args[1] if len(args) > 1 else "")
+    queue = execution_queue(language, INTERACTIVE)
+    return {"queue": queue} if queue else None
+
+
+@before_task_publish.connect
+def stamp_enqueue_time(sender=None, headers=None, **kwargs):
+    if sender in EXECUTION_TASKS and headers is not None:
+        headers["enqueued_at"] = time.time()
+
+
+@task_prerun.connect
+def record_queue_wait(sender=None, task=None, **kwargs):
+    if task is None or task.name not in EXECUTION_TASKS:
+        return
+    enqueued_at = getattr(task.request, "enqueued_at", None)
+    if enqueued_at is None:
+        enqueued_at = (task.request.headers or {}).get("enqueued_at")
+    queue = (task.request.delivery_info or {}).get("routing_key")
+    if enqueued_at is None or not queue:
+        return
+    wait_ms = max(0.0, (time.time() - float(enqueued_at)) * 1000)
+    task.request.queue_wait_ms = wait_ms
+    key = WAIT_STATS_KEY.format(queue=queue)
+    with get_client().pipeline() as pipe:
+        pipe.hincrby(key, "count", 1)
+        pipe.hincrbyfloat(key, "total_ms", wait_ms)
+        pipe.hset(key, "last_ms", round(wait_ms, 1))
+        pipe.execute()
+
+
+def queue_stats():
+    """Depth and wait time for every execution queue."""
+    client = get_client()
+    stats = {}
+    for language in execution_queues():
+        for lane in LANES:
+            queue = execution_queue(language, lane)
+            wait = client.hgetall(WAIT_STATS_KEY.format(queue=queue))
+            count = int(wait.get(b"count", 0))
+            total_ms = float(wait.get(b"total_ms", 0))
+            stats[queue] = {
+                "depth": sum(client.llen(name) for name in priority_lists(queue)),
+                "wait_count": count,
+                "wait_avg_ms": round(total_ms / count, 1) if count else 0.0,
+                "wait_last_ms": float(wait.get(b"last_ms", 0)),
+            }
+    return stats
+
+
+def priority_lists(queue):
+    """Redis lists the transport keeps for `queue`, one per priority step."""
+    options = getattr(settings, "CELERY_BROKER_TRANSPORT_OPTIONS", {})
+    sep = options.get("sep", "\x06\x16")
+    return [queue] + [
+        f"{queue}{sep}{step}" for step in options.get("priority_steps", [0])[1:]
+    ]
@@ -0,0 +1,140 @@
+# editor/reaper.py
+"""
+Labels for execution containers and cleanup of the ones that leaked.
+
+Every container the executor starts carries a kind label (run, stream,
+judge, pool or session) and an owner label (host and worker pid). Normally a
+container is removed by the code that started it, but a worker killed by
+Celery's hard time limit, an OOM kill or a crash never gets to run its
+cleanup. The reaper task finds those leftovers:
+
+  run, stream, judge  older than the task's hard time limit, so the task is dead
+  pool                owned by a worker process on this host that is gone
+
+Containers run on the Docker daemon of the worker that started them, so
+every worker reaps its own host on a timer (start_reaper) rather than one
+scheduled task reaping wherever it lands. The same pass removes what dead
+runs left on the host's disk: native sandbox scratch directories and
+half-written compile artifacts (reap_files).
+"""
+import glob
+import logging
+import os
+import shutil
+import socket
+import threading
+import time
+
+from django.conf import settings
+
+from .docker_client import DockerError, get_client
+
+logger = logging.getLogger(__name__)
+
+REAPER_DEFAULTS = {
+    "ENABLED": True,
+    "INTERVAL": 300,  # seconds between passes on each worker host
+}
+
+KIND_LABEL = "editor.execution"
+OWNER_LABEL = "editor.owner"
+
+RUN = "run"
+STREAM = "stream"
+JUDGE = "judge"
+POOL = "pool"
+SESSION = "session"  # reaped by editor.sessions once the session expires
+
+
+def reaper_setting(name):
+    return getattr(settings, "EXECUTION_REAPER", {}).get(name, REAPER_DEFAULTS[name])
+
+
+def execution_labels(kind):
+    """Labels for a container started by this process."""
+    return {KIND_LABEL: kind, OWNER_LABEL: f"{socket.gethostname()}:{os.getpid()}"}
+
+
+def _owner_gone(owner):
+    host, _, pid = (owner or "").rpartition(":")
+    if host != socket.gethostname() or not pid.isdigit():
+        # another host's worker: that host's reaper decides
+        return False
+    try:
+        os.kill(int(pid), 0)
+    except ProcessLookupError:
+        return True
+    except PermissionError:
+        pass
+    return False
+
+
+def reap_orphans(max_ages):
+    """Remove leaked containers; `max_ages` maps run/stream/judge to seconds."""
+    client = get_client()
+    now = time.time()
+    removed = 0
+    for summary in client.list_containers({"label": [KIND_LABEL]}):
+        labels = summary.get("Labels") or {}
+        kind = labels.get(KIND_LABEL)
+        if kind == POOL:
+            orphaned = _owner_gone(labels.get(OWNER_LABEL))
+        elif kind in max_ages:
+            orphaned = now - summary["Created"] > max_ages[kind]
+        else:
+            orphaned = False
+        if not orphaned:
+            continue
+        try:
+            # force-removal kills it first if it is still running
+            client.remove_container(summary["Id"])
+        except (DockerError, OSError) as e:
+            logger.warning("Could not reap container %s: %s", summary["Id"][:12], e)
+            continue
+        logger.info("Reaped orphaned %s container %s", kind, summary["Id"][:12])
+        removed += 1
+    return removed
+
+
+def reap_files(patterns, max_age):
+    """
+    Remove files and directories matching the glob `patterns` that have not
+    changed for `max_age` seconds.
+    """
+    now = time.time()
+    removed = 0
+    for pattern in patterns:
+        for path in glob.glob(pattern):
+            try:
+                if now - os.lstat(path).st_mtime <= max_age:
+                    continue
+                if os.path.isdir(path) and not os.path.islink(path):
+                    shutil.rmtree(path)
+                else:
+                    os.unlink(path)
+            except FileNotFoundError:
+                continue
+            except OSError as e:
+                logger.warning("Could not reap %s: %s", path, e)
+                continue
+            logger.info("Reaped leftover %s", path)
+            removed += 1
+    return removed
+
+
+def start_reaper(reap):
+    """Call `reap` every INTERVAL seconds from a daemon thread."""
+    if not reaper_setting("ENABLED"):
+        return None
+
+    def loop():
+        while True:
+            time.sleep(reaper_setting("INTERVAL"))
+            try:
+                reap()
+            except Exception:
+                logger.exception("Reaper pass failed")
+
+    thread = threading.Thread(target=loop, name="editor-reaper", daemon=True)
+    thread.start()
+    return thread
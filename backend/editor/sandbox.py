@@ -0,0 +1,366 @@
+# editor/sandbox.py
+"""
+Native Linux sandbox backend, for trusted or internal tenants.
+
+Runs the interpreter directly on the worker host instead of in a container.
+`unshare` gives each run its own user, network, PID, IPC, UTS and mount
+namespaces. Inside them the code directory is bind-mounted onto /app of a
+per-language root filesystem (an exported executor image works), which
+pivot_root makes the run's root; the host's is then unmounted, so it cannot
+be reached again the way a chroot can be left by a process that is root in
+its namespace. prlimit caps CPU time, address space (the language's MEMORY
+plus headroom for the runtime), file size and open files. When the
+libseccomp Python bindings are installed, a seccomp filter also blocks
+kernel interfaces a snippet never needs. Both are set by small programs exec'd ahead of unshare, never in the
+forked child of a threaded worker. Starting a run costs a fork and a few
+execs, milliseconds instead of a container create and start.
+
+There is no OOM killer to ask: a run is reported as oom_killed when it
+exits the way its runtime does on hitting the address-space limit, with the
+runtime's out-of-memory message at the end of stderr.
+
+There is no cgroup and a larger kernel surface than in a container, so only
+route trusted code here (EXECUTOR_LANGUAGE_BACKENDS, EXECUTOR_TENANT_BACKENDS).
+"""
+import errno
+import os
+import selectors
+import shlex
+import shutil
+import signal
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+from django.conf import settings
+
+try:
+    import seccomp
+except ImportError:  # optional: python3-seccomp or pyseccomp
+    seccomp = None
+
+from .accounting import build_metrics, log_metrics
+from .docker_client import STDERR, STDOUT
+from .languages import get_language
+from .output import BoundedCapture, OutputLimitExceeded
+from .tasks import (
+    FAILED,
+    LIMIT_ERRORS,
+    TIMED_OUT,
+    TRUNCATED,
+    execution_result,
+    exit_status,
+    unsupported_language,
+)
+
+SANDBOX_DEFAULTS = {
+    "ROOTS": {},  # language -> root filesystem the interpreter is chrooted into
+    # RLIMIT_AS is the language's MEMORY plus this, for the runtime's own
+    # mappings; V8 reserves a lot of address space up front
+    "ADDRESS_SPACE_HEADROOM": {
+        "default": 256 * 1024 * 1024,
+        "javascript": 4 * 1024 * 1024 * 1024,
+    },
+    # how each runtime exits when an allocation fails: an uncaught
+    # MemoryError or NoMemoryError, V8's abort (SIGTRAP or SIGABRT)
+    "OOM_EXIT_CODES": {
+        "python": (1,),
+        "ruby": (1,),
+        "javascript": (128 + 5, 128 + 6),
+    },
+    "FILE_SIZE": 16 * 1024 * 1024,  # largest file a program may write
+    "OPEN_FILES": 64,
+    "SCRATCH_DIR": "/dev/shm",  # per-run code directories, kept in memory
+    "SECCOMP": True,  # refuse to run without the seccomp bindings
+    "CHUNK_SIZE": 65536,  # bytes read from a pipe at a time
+}
+
+# Denied with EPERM, everything else is allowed; unshare, mount and chroot
+# run under the filter too, so those stay available
+BLOCKED_SYSCALLS = (
+    "ptrace",
+    "process_vm_readv",
+    "process_vm_writev",
+    "kexec_load",
+    "init_module",
+    "finit_module",
+    "delete_module",
+    "bpf",
+    "perf_event_open",
+    "keyctl",
+    "add_key",
+    "request_key",
+    "userfaultfd",
+    "swapon",
+    "swapoff",
+    "reboot",
+)
+
+# Loads the filter and execs the rest of argv
+SECCOMP_EXEC = r"""
+import errno, os, sys
+import seccomp
+syscall_filter = seccomp.SyscallFilter(defaction=seccomp.ALLOW)
+for name in %(blocked)r:
+    try:
+        syscall_filter.add_rule(seccomp.ERRNO(errno.EPERM), name)
+    except (RuntimeError, ValueError):
+        pass  # not a syscall on this architecture
+syscall_filter.load()
+os.execvp(sys.argv[1], sys.argv[1:])
+""" % {"blocked": BLOCKED_SYSCALLS}
+
+# What runtimes print when an allocation fails at RLIMIT_AS: Python and Ruby
+# (NoMemoryError, "failed to allocate memory"), V8, and ENOMEM from anything
+OUT_OF_MEMORY = (
+    b"MemoryError",
+    b"failed to allocate memory",
+    b"out of memory",
+    os.strerror(errno.ENOMEM).encode(),
+)
+
+SANDBOX_ENV = {
+    "PATH": "/usr/local/sbin:/usr/local/bin:/usr/sbin:/usr/bin:/sbin:/bin",
+    "HOME": "/app",
+    "LANG": "C.UTF-8",
+}
+
+# $1 scratch directory, $2 root filesystem, then the interpreter command.
+# The root is bind-mounted onto itself (with /proc and /app) to be a mount
+# point, and `pivot_root . .` stacks the old root on it for umount to drop.
+# Not exec'd: as PID 1 of its namespace the interpreter would ignore SIGXCPU
+SANDBOX_SCRIPT = (
+    'mount --bind "$1" "$2/app" && mount --rbind "$2" "$2" && cd "$2" '
+    '&& pivot_root . . && umount -l . || exit 125; shift 2; "$@"'
+)
+
+
+def sandbox_setting(name):
+    return getattr(settings, "NATIVE_SANDBOX", {}).get(name, SANDBOX_DEFAULTS[name])
+
+
+def sandbox_available(language):
+    """Whether this host has a usable root filesystem for `language`."""
+    root = sandbox_setting("ROOTS").get(language)
+    if not root or not os.path.isdir(os.path.join(root, "app")):
+        return False
+    if not all(shutil.which(tool) for tool in ("prlimit", "pivot_root")):
+        return False
+    return seccomp is not None or not sandbox_setting("SECCOMP")
+
+
+def sandbox_command(root, scratch, interpreter, file_extension):
+    return [
+        "unshare",
+        "--user",
+        "--map-root-user",
+        "--net",
+        "--ipc",
+        "--uts",
+        "--mount",
+        "--pid",
+        "--fork",
+        "--kill-child",
+        f"--mount-proc={root}/proc",
+        "sh",
+        "-c",
+        SANDBOX_SCRIPT,
+        "sh",
+        scratch,
+        root,
+        *shlex.split(interpreter),
+        f"/app/script.{file_extension}",
+    ]
+
+
+def limited_command(command, cpu_time, address_space):
+    """
+    `command` behind prlimit (and the seccomp loader), which set the limits
+    in the new process and exec it; inherited by everything below it.
+    """
+    # a preexec_fn would run Python in the child of a threaded worker, where
+    # another thread may have held a lock (logging, malloc) at fork time
+    wrapper = [
+        "prlimit",
+        f"--cpu={cpu_time}:{cpu_time + 1}",
+        f"--fsize={sandbox_setting('FILE_SIZE')}",
+        f"--nofile={sandbox_setting('OPEN_FILES')}",
+        "--core=0",
+    ]
+    if address_space:
+        wrapper.append(f"--as={address_space}")
+    wrapper.append("--")
+    if sandbox_setting("SECCOMP"):
+        wrapper += [sys.executable, "-c", SECCOMP_EXEC]
+    return wrapper + command
+
+
+def address_space_limit(profile):
+    headroom = sandbox_setting("ADDRESS_SPACE_HEADROOM")
+    return profile.memory + headroom.get(profile.name, headroom["default"])
+
+
+def out_of_memory(language, exit_code, stderr):
+    # the runtime's last words are at the end of stderr; the exit code keeps
+    # a program that merely prints them, then fails otherwise, from counting
+    if exit_code not in sandbox_setting("OOM_EXIT_CODES").get(language, ()):
+        return False
+    return any(marker in stderr[-512:] for marker in OUT_OF_MEMORY)
+
+
+def _feed(pipe, data):
+    try:
+        if data:
+            pipe.write(data)
+    except OSError:
+        pass
+    finally:
+        try:
+            pipe.close()
+        except OSError:
+            pass
+
+
+def _kill(process):
+    try:
+        os.killpg(process.pid, signal.SIGKILL)
+    except ProcessLookupError:
+        pass
+    process.wait()
+
+
+def _wait(process, deadline):
+    """Reap the process; returns (exit code, rusage of it and its children)."""
+    while True:
+        pid, status, rusage = os.wait4(process.pid, os.WNOHANG)
+        if pid:
+            process.returncode = os.waitstatus_to_exitcode(status)
+            # same convention as a container: 128 + signal number
+            exit_code = process.returncode
+            return (128 - exit_code if exit_code < 0 else exit_code), rusage
+        if time.monotonic() > deadline:
+            raise TimeoutError("execution deadline exceeded")
+        time.sleep(0.002)
+
+
+def _run(command, stdin, limits, address_space, capture, timings):
+    spawning = time.monotonic()
+    process = subprocess.Popen(
+        limited_command(command, limits["CPU_TIME"], address_space),
+        stdin=subprocess.PIPE,
+        stdout=subprocess.PIPE,
+        stderr=subprocess.PIPE,
+        env=SANDBOX_ENV,
+        start_new_session=True,
+    )
+    started = time.monotonic()
+    timings["container_start_ms"] = round((started - spawning) * 1000, 1)
+    deadline = started + limits["WALL_TIME"]
+    # from a thread, so a program printing before it reads can't deadlock us
+    threading.Thread(target=_feed, args=(process.stdin, stdin), daemon=True).start()
+
+    pipes = {process.stdout: STDOUT, process.stderr: STDERR}
+    selector = selectors.DefaultSelector()
+    for pipe in pipes:
+        selector.register(pipe, selectors.EVENT_READ)
+    chunk_size = sandbox_setting("CHUNK_SIZE")
+    try:
+        while selector.get_map():
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                raise TimeoutError("execution deadline exceeded")
+            for key, _ in selector.select(remaining):
+                data = os.read(key.fd, chunk_size)
+                if not data:
+                    selector.unregister(key.fileobj)
+                    continue
+                capture.write(pipes[key.fileobj], data)
+        return _wait(process, deadline)
+    except BaseException:
+        _kill(process)
+        raise
+    finally:
+        timings["run_wall_ms"] = round((time.monotonic() - started) * 1000, 1)
+        selector.close()
+        process.stdout.close()
+        process.stderr.close()
+
+
+def run_code(code, language, stdin="", queue_wait_ms=None):
+    language = language.lower()
+    profile = get_language(language)
+    root = sandbox_setting("ROOTS").get(language)
+    if profile is None or profile.compiled or root is None:
+        return unsupported_language(language)
+    if sandbox_setting("SECCOMP") and seccomp is None:
+        return execution_result(
+            FAILED,
+            error="The native sandbox needs the libseccomp Python bindings.",
+        )
+    interpreter, file_extension = profile.entrypoint, profile.extension
+    limits = profile.limits
+    timings = {"queue_wait_ms": queue_wait_ms}
+    capture = BoundedCapture()
+
+    result = None
+    try:
+        with tempfile.TemporaryDirectory(
+            prefix="editor-", dir=sandbox_setting("SCRATCH_DIR")
+        ) as scratch:
+            with open(os.path.join(scratch, f"script.{file_extension}"), "wb") as f:
+                f.write(code.encode("utf-8"))
+            exit_code, rusage = _run(
+                sandbox_command(root, scratch, interpreter, file_extension),
+                stdin.encode("utf-8"),
+                limits,
+                address_space_limit(profile),
+                capture,
+                timings,
+            )
+    except TimeoutError:
+        result = execution_result(
+            TIMED_OUT,
+            error=(
+                f"Execution timed out (limit: {limits['WALL_TIME']} seconds). "
+                "Your code took too long."
+            ),
+        )
+    except OutputLimitExceeded:
+        result = execution_result(
+            TRUNCATED,
+            stdout=capture.value(STDOUT).decode("utf-8", errors="replace"),
+            stderr=capture.value(STDERR).decode("utf-8", errors="replace"),
+        )
+    except OSError as e:
+        result = execution_result(
+            FAILED, error=f"Could not start the sandbox: {e.strerror or e}"
+        )
+
+    if result is None:
+        stdout, stderr = capture.value(STDOUT), capture.value(STDERR)
+        usage = {
+            "cpu_time_ms": round((rusage.ru_utime + rusage.ru_stime) * 1000, 1),
+            "peak_memory_bytes": rusage.ru_maxrss * 1024,
+        }
+        timings["oom_killed"] = out_of_memory(language, exit_code, stderr)
+        status = exit_status(exit_code, timings, usage, limits["CPU_TIME"])
+        result = execution_result(
+            status,
+            exit_code=exit_code,
+            stdout=stdout.decode("utf-8", errors="replace"),
+            stderr=stderr.decode("utf-8", errors="replace"),
+            error=LIMIT_ERRORS.get(status, "").format(cpu_time=limits["CPU_TIME"]),
+        )
+        result["metrics"] = build_metrics(
+            timings, usage, capture.written[STDOUT], capture.written[STDERR]
+        )
+        if capture.truncated:
+            result["truncated"] = True
+    else:
+        result["metrics"] = build_metrics(
+            timings, {}, capture.written[STDOUT], capture.written[STDERR]
+        )
+    log_metrics(language, result["status"], result["metrics"])
+    return result
@@ -1,7 +1,82 @@
 # editor/serializers.py
 from rest_framework import serializers
 
+from .judge import COMPARISONS, LINES, judge_setting
+from .queues import LANES, INTERACTIVE
+from .sessions import KERNELS
+
 
 class CodeExecutionSerializer(serializers.Serializer):
     code = serializers.CharField()
     language = serializers.CharField()
+    stdin = serializers.CharField(
+        required=False, default="", allow_blank=True, trim_whitespace=False
+    )
+    # opt out of the result cache for non-deterministic programs (random, time, ...)
+    cache = serializers.BooleanField(default=True)
+    # short runs from the editor vs. long batch/judge runs
+    lane = serializers.ChoiceField(choices=LANES, default=INTERACTIVE)
+    # stream output over /ws/editor/execute/<task_id> instead of polling for it
+    stream = serializers.BooleanField(default=False)
+
+
+class JudgeCaseSerializer(serializers.Serializer):
+    stdin = serializers.CharField(
+        required=False, default="", allow_blank=True, trim_whitespace=False
+    )
+    expected_output = serializers.CharField(allow_blank=True, trim_whitespace=False)
+
+
+class JudgeSerializer(serializers.Serializer):
+    code = serializers.CharField()
+    language = serializers.CharField()
+    cases = JudgeCaseSerializer(many=True, allow_empty=False)
+    # per case, in seconds and megabytes
+    time_limit = serializers.FloatField(default=2.0, min_value=0.1)
+    memory_limit_mb = serializers.IntegerField(default=128, min_value=16)
+    comparison = serializers.ChoiceField(choices=COMPARISONS, default=LINES)
+    # skip the remaining cases once one has failed
+    stop_on_failure = serializers.BooleanField(default=False)
+
+    def validate_cases(self, value):
+        if len(value) > judge_setting("MAX_CASES"):
+            raise serializers.ValidationError(
+                f"At most {judge_setting('MAX_CASES')} cases per request."
+            )
+        return value
+
+    def validate_memory_limit_mb(self, value):
+        # cases share the container, so no one case can have more than it
+        container_mb = judge_setting("MEMORY") // (1024 * 1024)
+        if value > container_mb:
+            raise serializers.ValidationError(
+                f"Ensure this value is less than or equal to {container_mb}."
+            )
+        return value
+
+    def validate_time_limit(self, value):
+        if value > judge_setting("MAX_TIME_LIMIT"):
+            raise serializers.ValidationError(
+                f"Ensure this value is less than or equal to "
+                f"{judge_setting('MAX_TIME_LIMIT')}."
+            )
+        return value
+
+
+class SessionSerializer(serializers.Serializer):
+    language = serializers.CharField()
+
+    def validate_language(self, value):
+        value = value.lower()
+        if value not in KERNELS:
+            raise serializers.ValidationError(
+                f"Sessions are available for: {', '.join(sorted(KERNELS))}."
+            )
+        return value
+
+
+class SessionCellSerializer(serializers.Serializer):
+    code = serializers.CharField(allow_blank=True, trim_whitespace=False)
+    stdin = serializers.CharField(
+        required=False, default="", allow_blank=True, trim_whitespace=False
+    )
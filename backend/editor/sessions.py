@@ -0,0 +1,390 @@
+# editor/sessions.py
+"""
+Session mode: a long-lived interpreter (kernel) per editor session.
+
+A session's first cell starts a container running a small kernel, which
+keeps one namespace alive and runs each cell in it with exec(), REPL style.
+Imports and state survive between cells, so re-running a cell pays neither
+interpreter startup nor imports again. Each cell is a docker exec of a tiny
+client that hands the code and stdin to the kernel over a unix socket in
+/tmp and relays the cell's output back.
+
+The session record lives in Redis and expires after IDLE_TIMEOUT without a
+cell. The worker that started the kernel owns it, and later cells go to that
+worker's direct queue (CELERY_WORKER_DIRECT). A cell running past the wall
+time gets a KeyboardInterrupt, and its session survives; so does one that
+uses up the language's CPU_TIME, which the kernel enforces per cell with
+RLIMIT_CPU. A kernel that dies (e.g. at the MEMORY cap) ends the session.
+The reaper removes kernels whose record is gone, so the record is only ever
+written while it exists, never recreated without its expiry.
+"""
+import logging
+import time
+import uuid
+
+from celery.utils.nodenames import worker_direct
+from django.conf import settings
+
+from .cache import get_client
+from .docker_client import DockerError, NotFound, get_client as get_docker_client
+from .queues import INTERACTIVE, execution_queue
+from .reaper import KIND_LABEL, SESSION, execution_labels
+
+logger = logging.getLogger(__name__)
+
+SESSION_DEFAULTS = {
+    "IDLE_TIMEOUT": 600,  # seconds without a cell before the session ends
+    "MAX_PER_USER": 2,  # open sessions per user (or client address)
+    "MEMORY": 256 * 1024 * 1024,  # cap for the kernel and everything it keeps
+    "INTERRUPT_GRACE": 2,  # seconds a cell gets to stop after an interrupt
+}
+
+SESSION_LABEL = "editor.session"
+
+KEY = "session:{id}"
+OWNER_KEY = "session:owner:{owner}"
+
+SOCKET_PATH = "/tmp/kernel.sock"
+
+# Sets `field` unless another value is there, and restarts the idle clock;
+# 1 if `field` now holds the value, 0 if not, -1 if the session is gone
+CLAIM = """
+if redis.call("EXISTS", KEYS[1]) == 0 then
+    return -1
+end
+redis.call("HSETNX", KEYS[1], ARGV[1], ARGV[2])
+redis.call("EXPIRE", KEYS[1], ARGV[3])
+if redis.call("HGET", KEYS[1], ARGV[1]) == ARGV[2] then
+    return 1
+end
+return 0
+"""
+
+# The kernel: PID 1 of the session container. SIGINT is ignored between
+# cells, so a late interrupt can never take the kernel down. Each cell may
+# use cpu_time more seconds of CPU; past that it gets SIGXCPU, and CPU burnt
+# between cells (a thread a cell left behind) stops the kernel
+PYTHON_KERNEL = r"""
+import io, json, math, os, resource, signal, socket, struct, sys, traceback
+
+class CPUTimeExceeded(BaseException):
+    pass
+
+running = False
+
+def cpu_time_exceeded(signum, frame):
+    if not running:
+        os._exit(128 + signal.SIGXCPU)
+    raise CPUTimeExceeded()
+
+signal.signal(signal.SIGXCPU, cpu_time_exceeded)
+_, cpu_hard = resource.getrlimit(resource.RLIMIT_CPU)
+
+class Channel(io.TextIOBase):
+    def __init__(self, conn, stream):
+        self.conn, self.stream = conn, stream
+    def writable(self):
+        return True
+    def write(self, text):
+        data = text.encode("utf-8", "replace")
+        try:
+            self.conn.sendall(struct.pack(">BI", self.stream, len(data)) + data)
+        except OSError:
+            pass
+        return len(text)
+
+namespace = {"__name__": "__main__"}
+server = socket.socket(socket.AF_UNIX)
+server.bind("%(socket)s")
+server.listen(1)
+# wakes up now and then: signal handlers only run between bytecodes
+server.settimeout(1)
+while True:
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    try:
+        conn, _ = server.accept()
+    except socket.timeout:
+        continue
+    with conn, conn.makefile("rb") as reader:
+        request = json.loads(reader.readline())
+        sys.stdin = io.StringIO(request["stdin"])
+        sys.stdout, sys.stderr = Channel(conn, 1), Channel(conn, 2)
+        status = 0
+        used = sum(resource.getrusage(resource.RUSAGE_SELF)[:2])
+        resource.setrlimit(
+            resource.RLIMIT_CPU, (math.ceil(used) + request["cpu_time"], cpu_hard)
+        )
+        running = True
+        signal.signal(signal.SIGINT, signal.default_int_handler)
+        try:
+            exec(compile(request["code"], "<cell>", "exec"), namespace)
+        except CPUTimeExceeded:
+            status = 128 + signal.SIGXCPU
+        except SystemExit as e:
+            if e.code is None or isinstance(e.code, int):
+                status = e.code or 0
+            else:
+                print(e.code, file=sys.stderr)
+                status = 1
+        except BaseException as e:
+            # leave the kernel's own frame out of the traceback
+            traceback.print_exception(type(e), e, e.__traceback__.tb_next)
+            status = 1
+        finally:
+            signal.signal(signal.SIGINT, signal.SIG_IGN)
+            running = False
+            sys.stdout.flush()
+            sys.stdout, sys.stderr = sys.__stdout__, sys.__stderr__
+        try:
+            conn.sendall(struct.pack(">BI", 0, status & 255))
+        except OSError:
+            pass
+""" % {"socket": SOCKET_PATH}
+
+# One cell: argv[1] is the size of the code, which arrives on stdin ahead of
+# the cell's own stdin, argv[2] its CPU time. Exits with the cell's status, or
+# 137 if the kernel died
+PYTHON_CLIENT = r"""
+import json, socket, struct, sys
+data = sys.stdin.buffer.read()
+size = int(sys.argv[1])
+request = {"code": data[:size].decode("utf-8"),
+           "stdin": data[size:].decode("utf-8", "replace"),
+           "cpu_time": int(sys.argv[2])}
+conn = socket.socket(socket.AF_UNIX)
+conn.connect("%(socket)s")
+conn.sendall(json.dumps(request).encode() + b"\n")
+reader = conn.makefile("rb")
+outputs = {1: sys.stdout.buffer, 2: sys.stderr.buffer}
+while True:
+    header = reader.read(5)
+    if len(header) < 5:
+        sys.exit(137)
+    stream, size = struct.unpack(">BI", header)
+    if stream == 0:
+        sys.exit(size)
+    outputs[stream].write(reader.read(size))
+    outputs[stream].flush()
+""" % {"socket": SOCKET_PATH}
+
+# Waits up to 5s for the kernel to listen
+KERNEL_READY = (
+    f"for i in $(seq 100); do [ -S {SOCKET_PATH} ] && exit 0; sleep 0.05; done; "
+    "exit 1"
+)
+
+# language -> (kernel, cell client), both run by the language's entrypoint
+KERNELS = {"python": (PYTHON_KERNEL, PYTHON_CLIENT)}
+
+
+class SessionLimitExceeded(Exception):
+    pass
+
+
+class SessionExpired(Exception):
+    pass
+
+
+def session_setting(name):
+    return getattr(settings, "EXECUTION_SESSIONS", {}).get(
+        name, SESSION_DEFAULTS[name]
+    )
+
+
+def _decode(record):
+    return {key.decode(): value.decode() for key, value in record.items()}
+
+
+def create_session(owner, language):
+    """Record a new session for `owner`; the kernel starts with the first cell."""
+    client = get_client()
+    owner_key = OWNER_KEY.format(owner=owner)
+    # sessions that expired while idle still sit in the owner's set
+    for session_id in client.smembers(owner_key):
+        if not client.exists(KEY.format(id=session_id.decode())):
+            client.srem(owner_key, session_id)
+    if client.scard(owner_key) >= session_setting("MAX_PER_USER"):
+        raise SessionLimitExceeded(
+            f"At most {session_setting('MAX_PER_USER')} sessions can be open at once."
+        )
+    session_id = uuid.uuid4().hex
+    key = KEY.format(id=session_id)
+    idle_timeout = session_setting("IDLE_TIMEOUT")
+    with client.pipeline() as pipe:
+        pipe.hset(
+            key,
+            mapping={
+                "owner": owner,
+                "language": language,
+                "created": time.time(),
+                "cells": 0,
+            },
+        )
+        pipe.expire(key, idle_timeout)
+        pipe.sadd(owner_key, session_id)
+        pipe.expire(owner_key, idle_timeout * 2)
+        pipe.execute()
+    return {"id": session_id, "language": language, "idle_timeout": idle_timeout}
+
+
+def get_session(session_id):
+    record = get_client().hgetall(KEY.format(id=session_id))
+    if not record:
+        return None
+    return {"id": session_id, **_decode(record)}
+
+
+def touch_session(session):
+    """Count a cell and restart the idle clock; returns the cell number."""
+    key = KEY.format(id=session["id"])
+    idle_timeout = session_setting("IDLE_TIMEOUT")
+    with get_client().pipeline() as pipe:
+        pipe.hincrby(key, "cells", 1)
+        pipe.expire(key, idle_timeout)
+        pipe.expire(OWNER_KEY.format(owner=session["owner"]), idle_timeout * 2)
+        cells, _, _ = pipe.execute()
+    return cells
+
+
+def end_session(session_id):
+    """Drop the record; returns it (for the node and container), or None."""
+    session = get_session(session_id)
+    if session is None:
+        return None
+    client = get_client()
+    client.delete(KEY.format(id=session_id))
+    client.srem(OWNER_KEY.format(owner=session["owner"]), session_id)
+    return session
+
+
+def _claim(session_id, field, value):
+    claimed = get_client().eval(
+        CLAIM,
+        1,
+        KEY.format(id=session_id),
+        field,
+        value,
+        session_setting("IDLE_TIMEOUT"),
+    )
+    if claimed < 0:
+        raise SessionExpired(session_id)
+    return claimed == 1
+
+
+def claim_session(session_id, node):
+    """Make `node` the session's owner unless another worker already is."""
+    return _claim(session_id, "node", node)
+
+
+def session_queue(session):
+    """The owning worker's direct queue, or the language queue before a kernel runs."""
+    if session.get("node"):
+        return worker_direct(session["node"])
+    return execution_queue(session["language"], INTERACTIVE)
+
+
+def session_host_config(language):
+    return {**language.host_config, "Memory": session_setting("MEMORY")}
+
+
+def start_kernel(session_id, language):
+    """Start the session's kernel container; returns its id."""
+    client = get_docker_client()
+    kernel, _ = KERNELS[language.name]
+    container_id = client.create_container(
+        {
+            "Image": language.container_image,
+            "Entrypoint": [
+                "sh",
+                "-c",
+                f'exec {language.entrypoint} -u -c "$0"',
+                kernel,
+            ],
+            "Labels": {**execution_labels(SESSION), SESSION_LABEL: session_id},
+            "HostConfig": session_host_config(language),
+        },
+        name=f"executor-session-{session_id[:12]}",
+    )
+    try:
+        client.start_container(container_id)
+        # the first cell must not race the kernel's bind()
+        exit_code, _, _ = client.exec_run(
+            container_id,
+            ["sh", "-c", KERNEL_READY],
+            timeout=10,
+        )
+        if exit_code != 0:
+            raise DockerError(exit_code, "the session kernel did not start")
+        # expired meanwhile: nothing would ever reap a kernel it cannot find
+        if not _claim(session_id, "container", container_id):
+            raise SessionExpired(session_id)
+    except (DockerError, OSError, TimeoutError, SessionExpired):
+        client.remove_container(container_id)
+        raise
+    return container_id
+
+
+def cell_command(language, code_bytes):
+    _, cell_client = KERNELS[language.name]
+    return [
+        "sh",
+        "-c",
+        f'exec {language.entrypoint} -c "$0" "$1" "$2"',
+        cell_client,
+        str(len(code_bytes)),
+        str(language.limits["CPU_TIME"]),
+    ]
+
+
+def run_cell(container_id, language, code, stdin, timeout, capture=None):
+    code_bytes = code.encode("utf-8")
+    return get_docker_client().exec_run(
+        container_id,
+        cell_command(language, code_bytes),
+        stdin=code_bytes + stdin.encode("utf-8"),
+        timeout=timeout,
+        capture=capture,
+    )
+
+
+def interrupt_kernel(container_id, language):
+    """Interrupt the running cell; False if the kernel did not come back."""
+    try:
+        get_docker_client().exec_run(container_id, ["kill", "-INT", "1"], timeout=5)
+        # the kernel is free again once an empty cell goes through
+        exit_code, _, _ = run_cell(
+            container_id, language, "", "", session_setting("INTERRUPT_GRACE")
+        )
+    except (DockerError, OSError, TimeoutError):
+        return False
+    return exit_code == 0
+
+
+def kernel_alive(container_id):
+    try:
+        state = get_docker_client().inspect_container(container_id)["State"]
+    except NotFound:
+        return False, False
+    return state.get("Running", False), state.get("OOMKilled", False)
+
+
+def stop_kernel(container_id):
+    try:
+        get_docker_client().remove_container(container_id)
+    except (DockerError, OSError) as e:
+        # still labelled: reap_idle_sessions removes it later
+        logger.warning("Could not remove session container %s: %s", container_id, e)
+
+
+def reap_idle_sessions():
+    """Remove kernels whose session ended or expired."""
+    client = get_docker_client()
+    removed = 0
+    summaries = client.list_containers({"label": [f"{KIND_LABEL}={SESSION}"]})
+    for summary in summaries:
+        session_id = (summary.get("Labels") or {}).get(SESSION_LABEL)
+        if session_id and get_client().exists(KEY.format(id=session_id)):
+            continue
+        stop_kernel(summary["Id"])
+        removed += 1
+    return removed
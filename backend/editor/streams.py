@@ -0,0 +1,203 @@
+# editor/streams.py
+"""
+Worker side of streaming execution.
+
+Output chunks are read from the container's attach stream and published on a
+Redis pub/sub channel per execution as the container produces them, and stdin
+typed in the browser comes back on a second channel. Flow control is credit based: the ASGI consumer adds the
+number of bytes it has delivered to an "acked" counter, and the worker stops
+reading the attach stream while more than WINDOW_BYTES are unacknowledged, so
+a slow client eventually blocks the program's writes instead of growing a
+buffer anywhere. The run is held to its language's WALL_TIME, as a normal
+run is.
+"""
+import codecs
+import json
+import selectors
+import time
+
+import redis
+from django.conf import settings
+
+from .docker_client import STDERR, STDOUT, get_client
+
+STREAM_DEFAULTS = {
+    "CHUNK_SIZE": 4096,  # bytes read from a pipe at a time
+    "MAX_BYTES": 1024 * 1024,  # total stdout + stderr forwarded per run
+    "WINDOW_BYTES": 64 * 1024,  # unacknowledged bytes before reading pauses
+    "CONNECT_TIMEOUT": 10,  # seconds to wait for a client to subscribe
+    "ACK_TIMEOUT": 30,  # seconds a client may stall before the run is killed
+}
+
+# Sent on the stdin channel to close the program's stdin
+STDIN_EOF = "__eof__"
+
+TRUNCATED_MARKER = "\n[output truncated: byte limit reached]\n"
+
+
+def stream_setting(name):
+    return getattr(settings, "EXECUTION_STREAM", {}).get(name, STREAM_DEFAULTS[name])
+
+
+def redis_url():
+    return getattr(settings, "EXECUTION_STREAM_REDIS_URL", settings.CELERY_BROKER_URL)
+
+
+def output_channel(execution_id):
+    return f"exec:{execution_id}:out"
+
+
+def stdin_channel(execution_id):
+    return f"exec:{execution_id}:in"
+
+
+def acked_key(execution_id):
+    # also acts as the "client is listening" handshake: the consumer creates it
+    return f"exec:{execution_id}:acked"
+
+
+def _wait_for_client(client, execution_id):
+    # pub/sub drops messages nobody is subscribed to
+    deadline = time.monotonic() + stream_setting("CONNECT_TIMEOUT")
+    while not client.exists(acked_key(execution_id)):
+        if time.monotonic() > deadline:
+            return False
+        time.sleep(0.05)
+    return True
+
+
+def publish_result(execution_id, result):
+    """Send a run that never started (e.g. Docker failed) as its exit event."""
+    client = redis.Redis.from_url(redis_url())
+    if _wait_for_client(client, execution_id):
+        message = json.dumps({"event": "exit", **result})
+        client.publish(output_channel(execution_id), message)
+        client.expire(acked_key(execution_id), 60)
+
+
+def run_streaming(execution_id, container_id, timeout, stdin_preamble=b""):
+    """
+    Attach to and start a created container, publishing its output.
+
+    The run is killed after `timeout` seconds. `stdin_preamble` is written to
+    the container's stdin before anything the user types (the source code,
+    for the stdin delivery command).
+
+    The container must have been created with OpenStdin/StdinOnce; it is
+    killed when the run has to be cut short but removing it is up to the
+    caller. Returns a small summary; the output itself is never kept in memory.
+    """
+    client = redis.Redis.from_url(redis_url())
+    channel = output_channel(execution_id)
+    ack_key = acked_key(execution_id)
+
+    def publish(message):
+        client.publish(channel, json.dumps(message))
+
+    if not _wait_for_client(client, execution_id):
+        return {"status": "failed", "error": "No client connected to the stream."}
+
+    pubsub = client.pubsub(ignore_subscribe_messages=True)
+    pubsub.subscribe(stdin_channel(execution_id))
+
+    docker = get_client()
+    stream = docker.attach(container_id)
+    docker.start_container(container_id)
+    stream.sock.setblocking(False)
+    selector = selectors.DefaultSelector()
+    selector.register(stream.sock, selectors.EVENT_READ)
+    decoders = {
+        STDOUT: codecs.getincrementaldecoder("utf-8")(errors="replace"),
+        STDERR: codecs.getincrementaldecoder("utf-8")(errors="replace"),
+    }
+    names = {STDOUT: "stdout", STDERR: "stderr"}
+
+    chunk_size = stream_setting("CHUNK_SIZE")
+    max_bytes = stream_setting("MAX_BYTES")
+    window = stream_setting("WINDOW_BYTES")
+    run_deadline = time.monotonic() + timeout
+    pending_stdin = bytearray(stdin_preamble)
+    stdin_closed = stdin_shut = False
+    sent = acked = 0
+    stalled_since = None
+    status = None
+
+    try:
+        while True:
+            now = time.monotonic()
+            if now > run_deadline:
+                status = "timed_out"
+                break
+
+            # forward whatever the browser typed
+            message = pubsub.get_message()
+            while message is not None:
+                data = message["data"].decode()
+                if data == STDIN_EOF:
+                    stdin_closed = True
+                else:
+                    pending_stdin.extend(data.encode())
+                message = pubsub.get_message()
+            if pending_stdin and not stdin_shut:
+                try:
+                    written = stream.sock.send(pending_stdin)
+                    del pending_stdin[:written]
+                except BlockingIOError:
+                    pass
+                except OSError:
+                    pending_stdin.clear()
+                    stdin_closed = True
+            if stdin_closed and not pending_stdin and not stdin_shut:
+                stream.close_stdin()
+                stdin_shut = True
+
+            # backpressure: stop reading the stream until the client catches up,
+            # so the container's own writes block once the socket buffers fill
+            if sent - acked > window:
+                acked = int(client.get(ack_key) or 0)
+                if sent - acked > window:
+                    stalled_since = stalled_since or now
+                    if now - stalled_since > stream_setting("ACK_TIMEOUT"):
+                        status = "failed"
+                        break
+                    time.sleep(0.05)
+                    continue
+            stalled_since = None
+
+            if not stream.pending and not selector.select(timeout=0.05):
+                continue
+            try:
+                frames = stream.read_frames(chunk_size)
+            except BlockingIOError:
+                continue
+            if frames is None:
+                status = "finished"
+                break
+            for stream_id, data in frames:
+                if stream_id not in decoders:
+                    continue
+                if sent + len(data) > max_bytes:
+                    data = data[: max_bytes - sent]
+                    status = "truncated"
+                # always publish so the client acks exactly the bytes read, even
+                # when the decoder is still holding a partial character
+                text = decoders[stream_id].decode(data)
+                publish({"stream": names[stream_id], "data": text, "bytes": len(data)})
+                sent += len(data)
+                if status == "truncated":
+                    publish({"stream": "stderr", "data": TRUNCATED_MARKER, "bytes": 0})
+                    break
+            if status == "truncated":
+                break
+    finally:
+        if status != "finished":
+            docker.kill_container(container_id)
+        selector.close()
+        stream.close()
+        pubsub.close()
+
+    exit_code = docker.wait_container(container_id, timeout=30)
+    summary = {"status": status, "exit_code": exit_code, "output_bytes": sent}
+    publish({"event": "exit", **summary})
+    client.expire(ack_key, 60)
+    return summary
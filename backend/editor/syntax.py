@@ -0,0 +1,244 @@
+# editor/syntax.py
+"""
+Pre-flight syntax check, run by the web tier before a run is queued.
+
+A snippet that does not parse fails in milliseconds here instead of after a
+queue wait and a container start. Python is parsed in-process with `ast`,
+against the grammar of the executor image. JavaScript and Ruby go to a few
+long-lived checker processes per web process (`node` / `ruby` reading one
+JSON request per line), which compile the code without running it. Results
+are cached in Redis by source hash, so resubmitting the same broken snippet
+costs one GET.
+
+The check only ever rejects code the interpreter would reject too; when a
+checker is missing, slow or confused, the run just goes ahead.
+"""
+import ast
+import hashlib
+import json
+import logging
+import os
+import queue
+import selectors
+import subprocess
+import threading
+import time
+
+from django.conf import settings
+
+from .cache import get_client
+
+logger = logging.getLogger(__name__)
+
+SYNTAX_DEFAULTS = {
+    "ENABLED": True,
+    "CACHE_TTL": 86400,  # seconds a parse result is kept
+    "MAX_SOURCE_BYTES": 256 * 1024,  # larger snippets skip the check
+    "PYTHON_VERSION": (3, 10),  # grammar of the python-executor image
+    # command prefix for each checker; the checker script is appended as -e
+    "INTERPRETERS": {"javascript": ["node"], "ruby": ["ruby"]},
+    "WORKERS": 2,  # checker processes per language and web process
+    "TIMEOUT": 2,  # seconds a checker may take before it is restarted
+}
+
+# Compiled the way node runs a CommonJS file, so top-level return is fine
+NODE_CHECKER = r"""
+const vm = require('vm');
+const rl = require('readline').createInterface({ input: process.stdin });
+rl.on('line', (line) => {
+  let result = { ok: true };
+  try {
+    vm.compileFunction(JSON.parse(line).code,
+      ['exports', 'require', 'module', '__filename', '__dirname'],
+      { filename: 'script.js' });
+  } catch (e) {
+    if (e instanceof SyntaxError) {
+      const stack = String(e.stack).split('\n');
+      const where = /script\.js:(\d+)/.exec(stack[0]);
+      const caret = (stack[2] || '').indexOf('^');
+      result = { ok: false, message: e.message,
+        line: where ? Number(where[1]) : null,
+        column: where && caret >= 0 ? caret + 1 : null };
+    }
+  }
+  process.stdout.write(JSON.stringify(result) + '\n');
+});
+"""
+
+RUBY_CHECKER = r"""
+require "json"
+$stdout.sync = true
+$stdin.each_line do |line|
+  begin
+    RubyVM::InstructionSequence.compile(JSON.parse(line)["code"], "script.rb")
+    result = { ok: true }
+  rescue SyntaxError => e
+    where = e.message.match(/script\.rb:(\d+):/)
+    message = e.message.sub(/\A.*?script\.rb:\d+: /, "").lines.first.to_s.strip
+    result = { ok: false, message: message, line: where && where[1].to_i, column: nil }
+  end
+  puts result.to_json
+end
+"""
+
+CHECKER_SCRIPTS = {"javascript": NODE_CHECKER, "ruby": RUBY_CHECKER}
+
+
+def syntax_setting(name):
+    return getattr(settings, "SYNTAX_CHECK", {}).get(name, SYNTAX_DEFAULTS[name])
+
+
+def _cache_key(code, language):
+    version = ".".join(map(str, syntax_setting("PYTHON_VERSION")))
+    payload = "\0".join([language, version, code]).encode()
+    return f"syntax:{hashlib.sha256(payload).hexdigest()}"
+
+
+def check_python(code):
+    try:
+        ast.parse(code, "script.py", feature_version=syntax_setting("PYTHON_VERSION"))
+    except SyntaxError as e:
+        return {"ok": False, "message": e.msg, "line": e.lineno, "column": e.offset}
+    except ValueError as e:
+        # source code string cannot contain null bytes
+        return {"ok": False, "message": str(e), "line": None, "column": None}
+    except (RecursionError, MemoryError):
+        return None
+    return {"ok": True}
+
+
+class SyntaxChecker:
+    """One long-lived checker process answering a request per line."""
+
+    def __init__(self, language):
+        command = syntax_setting("INTERPRETERS")[language]
+        self.process = subprocess.Popen(
+            [*command, "-e", CHECKER_SCRIPTS[language]],
+            stdin=subprocess.PIPE,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.DEVNULL,
+        )
+        self.buffer = b""
+
+    def check(self, code, timeout):
+        self.process.stdin.write(json.dumps({"code": code}).encode() + b"\n")
+        self.process.stdin.flush()
+        deadline = time.monotonic() + timeout
+        with selectors.DefaultSelector() as selector:
+            selector.register(self.process.stdout, selectors.EVENT_READ)
+            while b"\n" not in self.buffer:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0 or not selector.select(remaining):
+                    raise TimeoutError("syntax checker did not answer")
+                data = os.read(self.process.stdout.fileno(), 65536)
+                if not data:
+                    raise EOFError("syntax checker exited")
+                self.buffer += data
+        line, _, self.buffer = self.buffer.partition(b"\n")
+        return json.loads(line)
+
+    def close(self):
+        self.process.kill()
+        self.process.wait()
+
+
+class CheckerPool:
+    def __init__(self, language):
+        self.language = language
+        self.idle = queue.LifoQueue()
+        self.slots = threading.BoundedSemaphore(syntax_setting("WORKERS"))
+        self.available = True
+
+    def check(self, code):
+        timeout = syntax_setting("TIMEOUT")
+        # never queue behind busy checkers: the run itself is the fallback
+        if not self.available or not self.slots.acquire(timeout=timeout):
+            return None
+        checker = None
+        try:
+            try:
+                checker = self.idle.get_nowait()
+            except queue.Empty:
+                checker = SyntaxChecker(self.language)
+            result = checker.check(code, timeout)
+        except FileNotFoundError:
+            logger.warning("No %s interpreter for syntax checks", self.language)
+            self.available = False
+            return None
+        except (OSError, ValueError, TimeoutError, EOFError) as e:
+            logger.warning("%s syntax checker failed: %s", self.language, e)
+            if checker is not None:
+                checker.close()
+            return None
+        finally:
+            self.slots.release()
+        self.idle.put(checker)
+        return result
+
+
+_pools = {}
+_pools_pid = None
+_pools_lock = threading.Lock()
+
+
+def get_checker_pool(language):
+    global _pools, _pools_pid
+    with _pools_lock:
+        if _pools_pid != os.getpid():
+            _pools, _pools_pid = {}, os.getpid()
+        if language not in _pools:
+            _pools[language] = CheckerPool(language)
+        return _pools[language]
+
+
+def check_syntax(code, language):
+    """
+    Return {"message", "line", "column"} if `code` does not parse, else None.
+
+    None also covers languages without a checker and checker failures.
+    """
+    if not syntax_setting("ENABLED"):
+        return None
+    if language != "python" and language not in syntax_setting("INTERPRETERS"):
+        return None
+    if len(code.encode("utf-8")) > syntax_setting("MAX_SOURCE_BYTES"):
+        return None
+
+    client = get_client()
+    key = _cache_key(code, language)
+    try:
+        cached = client.get(key)
+    except Exception as e:
+        logger.warning("Syntax cache unavailable: %s", e)
+        cached = client = None
+    if cached is not None:
+        result = json.loads(cached)
+    else:
+        if language == "python":
+            result = check_python(code)
+        else:
+            result = get_checker_pool(language).check(code)
+        if result is None:
+            return None
+        if client is not None:
+            try:
+                client.set(key, json.dumps(result), ex=syntax_setting("CACHE_TTL"))
+            except Exception as e:
+                logger.warning("Syntax cache unavailable: %s", e)
+    if result.get("ok"):
+        return None
+    return {
+        "message": result.get("message"),
+        "line": result.get("line"),
+        "column": result.get("column"),
+    }
+
+
+def syntax_error_stderr(error):
+    where = []
+    if error["line"] is not None:
+        where.append(f"line {error['line']}")
+    if error["column"] is not None:
+        where.append(f"column {error['column']}")
+    suffix = f" ({', '.join(where)})" if where else ""
+    return f"SyntaxError: {error['message']}{suffix}\n"
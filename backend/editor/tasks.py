@@ -1,92 +1,755 @@
-from celery import shared_task
-import subprocess
-import tempfile
+from celery import current_app, shared_task
 import os
-import sys  # Import sys for sys.executable
+import signal
+import time
 import uuid  # To generate unique container names
+import logging
+from celery.signals import (
+    worker_process_init,
+    worker_process_shutdown,
+    worker_ready,
+    worker_shutdown,
+)
+from core.tracing import span
+from .backends import get_backend, select_backend
+from .accounting import (
+    build_metrics,
+    log_metrics,
+    new_marker,
+    split_usage,
+    wrap_with_accounting,
+)
+from .compiled import artifact_program, compile_program, compile_setting
+from .docker_client import STDERR, STDOUT, DockerError, get_client
+from .output import BoundedCapture, OutputLimitExceeded
+from .pool import get_pool, drain_pools, pool_setting
+from .queues import consumed_languages
+from .languages import get_language, get_languages, pin_images
+from .judge import run_judge, summarize, task_time_limit as judge_time_limit
+from .reaper import (
+    JUDGE,
+    RUN,
+    STREAM,
+    execution_labels,
+    reap_files,
+    reap_orphans,
+    start_reaper,
+)
+from .sessions import (
+    SessionExpired,
+    claim_session,
+    end_session,
+    get_session,
+    interrupt_kernel,
+    kernel_alive,
+    reap_idle_sessions,
+    run_cell,
+    start_kernel,
+    stop_kernel,
+    touch_session,
+)
+from .streams import publish_result, run_streaming, stream_setting
+from . import cache as result_cache
 
+logger = logging.getLogger(__name__)
 
-@shared_task
-def execute_code(code, language):
-    language = language.lower()
-    output = ""
-    image_name = ""
-    interpreter_command_in_container = ""
-    file_extension = ""
-
-    # Define language-specific details
-    if language == "python":
-        image_name = "python-executor"
-        interpreter_command_in_container = ""  # ENTRYPOINT handles this
-        file_extension = "py"
-    elif language == "javascript":
-        image_name = "nodejs-executor"
-        interpreter_command_in_container = ""  # ENTRYPOINT handles this
-        file_extension = "js"
-    elif language == "ruby":
-        image_name = "ruby-executor"
-        interpreter_command_in_container = ""  # ENTRYPOINT handles this
-        file_extension = "rb"
+# Celery's hard kill, a backstop behind the wall-clock limit; the reaper
+# treats run containers older than this as leaked
+TASK_TIME_LIMIT = (
+    max(language.limits["WALL_TIME"] for language in get_languages().values())
+    + compile_setting("TIMEOUT")
+    + 20
+)
+
+
+@worker_process_init.connect
+@worker_ready.connect
+def pin_language_images(**kwargs):
+    # before the pools below: containers are created from the pinned ids
+    pin_images()
+
+
+@worker_process_init.connect
+@worker_ready.connect
+def warm_container_pools(**kwargs):
+    # worker_ready also covers --pool=solo, where no child process is forked;
+    # pools are keyed by pid so a prefork parent never shares with its children
+    if not pool_setting("ENABLED"):
+        return
+    # a worker started with -Q execute.python.* only needs Python containers
+    languages = consumed_languages(current_app)
+    for name, language in get_languages().items():
+        # languages routed to another backend never touch the pool
+        if name in languages and select_backend(name) == "docker":
+            language_pool(language)
+
+
+@worker_ready.connect
+def publish_image_digests(**kwargs):
+    # the web tier needs the image ids to build result cache keys
+    if not result_cache.cache_setting("ENABLED"):
+        return
+    for language in get_languages().values():
+        if language.digest is None:
+            continue
+        try:
+            result_cache.publish_image_digest(language.image, language.digest)
+        except Exception as e:
+            logger.warning("Could not publish digest for %s: %s", language.image, e)
+
+
+@worker_process_shutdown.connect
+@worker_shutdown.connect
+def drain_container_pools(**kwargs):
+    drain_pools()
+
+
+def language_pool(language):
+    return get_pool(
+        language.name,
+        language.container_image,
+        language.host_config,
+        language.pool_min_size,
+        language.pool_max_size,
+    )
+
+
+def script_program(language, code):
+    """(payload, install, run) for an interpreted language: the source itself."""
+    path = f"/app/script.{language.extension}"
+    payload = code.encode("utf-8")
+    return payload, f"head -c {len(payload)} > {path}", f"{language.entrypoint} {path}"
+
+
+def delivery_command(program, usage_marker=None, cpu_time=None):
+    # The payload (script or compiled artifact) and the program's stdin go in
+    # back to back over one stream: the install command takes exactly the
+    # payload's bytes into the tmpfs-backed /app and the program gets the
+    # rest, so no file is ever written on the host
+    _, install, run = program
+    limit = ""
+    if cpu_time:
+        # SIGXCPU at the soft limit, SIGKILL a second later; the program
+        # cannot raise either. Not exec'd: PID 1 would ignore SIGXCPU
+        limit = f"ulimit -t {cpu_time + 1} && ulimit -St {cpu_time} || exit 125; "
+    if usage_marker is None:
+        script = f"{limit}{install} && "
+        script += run if cpu_time else f"exec {run}"
     else:
-        return f"Language '{language}' is not supported yet."
-
-    # Create a temporary directory and file on the HOST system
-    # This file will then be mounted into the Docker container
-    with tempfile.TemporaryDirectory() as temp_dir:
-        host_file_path = os.path.join(temp_dir, f"script.{file_extension}")
-        container_file_path = (
-            f"/app/script.{file_extension}"  # Path inside the container
-        )
-
-        with open(host_file_path, "w") as f:
-            f.write(code)
-
-        # Construct the Docker run command
-        # sys.executable ensures 'docker' command is found if it's in the PATH of the venv
-        docker_command = [
-            # Ensure Docker executable is found
-            "docker",
-            "run",
-            "--rm",  # Automatically remove the container after it exits
-            "--network",
-            "none",  # IMPORTANT: Disable network access for security
-            f"--memory=128m",  # Limit memory to 128MB
-            f"--cpus=0.5",  # Limit CPU usage to 50% of one core
-            # Optional but recommended for stricter sandboxing:
-            # "--read-only", # Make the container's filesystem read-only (except mounted volumes)
-            # "--cap-drop=ALL", # Drop all Linux capabilities (more secure)
-            # Mount the host file into the container at the specified path
-            "-v",
-            f"{host_file_path}:{container_file_path}",
-            # The image to use
-            image_name,
-            # The command to execute inside the container (interpreter is ENTRYPOINT, so just script path)
-            container_file_path,
-        ]
+        script = f"{limit}{install} || exit 125; " + wrap_with_accounting(
+            run, usage_marker
+        )
+    return ["sh", "-c", script]
+
+
+def _run_in_warm_container(
+    container, program, stdin, usage_marker, limits, capture, timings
+):
+    started = time.monotonic()
+    try:
+        # interpreter start and the program itself; docker exec has no finer split
+        with span("container.run", warm=True):
+            return get_client().exec_run(
+                container.name,
+                delivery_command(program, usage_marker, cpu_time=limits["CPU_TIME"]),
+                stdin=program[0] + stdin.encode("utf-8"),
+                timeout=limits["WALL_TIME"],
+                capture=capture,
+            )
+    finally:
+        timings["run_wall_ms"] = round((time.monotonic() - started) * 1000, 1)
 
+
+def _run_in_new_container(
+    image_name, host_config, program, stdin, usage_marker, limits, capture, timings
+):
+    client = get_client()
+    deadline = time.monotonic() + limits["WALL_TIME"]
+
+    created = time.monotonic()
+    with span("container.create"):
+        container_id = client.create_container(
+            {
+                "Image": image_name,
+                "Entrypoint": delivery_command(
+                    program, usage_marker, cpu_time=limits["CPU_TIME"]
+                ),
+                # lets the reaper find it if this worker dies before removing it
+                "Labels": execution_labels(RUN),
+                # stdin stays open until we close our end of the attach stream
+                "OpenStdin": True,
+                "StdinOnce": True,
+                "AttachStdin": True,
+                "AttachStdout": True,
+                "AttachStderr": True,
+                "HostConfig": {
+                    **host_config,
+                    # Optional but recommended for stricter sandboxing:
+                    # "CapDrop": ["ALL"],
+                },
+            },
+            name=f"executor-run-{uuid.uuid4().hex[:12]}",
+        )
+    try:
+        # attach before start so no early output is missed
+        with span("container.attach"):
+            stream = client.attach(container_id, timeout=limits["WALL_TIME"])
         try:
-            # Execute the Docker command
-            # The timeout here applies to the *entire Docker container execution*
-            result = subprocess.run(
-                docker_command,
-                capture_output=True,
-                text=True,
-                timeout=40,  # Example: 10 seconds timeout for container execution
+            with span("container.start"):
+                client.start_container(container_id)
+            started = time.monotonic()
+            timings["container_start_ms"] = round((started - created) * 1000, 1)
+            stream.send_stdin_in_background(program[0] + stdin.encode("utf-8"))
+            try:
+                with span("container.run", warm=False):
+                    stdout, stderr = stream.collect(deadline, capture)
+            finally:
+                timings["run_wall_ms"] = round((time.monotonic() - started) * 1000, 1)
+        finally:
+            stream.close()
+        with span("container.wait"):
+            exit_code = client.wait_container(container_id)
+            state = client.inspect_container(container_id)["State"]
+        timings["oom_killed"] = state.get("OOMKilled", False)
+    finally:
+        # force-removal also kills a container that ran out of time
+        with span("container.remove"):
+            client.remove_container(container_id)
+    return exit_code, stdout, stderr
+
+
+def _kill_quietly(container_id):
+    try:
+        get_client().kill_container(container_id)
+    except (DockerError, OSError) as e:
+        # it is still labelled, so the reaper gets it later
+        logger.warning("Could not kill container %s: %s", container_id, e)
+
+
+# Final states reported by execute_code; queued/running/cancelled come from Celery
+FINISHED = "finished"
+TIMED_OUT = "timed_out"
+OOM_KILLED = "oom_killed"
+TRUNCATED = "truncated"  # stopped after printing more than MAX_TOTAL_BYTES
+FAILED = "failed"
+
+
+def prepare_program(language, code):
+    """
+    Return the (payload, install, run) program for a run, with compile_info.
+
+    compile_info is None for interpreted languages. For compiled ones the
+    code is compiled first (or the artifact comes from the cache), and the
+    program is None when the compiler rejected the code.
+    """
+    if not language.compiled:
+        return script_program(language, code), None
+    artifact, compile_info = compile_program(language, code)
+    if artifact is None:
+        return None, compile_info
+    return artifact_program(artifact, language), compile_info
+
+
+def compile_error_result(compile_info):
+    # the compiler's exit code and diagnostics stand in for the program's
+    return execution_result(
+        FINISHED,
+        exit_code=compile_info["exit_code"],
+        stderr=compile_info["diagnostics"],
+    )
+
+
+def execution_result(status, exit_code=None, stdout="", stderr="", error=None):
+    """Result payload of an execution; `error` is for problems outside the program."""
+    result = {
+        "status": status,
+        "exit_code": exit_code,
+        "stdout": stdout,
+        "stderr": stderr,
+    }
+    if error:
+        result["error"] = error
+    return result
+
+
+def exit_status(exit_code, timings, usage, cpu_time):
+    """Tell a normal exit from one forced by the memory or CPU-time limit."""
+    if timings.get("oom_killed") or usage.get("oom_kills"):
+        return OOM_KILLED
+    cpu_time_ms = usage.get("cpu_time_ms")
+    if exit_code == 128 + signal.SIGXCPU or (
+        # a program that handles SIGXCPU gets SIGKILL at the hard limit
+        exit_code == 128 + signal.SIGKILL
+        and cpu_time_ms is not None
+        and cpu_time_ms >= cpu_time * 1000
+    ):
+        return TIMED_OUT
+    return FINISHED
+
+
+LIMIT_ERRORS = {
+    OOM_KILLED: "Memory limit exceeded. Your code used too much memory.",
+    TIMED_OUT: "CPU time limit exceeded (limit: {cpu_time} seconds).",
+}
+
+
+def compile_report(compile_info):
+    """The compile step as reported in results; diagnostics go to stderr."""
+    return {k: v for k, v in compile_info.items() if k != "diagnostics"}
+
+
+def compile_timed_out():
+    return execution_result(
+        TIMED_OUT,
+        error=f"Compilation timed out (limit: {compile_setting('TIMEOUT')} seconds).",
+    )
+
+
+def unsupported_language(language):
+    return execution_result(FAILED, error=f"Language '{language}' is not supported yet.")
+
+
+# time_limit is a backstop: Celery kills the task if the docker call hangs
+@shared_task(bind=True, time_limit=TASK_TIME_LIMIT)
+def execute_code(self, code, language, stdin="", cache_key=None, backend=None):
+    # cache_key is set by the view when this run claimed a result cache entry;
+    # backend is the view's pick for the user's tenant (see editor.backends)
+    run = get_backend(backend or select_backend(language))
+    try:
+        result = run(
+            code,
+            language,
+            stdin,
+            queue_wait_ms=getattr(self.request, "queue_wait_ms", None),
+        )
+        if cache_key and result["status"] == FINISHED:
+            # metrics describe this run, not the ones served from the cache
+            result_cache.store(
+                cache_key, {k: v for k, v in result.items() if k != "metrics"}
+            )
+        return result
+    finally:
+        if cache_key:
+            result_cache.release(cache_key, self.request.id)
+
+
+def run_code(code, language, stdin="", queue_wait_ms=None):
+    language = language.lower()
+    profile = get_language(language)
+    if profile is None:
+        return unsupported_language(language)
+    limits = profile.limits
+    timings = {"queue_wait_ms": queue_wait_ms}
+
+    compile_info = None
+    try:
+        with span("program.prepare", compiled=profile.compiled):
+            program, compile_info = prepare_program(profile, code)
+    except TimeoutError:
+        result = compile_timed_out()
+    except (FileNotFoundError, ConnectionRefusedError):
+        result = execution_result(
+            FAILED,
+            error="Could not reach the Docker daemon. Is Docker running?",
+        )
+    except DockerError as e:
+        result = execution_result(
+            FAILED, error=f"An error occurred during Docker execution: {e.message}"
+        )
+    else:
+        result = None
+        if compile_info is not None:
+            timings["compile_ms"] = compile_info["compile_ms"]
+            if program is None:
+                result = compile_error_result(compile_info)
+    if result is not None:
+        if compile_info is not None:
+            result["compile"] = compile_report(compile_info)
+        result["metrics"] = build_metrics(timings, {})
+        log_metrics(language, result["status"], result["metrics"])
+        return result
+
+    usage_marker = new_marker()
+    # keeps the worker's memory and the result payload bounded
+    capture = BoundedCapture()
+
+    # Fast path: run inside an already started container from the warm pool
+    container = None
+    if pool_setting("ENABLED"):
+        acquiring = time.monotonic()
+        with span("pool.acquire") as acquire_span:
+            pool = language_pool(profile)
+            container = pool.acquire()
+            if acquire_span is not None:
+                acquire_span.attributes["hit"] = container is not None
+        if container is not None:
+            timings["warm_container"] = True
+            timings["container_start_ms"] = round(
+                (time.monotonic() - acquiring) * 1000, 1
             )
-            output = result.stdout if result.returncode == 0 else result.stderr
 
-        except subprocess.TimeoutExpired:
-            # If the Docker container itself times out (e.g., infinite loop in user code)
-            output = (
-                f"Execution timed out (limit: 10 seconds). Your code took too long."
+    dirty = True
+    try:
+        if container is not None:
+            exit_code, stdout, stderr = _run_in_warm_container(
+                container,
+                program,
+                stdin,
+                usage_marker,
+                limits,
+                capture,
+                timings,
             )
-            # Optionally, if you know the container is still running, you could try to stop it here:
-            # subprocess.run(["docker", "kill", container_name], capture_output=True)
-        except FileNotFoundError:
-            output = (
-                "Docker command not found. Is Docker Desktop running and in your PATH?"
+        else:
+            # Pool miss (or pool disabled): fall back to a one-off container
+            exit_code, stdout, stderr = _run_in_new_container(
+                profile.container_image,
+                profile.host_config,
+                program,
+                stdin,
+                usage_marker,
+                limits,
+                capture,
+                timings,
             )
-        except Exception as e:
-            output = f"An error occurred during Docker execution: {str(e)}"
+        dirty = False
+    except TimeoutError:
+        # If the container itself times out (e.g., infinite loop in user code)
+        if container is not None:
+            # stop the runaway exec now instead of when the pool replaces it
+            _kill_quietly(container.name)
+        result = execution_result(
+            TIMED_OUT,
+            error=(
+                f"Execution timed out (limit: {limits['WALL_TIME']} seconds). "
+                "Your code took too long."
+            ),
+        )
+    except OutputLimitExceeded:
+        if container is not None:
+            _kill_quietly(container.name)
+        result = execution_result(
+            TRUNCATED,
+            stdout=capture.value(STDOUT).decode("utf-8", errors="replace"),
+            stderr=capture.value(STDERR).decode("utf-8", errors="replace"),
+        )
+    except (FileNotFoundError, ConnectionRefusedError):
+        result = execution_result(
+            FAILED,
+            error="Could not reach the Docker daemon. Is Docker running?",
+        )
+    except DockerError as e:
+        result = execution_result(
+            FAILED, error=f"An error occurred during Docker execution: {e.message}"
+        )
+    except Exception as e:
+        result = execution_result(
+            FAILED, error=f"An error occurred during Docker execution: {str(e)}"
+        )
+    finally:
+        if container is not None:
+            # a timed-out or failed exec may leave processes behind: replace it
+            pool.release(container, dirty=dirty)
+
+    # the usage line on stderr is the wrapper's, not the program's
+    stderr_bytes = capture.written[STDERR]
+    if result is None:
+        stripped, usage = split_usage(stderr, usage_marker)
+        stderr_bytes -= len(stderr) - len(stripped)
+        stderr = stripped
+        status = exit_status(exit_code, timings, usage, limits["CPU_TIME"])
+        result = execution_result(
+            status,
+            exit_code=exit_code,
+            stdout=stdout.decode("utf-8", errors="replace"),
+            stderr=stderr.decode("utf-8", errors="replace"),
+            error=LIMIT_ERRORS.get(status, "").format(cpu_time=limits["CPU_TIME"]),
+        )
+        result["metrics"] = build_metrics(
+            timings, usage, capture.written[STDOUT], stderr_bytes
+        )
+        if capture.truncated:
+            result["truncated"] = True
+    else:
+        result["metrics"] = build_metrics(
+            timings, {}, capture.written[STDOUT], stderr_bytes
+        )
+    if compile_info is not None:
+        result["compile"] = compile_report(compile_info)
+    log_metrics(language, result["status"], result["metrics"])
+    return result
+
+
+# The worker compiles if needed, waits up to CONNECT_TIMEOUT for a client,
+# then the run itself
+@shared_task(
+    bind=True, time_limit=TASK_TIME_LIMIT + stream_setting("CONNECT_TIMEOUT") + 30
+)
+def stream_code(self, code, language, stdin=""):
+    """
+    Run code in a one-off container, publishing output as it is produced.
+    `stdin` is the program's input ahead of anything typed into the stream.
+    """
+
+    def stopped(result):
+        # the client is waiting on the stream for an exit event either way
+        publish_result(self.request.id, result)
+        return result
+
+    language = language.lower()
+    profile = get_language(language)
+    if profile is None:
+        return stopped(unsupported_language(language))
+    client = get_client()
+
+    try:
+        program, compile_info = prepare_program(profile, code)
+        if program is None:
+            result = compile_error_result(compile_info)
+            result["compile"] = compile_report(compile_info)
+            return stopped(result)
+        container_id = client.create_container(
+            {
+                "Image": profile.container_image,
+                "Entrypoint": delivery_command(
+                    program, cpu_time=profile.limits["CPU_TIME"]
+                ),
+                "Labels": execution_labels(STREAM),
+                # keep stdin open so the browser can type into the program
+                "OpenStdin": True,
+                "StdinOnce": True,
+                "AttachStdin": True,
+                "AttachStdout": True,
+                "AttachStderr": True,
+                "HostConfig": profile.host_config,
+            },
+            name=f"executor-stream-{self.request.id}",
+        )
+    except TimeoutError:
+        return stopped(compile_timed_out())
+    except (FileNotFoundError, ConnectionRefusedError):
+        return stopped(
+            execution_result(
+                FAILED, error="Could not reach the Docker daemon. Is Docker running?"
+            )
+        )
+    except DockerError as e:
+        return stopped(
+            execution_result(
+                FAILED, error=f"An error occurred during Docker execution: {e.message}"
+            )
+        )
+    try:
+        # the code and the request's stdin go down the attach stream ahead
+        # of anything the user types
+        return run_streaming(
+            self.request.id,
+            container_id,
+            profile.limits["WALL_TIME"],
+            stdin_preamble=program[0] + stdin.encode("utf-8"),
+        )
+    except DockerError as e:
+        return stopped(
+            execution_result(
+                FAILED, error=f"An error occurred during Docker execution: {e.message}"
+            )
+        )
+    finally:
+        client.remove_container(container_id)
+
+
+@shared_task(bind=True, time_limit=judge_time_limit())
+def judge_code(
+    self,
+    code,
+    language,
+    cases,
+    time_limit,
+    memory_limit,
+    comparison="lines",
+    stop_on_failure=False,
+):
+    """Run one program against many test cases in a single container."""
+    language = language.lower()
+    profile = get_language(language)
+    # judge runs exec the interpreter per case; compiled languages are not wired in
+    if profile is None or profile.compiled:
+        return unsupported_language(language)
+    try:
+        outcomes = run_judge(
+            profile.container_image,
+            profile.entrypoint,
+            profile.extension,
+            profile.host_config,
+            code,
+            cases,
+            time_limit,
+            memory_limit,
+            comparison=comparison,
+            stop_on_failure=stop_on_failure,
+        )
+    except (FileNotFoundError, ConnectionRefusedError):
+        return execution_result(
+            FAILED, error="Could not reach the Docker daemon. Is Docker running?"
+        )
+    except DockerError as e:
+        return execution_result(
+            FAILED, error=f"An error occurred during Docker execution: {e.message}"
+        )
+    return {"status": FINISHED, **summarize(outcomes), "cases": outcomes}
+
+
+def _end_session(session_id, container_id):
+    end_session(session_id)
+    stop_kernel(container_id)
+
+
+SESSION_ENDED = "The session has ended or expired. Start a new session."
+
+
+@shared_task(bind=True, time_limit=TASK_TIME_LIMIT)
+def run_session_cell(self, session_id, code, stdin="", language=None):
+    """
+    Run one cell in a session's kernel; the first cell starts the kernel.
+    `language` is only read by routing and metrics.
+    """
+    session = get_session(session_id)
+    if session is None:
+        return execution_result(FAILED, error=SESSION_ENDED)
+    language = get_language(session["language"])
+    if language is None:
+        return unsupported_language(session["language"])
+    limits = language.limits
+    timings = {"queue_wait_ms": getattr(self.request, "queue_wait_ms", None)}
+    capture = BoundedCapture()
+    container_id = session.get("container")
+
+    result = None
+    try:
+        if container_id:
+            # the whole point: no interpreter start, no imports
+            timings["warm_container"] = True
+        else:
+            # the first cell makes this worker the session's owner
+            if not claim_session(session_id, self.request.hostname):
+                return execution_result(
+                    FAILED, error="The session is still starting. Try again."
+                )
+            created = time.monotonic()
+            container_id = start_kernel(session_id, language)
+            timings["container_start_ms"] = round(
+                (time.monotonic() - created) * 1000, 1
+            )
+        started = time.monotonic()
+        try:
+            exit_code, stdout, stderr = run_cell(
+                container_id, language, code, stdin, limits["WALL_TIME"], capture
+            )
+        finally:
+            timings["run_wall_ms"] = round((time.monotonic() - started) * 1000, 1)
+    except (TimeoutError, OutputLimitExceeded) as e:
+        if not container_id:
+            # the kernel never came up (start_kernel removed it): nothing to
+            # interrupt, and no later cell could start it under this claim
+            end_session(session_id)
+            return execution_result(
+                TIMED_OUT,
+                error="The session did not start in time and has ended.",
+            )
+        if isinstance(e, TimeoutError):
+            result = execution_result(
+                TIMED_OUT,
+                error=(
+                    f"The cell timed out (limit: {limits['WALL_TIME']} seconds) "
+                    "and was interrupted."
+                ),
+            )
+        else:
+            result = execution_result(
+                TRUNCATED,
+                stdout=capture.value(STDOUT).decode("utf-8", errors="replace"),
+                stderr=capture.value(STDERR).decode("utf-8", errors="replace"),
+            )
+        if not interrupt_kernel(container_id, language):
+            _end_session(session_id, container_id)
+            result["error"] = (
+                result.get("error", "") + " The session did not recover and has ended."
+            ).strip()
+    except SessionExpired:
+        result = execution_result(FAILED, error=SESSION_ENDED)
+    except (FileNotFoundError, ConnectionRefusedError):
+        result = execution_result(
+            FAILED, error="Could not reach the Docker daemon. Is Docker running?"
+        )
+    except DockerError as e:
+        # most likely the kernel is gone, e.g. killed at the memory cap
+        if container_id:
+            _end_session(session_id, container_id)
+        result = execution_result(
+            FAILED, error=f"An error occurred during Docker execution: {e.message}"
+        )
+
+    if result is None:
+        # the kernel reports a cell stopped at its CPU time as SIGXCPU
+        status = exit_status(exit_code, timings, {}, limits["CPU_TIME"])
+        result = execution_result(
+            status,
+            exit_code=exit_code,
+            stdout=stdout.decode("utf-8", errors="replace"),
+            stderr=stderr.decode("utf-8", errors="replace"),
+            error=LIMIT_ERRORS.get(status, "").format(cpu_time=limits["CPU_TIME"]),
+        )
+        if exit_code == 137:
+            running, oom_killed = kernel_alive(container_id)
+            if not running:
+                _end_session(session_id, container_id)
+                timings["oom_killed"] = oom_killed
+                result["status"] = OOM_KILLED if oom_killed else FAILED
+                result["error"] = (
+                    LIMIT_ERRORS[OOM_KILLED] if oom_killed else "The kernel stopped."
+                ) + " The session has ended."
+        if capture.truncated:
+            result["truncated"] = True
+    result["metrics"] = build_metrics(
+        timings, {}, capture.written[STDOUT], capture.written[STDERR]
+    )
+    if get_session(session_id) is not None:
+        result["session"] = {"id": session_id, "cell": touch_session(session)}
+    else:
+        result["session"] = {"id": session_id, "ended": True}
+    log_metrics(language.name, result["status"], result["metrics"])
+    return result
+
+
+@shared_task
+def stop_session(container_id):
+    stop_kernel(container_id)
+
+
+@shared_task
+def reap_orphaned_containers():
+    """Remove what dead tasks and workers left on this host (see start_reaper)."""
+    from .sandbox import sandbox_setting
+
+    removed = reap_orphans(
+        {
+            RUN: execute_code.time_limit,
+            STREAM: stream_code.time_limit,
+            JUDGE: judge_code.time_limit,
+        }
+    )
+    removed += reap_files(
+        [
+            os.path.join(sandbox_setting("SCRATCH_DIR"), "editor-*"),
+            os.path.join(compile_setting("CACHE_DIR"), "*", "*.partial"),
+        ],
+        execute_code.time_limit,
+    )
+    return removed + reap_idle_sessions()
+
 
-    return output
+@worker_ready.connect
+def start_host_reaper(**kwargs):
+    # in each worker's main process: containers and scratch files live on
+    # the host of the worker that made them
+    start_reaper(reap_orphaned_containers)
@@ -1,3 +1,1018 @@
-from django.test import TestCase
+import os
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import types
+import unittest
+import uuid
+from unittest import mock
 
-# Create your tests here.
+import redis
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.exceptions import ImproperlyConfigured
+from django.test import RequestFactory, SimpleTestCase, override_settings
+from rest_framework.exceptions import Throttled
+from rest_framework.test import APIClient
+
+from core.tracing import (
+    TRACEPARENT,
+    finish_publish_span,
+    inject_trace_context,
+    parse_traceparent,
+    start_trace,
+)
+
+from .accounting import build_metrics
+from .admission import (
+    OWNER_HEADER,
+    RESERVE_SLOT,
+    TAKE_TOKENS,
+    ExecutionThrottle,
+    publish_execution,
+    reserve_slot,
+)
+from .backends import get_backend
+from .benchmark import run_level, use_backend
+from .cache import normalize_source
+from .compiled import artifact_key, evict, load_artifact, store_artifact
+from .consumers import stream_application
+from .docker_client import (
+    FRAME_HEADER,
+    STDERR,
+    STDOUT,
+    DockerClient,
+    DockerError,
+    FrameParser,
+    RawStream,
+    docker_setting,
+)
+from .judge import (
+    ACCEPTED,
+    MEMORY_LIMIT_EXCEEDED,
+    RUNTIME_ERROR,
+    TIME_LIMIT_EXCEEDED,
+    WRONG_ANSWER,
+    _run_case,
+    case_script,
+)
+from .languages import build_registry
+from .output import BoundedCapture, OutputLimitExceeded
+from .pool import ContainerPool, WarmContainer
+from .queues import priority_lists, queue_stats, route_execution
+from .reaper import (
+    KIND_LABEL,
+    OWNER_LABEL,
+    POOL,
+    RUN,
+    SESSION,
+    _owner_gone,
+    reap_files,
+    reap_orphans,
+)
+from .sandbox import (
+    limited_command,
+    out_of_memory,
+    sandbox_available,
+    sandbox_command,
+)
+from .syntax import check_python, check_syntax
+from .sessions import SessionExpired, cell_command, claim_session
+from .tasks import (
+    FAILED,
+    FINISHED,
+    OOM_KILLED,
+    TIMED_OUT,
+    TRUNCATED,
+    run_session_cell,
+    stream_code,
+)
+
+
+# Small limits so the slow cases finish quickly
+conformance_settings = override_settings(
+    EXECUTION_LANGUAGES={
+        **settings.EXECUTION_LANGUAGES,
+        "default": {
+            **settings.EXECUTION_LANGUAGES["default"],
+            "WALL_TIME": 5,
+            "CPU_TIME": 2,
+        },
+    },
+    EXECUTION_OUTPUT={
+        "MAX_STREAM_BYTES": 1024,
+        "TAIL_BYTES": 128,
+        "MAX_TOTAL_BYTES": 1024 * 1024,
+    },
+    EXECUTOR_POOL={"ENABLED": False},
+)
+
+
+class ExecutorConformanceMixin:
+    """Behaviour every executor backend must have; subclasses set `backend`."""
+
+    backend = None
+
+    def run_python(self, code, stdin=""):
+        return get_backend(self.backend)(code, "python", stdin)
+
+    def test_output_capture(self):
+        result = self.run_python(
+            "import sys\n"
+            "print(input().upper())\n"
+            "print('oops', file=sys.stderr)\n"
+            "sys.exit(3)\n",
+            stdin="hello\n",
+        )
+        self.assertEqual(result["status"], FINISHED)
+        self.assertEqual(result["stdout"], "HELLO\n")
+        self.assertEqual(result["stderr"], "oops\n")
+        self.assertEqual(result["exit_code"], 3)
+
+    def test_wall_clock_timeout(self):
+        result = self.run_python("import time\ntime.sleep(60)\n")
+        self.assertEqual(result["status"], TIMED_OUT)
+
+    def test_cpu_time_limit(self):
+        result = self.run_python("while True:\n    pass\n")
+        self.assertEqual(result["status"], TIMED_OUT)
+
+    def test_memory_limit(self):
+        result = self.run_python(
+            "blocks = [bytearray(64 * 1024 * 1024) for _ in range(16)]\n"
+            "print('allocated')\n"
+        )
+        self.assertNotIn("allocated", result["stdout"])
+        self.assertEqual(result["status"], OOM_KILLED)
+        self.assertTrue(result["metrics"]["oom_killed"])
+
+    def test_no_network(self):
+        result = self.run_python(
+            "import socket\n"
+            "try:\n"
+            "    socket.create_connection(('1.1.1.1', 53), timeout=2)\n"
+            "    print('connected')\n"
+            "except OSError:\n"
+            "    print('blocked')\n"
+        )
+        self.assertEqual(result["stdout"], "blocked\n")
+
+    def test_output_truncation(self):
+        result = self.run_python("print('x' * 4096)\n")
+        self.assertEqual(result["status"], FINISHED)
+        self.assertTrue(result["truncated"])
+        self.assertIn("[output truncated:", result["stdout"])
+        self.assertLess(len(result["stdout"]), 1024 + 128 + 64)
+
+    @override_settings(
+        EXECUTION_OUTPUT={
+            "MAX_STREAM_BYTES": 1024,
+            "TAIL_BYTES": 128,
+            "MAX_TOTAL_BYTES": 64 * 1024,
+        }
+    )
+    def test_output_ceiling_stops_run(self):
+        result = self.run_python("while True:\n    print('x' * 1000)\n")
+        self.assertEqual(result["status"], TRUNCATED)
+
+
+@conformance_settings
+@unittest.skipUnless(
+    os.path.exists(docker_setting("SOCKET")), "Docker daemon not available"
+)
+class DockerBackendConformanceTests(ExecutorConformanceMixin, SimpleTestCase):
+    backend = "docker"
+
+
+@conformance_settings
+@unittest.skipUnless(
+    shutil.which("unshare") and sandbox_available("python"),
+    "native sandbox not set up",
+)
+class NativeBackendConformanceTests(ExecutorConformanceMixin, SimpleTestCase):
+    backend = "native"
+
+
+class LanguageRegistryTests(SimpleTestCase):
+    def test_profiles_inherit_default(self):
+        registry = build_registry(
+            {
+                "default": {"WALL_TIME": 20, "MEMORY": 64 * 1024 * 1024},
+                "python": {
+                    "IMAGE": "python-executor",
+                    "ENTRYPOINT": "python",
+                    "EXTENSION": "py",
+                    "MEMORY": 256 * 1024 * 1024,
+                },
+            }
+        )
+        python = registry["python"]
+        self.assertEqual(python.limits, {"WALL_TIME": 20, "CPU_TIME": 10})
+        self.assertEqual(python.host_config["Memory"], 256 * 1024 * 1024)
+        self.assertEqual(python.host_config["NetworkMode"], "none")
+        self.assertNotIn("default", registry)
+
+    def test_compiled_language_needs_source(self):
+        with self.assertRaises(ImproperlyConfigured):
+            build_registry(
+                {
+                    "c": {
+                        "IMAGE": "gcc-executor",
+                        "ENTRYPOINT": "/app/main",
+                        "COMPILE": "gcc -o /app/out/main main.c",
+                    }
+                }
+            )
+
+    def test_cpu_time_cannot_exceed_wall_time(self):
+        with self.assertRaises(ImproperlyConfigured):
+            build_registry(
+                {
+                    "ruby": {
+                        "IMAGE": "ruby-executor",
+                        "ENTRYPOINT": "ruby",
+                        "EXTENSION": "rb",
+                        "WALL_TIME": 5,
+                        "CPU_TIME": 10,
+                    }
+                }
+            )
+
+
+class ExecutionOwnershipTests(SimpleTestCase):
+    url = "/api/v1/editor/execute/0b5e4c1e"
+
+    def setUp(self):
+        # the run was submitted from 10.0.0.1
+        subscriber = mock.patch(
+            "editor.views.is_subscriber",
+            side_effect=lambda task_id, owner: owner == "addr:10.0.0.1",
+        )
+        subscriber.start()
+        self.addCleanup(subscriber.stop)
+        async_result = mock.patch("editor.views.AsyncResult")
+        self.task = async_result.start().return_value
+        self.addCleanup(async_result.stop)
+        self.task.id = "0b5e4c1e"
+        self.task.state = "STARTED"
+        self.task.ready.return_value = False
+        remove = mock.patch("editor.views.remove_subscriber", return_value=0)
+        self.remove_subscriber = remove.start()
+        self.addCleanup(remove.stop)
+
+    def test_other_callers_cannot_read_or_cancel(self):
+        response = self.client.get(self.url, REMOTE_ADDR="10.0.0.2")
+        self.assertEqual(response.status_code, 404)
+        response = self.client.delete(self.url, REMOTE_ADDR="10.0.0.2")
+        self.assertEqual(response.status_code, 404)
+        self.task.revoke.assert_not_called()
+
+    def test_submitter_can_read_and_cancel(self):
+        response = self.client.get(self.url, REMOTE_ADDR="10.0.0.1")
+        self.assertEqual(response.json()["status"], "running")
+        response = self.client.delete(self.url, REMOTE_ADDR="10.0.0.1")
+        self.assertEqual(response.status_code, 202)
+        self.task.revoke.assert_called_once_with(terminate=True)
+
+    def test_cancelling_a_coalesced_run_only_unsubscribes(self):
+        # another caller is still waiting on the same run
+        self.remove_subscriber.return_value = 1
+        response = self.client.delete(self.url, REMOTE_ADDR="10.0.0.1")
+        self.assertEqual(response.status_code, 202)
+        self.task.revoke.assert_not_called()
+
+
+class ResultCacheKeyTests(SimpleTestCase):
+    def test_only_line_endings_are_normalized(self):
+        self.assertEqual(normalize_source("x = 1\r\ny = 2\r\n"), "x = 1\ny = 2\n")
+        # a leading blank line shifts traceback line numbers
+        self.assertNotEqual(
+            normalize_source("\nx = 1/0\n"), normalize_source("x = 1/0\n")
+        )
+        # trailing spaces inside a string literal are output
+        self.assertNotEqual(
+            normalize_source('print("""a   \nb""")'),
+            normalize_source('print("""a\nb""")'),
+        )
+
+
+class SessionTests(SimpleTestCase):
+    @mock.patch("editor.sessions.get_client")
+    def test_claiming_an_expired_session_fails(self, get_client):
+        # the claim script found no record, so none was recreated
+        get_client.return_value.eval.return_value = -1
+        with self.assertRaises(SessionExpired):
+            claim_session("0b5e4c1e", "celery@worker")
+        get_client.return_value.hsetnx.assert_not_called()
+
+    @mock.patch("editor.tasks.interrupt_kernel")
+    @mock.patch("editor.tasks.end_session")
+    @mock.patch("editor.tasks.start_kernel", side_effect=TimeoutError)
+    @mock.patch("editor.tasks.claim_session", return_value=True)
+    @mock.patch("editor.tasks.get_session", return_value={"language": "python"})
+    def test_kernel_start_timeout_ends_the_session(
+        self, get_session, claim, start_kernel, end_session, interrupt_kernel
+    ):
+        result = run_session_cell.apply(("0b5e4c1e", "print(1)")).get()
+        self.assertEqual(result["status"], TIMED_OUT)
+        end_session.assert_called_once_with("0b5e4c1e")
+        interrupt_kernel.assert_not_called()
+
+    def test_cells_are_routed_and_recorded_by_language(self):
+        route = route_execution(
+            "editor.tasks.run_session_cell",
+            ("0b5e4c1e", "print(1)", ""),
+            {"language": "python"},
+            {},
+        )
+        self.assertEqual(route, {"queue": "execute.python.interactive"})
+
+    def test_cells_get_the_language_cpu_time(self):
+        language = build_registry(settings.EXECUTION_LANGUAGES)["python"]
+        command = cell_command(language, b"print(1)")
+        self.assertEqual(command[-2:], ["8", str(language.limits["CPU_TIME"])])
+
+
+@override_settings(EXECUTION_METRICS={"TOKEN": "s3cret"})
+class OperationsEndpointTests(SimpleTestCase):
+    def setUp(self):
+        self.client = APIClient()
+        for target, value in (
+            ("editor.views.render_metrics", ""),
+            ("editor.views.queue_stats", {}),
+            ("editor.views.result_cache.stats", {}),
+        ):
+            patcher = mock.patch(target, return_value=value)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def test_anonymous_callers_are_refused(self):
+        for path in ("metrics", "queues/stats", "cache/stats"):
+            response = self.client.get(f"/api/v1/editor/{path}")
+            self.assertEqual(response.status_code, 401, path)
+        response = self.client.get(
+            "/api/v1/editor/metrics", HTTP_AUTHORIZATION="Bearer wrong"
+        )
+        self.assertEqual(response.status_code, 401)
+
+    def test_scraper_token_reads_metrics_only(self):
+        response = self.client.get(
+            "/api/v1/editor/metrics", HTTP_AUTHORIZATION="Bearer s3cret"
+        )
+        self.assertEqual(response.status_code, 200)
+        response = self.client.get(
+            "/api/v1/editor/queues/stats", HTTP_AUTHORIZATION="Bearer s3cret"
+        )
+        self.assertEqual(response.status_code, 401)
+
+    def test_staff_read_everything(self):
+        self.client.force_authenticate(get_user_model()(is_staff=True))
+        for path in ("metrics", "queues/stats", "cache/stats"):
+            response = self.client.get(f"/api/v1/editor/{path}")
+            self.assertEqual(response.status_code, 200, path)
+
+
+class StreamOwnershipTests(SimpleTestCase):
+    def setUp(self):
+        patcher = mock.patch(
+            "editor.consumers.is_subscriber",
+            side_effect=lambda task_id, owner: owner == "user:7",
+        )
+        self.is_subscriber = patcher.start()
+        self.addCleanup(patcher.stop)
+        patcher = mock.patch(
+            "editor.consumers.event_stream_execution", new=mock.AsyncMock()
+        )
+        self.consumer = patcher.start()
+        self.addCleanup(patcher.stop)
+
+    async def connect(self, cookie=b""):
+        sent = []
+
+        async def send(message):
+            sent.append(message)
+
+        scope = {
+            "type": "http",
+            "path": "/stream/editor/execute/0b5e4c1e",
+            "headers": [(b"cookie", cookie)],
+            "client": ("10.0.0.2", 5555),
+        }
+        await stream_application(scope, mock.AsyncMock(), send)
+        return sent
+
+    async def test_other_callers_get_404(self):
+        sent = await self.connect()
+        self.assertEqual(sent[0]["status"], 404)
+        self.is_subscriber.assert_called_once_with("0b5e4c1e", "addr:10.0.0.2")
+        self.consumer.assert_not_called()
+
+    @mock.patch("editor.consumers.verify_access_token", return_value={"user_id": 7})
+    async def test_submitter_is_relayed(self, verify_access_token):
+        await self.connect(b"access_token=abc")
+        verify_access_token.assert_called_once_with("abc")
+        self.consumer.assert_awaited_once()
+
+    @override_settings(EXECUTION_METRICS={"ENABLED": False})
+    @mock.patch("editor.tasks.publish_result")
+    @mock.patch("editor.tasks.get_client")
+    def test_docker_failure_ends_the_stream(self, get_client, publish_result):
+        get_client.return_value.create_container.side_effect = DockerError(
+            500, "no space left on device"
+        )
+        result = stream_code.apply(("print(1)", "python"), task_id="0b5e4c1e").get()
+        self.assertEqual(result["status"], FAILED)
+        publish_result.assert_called_once_with("0b5e4c1e", result)
+
+    @override_settings(EXECUTION_METRICS={"ENABLED": False})
+    @mock.patch("editor.tasks.run_streaming", return_value={"status": FINISHED})
+    @mock.patch("editor.tasks.get_client")
+    def test_request_stdin_precedes_typed_input(self, get_client, run_streaming):
+        stream_code.apply(("print(input())", "python", "ada\n")).get()
+        preamble = run_streaming.call_args.kwargs["stdin_preamble"]
+        self.assertEqual(preamble, b"print(input())ada\n")
+
+
+class OutputCaptureTests(SimpleTestCase):
+    def test_byte_counts_include_dropped_output(self):
+        capture = BoundedCapture(limit=4, tail=2, ceiling=1024)
+        capture.write(STDOUT, b"0123456789")
+        capture.write(STDERR, b"oops")
+        self.assertTrue(capture.truncated)
+        self.assertEqual(capture.written, {STDOUT: 10, STDERR: 4})
+        metrics = build_metrics({}, {}, *capture.written.values())
+        self.assertEqual((metrics["stdout_bytes"], metrics["stderr_bytes"]), (10, 4))
+
+    def test_head_and_tail_are_kept_around_a_marker(self):
+        capture = BoundedCapture(limit=4, tail=3, ceiling=1024)
+        for chunk in (b"01", b"2345", b"6789"):
+            capture.write(STDOUT, chunk)
+        self.assertEqual(
+            capture.value(STDOUT),
+            b"0123\n[output truncated: 3 bytes omitted]\n789",
+        )
+        # a stream under the limit is kept whole
+        capture.write(STDERR, b"ok")
+        self.assertEqual(capture.value(STDERR), b"ok")
+
+    def test_ceiling_stops_the_run(self):
+        capture = BoundedCapture(limit=4, tail=2, ceiling=8)
+        capture.write(STDOUT, b"0123")
+        capture.write(STDERR, b"4567")
+        with self.assertRaises(OutputLimitExceeded):
+            capture.write(STDOUT, b"8")
+
+    def test_other_streams_are_ignored(self):
+        capture = BoundedCapture(limit=4, tail=2, ceiling=8)
+        capture.write(0, b"0123456789")  # stdin echo
+        self.assertEqual(capture.total, 0)
+        self.assertFalse(capture.truncated)
+
+
+class BenchmarkTests(SimpleTestCase):
+    @override_settings(
+        EXECUTOR_BACKEND=settings.EXECUTOR_BACKEND,
+        EXECUTION_ADMISSION=settings.EXECUTION_ADMISSION,
+        EXECUTION_METRICS={"ENABLED": False},
+        FAKE_SANDBOX_LATENCY_MS=0,
+    )
+    def test_eager_fake_level_needs_no_redis(self):
+        # use_backend's changes land in the override and are undone with it
+        use_backend("fake", eager=True)
+        payload = {"code": "print(1)", "language": "python"}
+        with mock.patch("redis.Redis.execute_command", side_effect=AssertionError):
+            level = run_level("task", payload, concurrency=2, requests=4)
+        self.assertEqual((level["requests"], level["errors"]), (4, 0))
+
+
+class JudgeVerdictTests(SimpleTestCase):
+    MEMORY_LIMIT = 64 * 1024 * 1024
+
+    def judge(self, rc, stdout=b"4\n", tle=0, mle=0, peak_kb=1024, ticks=10):
+        report = f"\nMARK {rc} {tle} {mle} {peak_kb} {ticks}\n".encode()
+        client = mock.Mock()
+        client.exec_run.return_value = (0, stdout, report)
+        case = {"stdin": "2\n", "expected_output": "4\n"}
+        with mock.patch("editor.judge.get_client", return_value=client), mock.patch(
+            "editor.judge.new_marker", return_value="MARK"
+        ):
+            outcome = _run_case(
+                "c", "python3", "/app/script.py", case, 1.0, self.MEMORY_LIMIT, "lines"
+            )
+        return outcome["verdict"]
+
+    def test_verdicts(self):
+        self.assertEqual(self.judge(0), ACCEPTED)
+        self.assertEqual(self.judge(0, stdout=b"5\n"), WRONG_ANSWER)
+        self.assertEqual(self.judge(1), RUNTIME_ERROR)
+        self.assertEqual(self.judge(128 + 9, tle=1), TIME_LIMIT_EXCEEDED)
+        self.assertEqual(self.judge(128 + 24), TIME_LIMIT_EXCEEDED)
+        self.assertEqual(self.judge(128 + 9, mle=1), MEMORY_LIMIT_EXCEEDED)
+        self.assertEqual(self.judge(0, peak_kb=128 * 1024), MEMORY_LIMIT_EXCEEDED)
+
+    def test_unexplained_sigkill_is_classified_by_cpu_time(self):
+        # the hard CPU rlimit (2s soft for a 1s case): out of time
+        self.assertEqual(self.judge(128 + 9, ticks=210), TIME_LIMIT_EXCEEDED)
+        # well under it: the container's OOM killer
+        self.assertEqual(self.judge(128 + 9, ticks=50), MEMORY_LIMIT_EXCEEDED)
+
+    def test_case_script_limits(self):
+        script = case_script("python3", 1.5, self.MEMORY_LIMIT, "MARK")
+        self.assertIn("ulimit -t 4 && ulimit -St 3 ||", script)
+        self.assertIn("-gt 150 ]", script)  # hundredths of a second
+        self.assertIn("-gt 65536 ]", script)  # kB
+        self.assertIn("MARK %s", script)
+
+
+@override_settings(NATIVE_SANDBOX={"SECCOMP": False})
+class SandboxCommandTests(SimpleTestCase):
+    def test_limited_command(self):
+        command = limited_command(["python", "x.py"], 2, 384 * 1024 * 1024)
+        self.assertEqual(command[0], "prlimit")
+        self.assertIn("--cpu=2:3", command)
+        self.assertIn(f"--as={384 * 1024 * 1024}", command)
+        self.assertEqual(command[command.index("--") + 1 :], ["python", "x.py"])
+        with override_settings(NATIVE_SANDBOX={"SECCOMP": True}):
+            command = limited_command(["python", "x.py"], 2, None)
+        self.assertFalse(any(arg.startswith("--as") for arg in command))
+        self.assertEqual(command[command.index("--") + 1], sys.executable)
+
+    def test_sandbox_command(self):
+        command = sandbox_command("/srv/py", "/dev/shm/editor-1", "python -u", "py")
+        self.assertEqual(command[0], "unshare")
+        self.assertIn("--mount-proc=/srv/py/proc", command)
+        script = command[command.index("-c") + 1]
+        # the host's root is unmounted, not just chrooted away from
+        self.assertIn("pivot_root . . && umount -l .", script)
+        self.assertNotIn("chroot", script)
+        self.assertEqual(
+            command[-5:],
+            ["/dev/shm/editor-1", "/srv/py", "python", "-u", "/app/script.py"],
+        )
+
+    def test_out_of_memory(self):
+        traceback = b"Traceback (most recent call last):\n...\nMemoryError\n"
+        self.assertTrue(out_of_memory("python", 1, traceback))
+        self.assertFalse(out_of_memory("python", 0, traceback))
+        # printed, then exited some other way
+        self.assertFalse(out_of_memory("python", 3, traceback))
+        self.assertFalse(out_of_memory("python", 1, b"ValueError\n"))
+        heap = b"FATAL ERROR: Reached heap limit JavaScript heap out of memory\n"
+        self.assertTrue(out_of_memory("javascript", 128 + 6, heap))
+        self.assertFalse(out_of_memory("javascript", 1, heap))
+
+
+class SyntaxCheckTests(SimpleTestCase):
+    MATCH = "match x:\n    case 1:\n        pass\n"
+
+    def test_check_python(self):
+        self.assertEqual(check_python("print(1)\n"), {"ok": True})
+        result = check_python("print(1\n")
+        self.assertFalse(result["ok"])
+        self.assertEqual(result["line"], 1)
+        result = check_python("print(1)\x00\n")
+        self.assertFalse(result["ok"])
+        self.assertEqual((result["line"], result["column"]), (None, None))
+
+    def test_grammar_of_the_executor_image(self):
+        self.assertEqual(check_python(self.MATCH), {"ok": True})
+        with override_settings(SYNTAX_CHECK={"PYTHON_VERSION": (3, 9)}):
+            result = check_python(self.MATCH)
+        self.assertFalse(result["ok"])
+        self.assertIn("3.10", result["message"])
+
+    def test_cache_write_failure_still_answers(self):
+        client = mock.Mock()
+        client.get.return_value = None
+        client.set.side_effect = ConnectionError("redis down")
+        with mock.patch("editor.syntax.get_client", return_value=client):
+            with self.assertLogs("editor.syntax", "WARNING"):
+                error = check_syntax("print(1\n", "python")
+        self.assertEqual(error["line"], 1)
+
+    @override_settings(EXECUTION_ADMISSION={"ENABLED": False})
+    def test_syntax_error_is_answered_without_a_run(self):
+        client = mock.Mock()
+        client.get.return_value = None
+        with mock.patch("editor.syntax.get_client", return_value=client):
+            response = self.client.post(
+                "/api/v1/editor/execute",
+                {"code": "print(1\n", "language": "python"},
+                content_type="application/json",
+            )
+        body = response.json()
+        self.assertEqual((response.status_code, body["task_id"]), (200, None))
+        self.assertEqual(body["metrics"]["cpu_time_ms"], 0)
+        self.assertEqual(body["metrics"]["stderr_bytes"], len(body["stderr"]))
+
+
+def redis_available():
+    try:
+        return redis.Redis.from_url(
+            settings.CELERY_RESULT_BACKEND, socket_connect_timeout=0.2
+        ).ping()
+    except redis.RedisError:
+        return False
+
+
+class AdmissionTests(SimpleTestCase):
+    def setUp(self):
+        patcher = mock.patch("editor.admission.get_client")
+        self.redis = patcher.start().return_value
+        self.addCleanup(patcher.stop)
+
+    def test_throttle_fails_open(self):
+        self.redis.eval.side_effect = ConnectionError("redis down")
+        request = RequestFactory().post("/", REMOTE_ADDR="10.0.0.1")
+        request.user = mock.Mock(is_authenticated=False)
+        with self.assertLogs("editor.admission", "WARNING"):
+            self.assertTrue(ExecutionThrottle().allow_request(request, None))
+
+    def test_slots(self):
+        self.redis.eval.return_value = 12
+        self.assertEqual(reserve_slot("user:1", "t1"), 9)  # highest priority
+        self.redis.eval.return_value = -1
+        with self.assertRaises(Throttled):
+            reserve_slot("user:1", "t2")
+
+    def test_subscriber_is_added_once_published(self):
+        task = mock.Mock()
+        self.redis.eval.return_value = 1
+        publish_execution(task, ("print(1)",), {}, "user:1", "t1", queue="q")
+        task.apply_async.assert_called_once_with(
+            ("print(1)",),
+            {},
+            task_id="t1",
+            priority=1,
+            headers={OWNER_HEADER: "user:1"},
+            queue="q",
+        )
+        pipe = self.redis.pipeline.return_value.__enter__.return_value
+        pipe.sadd.assert_called_once_with("admission:subscribers:t1", "user:1")
+
+    def test_throttled_or_unpublished_runs_hold_nothing(self):
+        task = mock.Mock()
+        self.redis.eval.return_value = -1
+        with self.assertRaises(Throttled):
+            publish_execution(task, (), {}, "user:1", "t1")
+        task.apply_async.side_effect = ConnectionError("broker down")
+        self.redis.eval.return_value = 0
+        with self.assertRaises(ConnectionError):
+            publish_execution(task, (), {}, "user:1", "t2")
+        self.redis.zrem.assert_called_once_with("admission:slots:user:1", "t2")
+        self.redis.pipeline.assert_not_called()
+
+
+@unittest.skipUnless(redis_available(), "Redis not available")
+class AdmissionScriptTests(SimpleTestCase):
+    """The Lua scripts themselves, against the configured Redis."""
+
+    def setUp(self):
+        self.redis = redis.Redis.from_url(settings.CELERY_RESULT_BACKEND)
+        self.key = f"test:admission:{uuid.uuid4().hex}"
+        self.addCleanup(self.redis.delete, self.key)
+
+    def test_take_tokens_refills_at_the_rate(self):
+        def take(now):
+            return self.redis.eval(TAKE_TOKENS, 1, self.key, now, 1, 2)
+
+        self.assertEqual(take(100)[0], 1)
+        self.assertEqual(take(100)[0], 1)
+        allowed, wait = take(100)
+        self.assertEqual((allowed, float(wait)), (0, 1.0))
+        self.assertEqual(take(101)[0], 1)
+
+    def test_reserve_slot_counts_live_slots(self):
+        def reserve(now, task_id):
+            return self.redis.eval(RESERVE_SLOT, 1, self.key, now, 60, 2, task_id)
+
+        self.assertEqual(reserve(100, "a"), 0)
+        self.assertEqual(reserve(100, "b"), 1)
+        self.assertEqual(reserve(100, "c"), -1)
+        # both slots expired
+        self.assertEqual(reserve(161, "c"), 0)
+
+
+class ArtifactCacheTests(SimpleTestCase):
+    def setUp(self):
+        cache_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, cache_dir)
+        override = override_settings(COMPILE_CACHE={"CACHE_DIR": cache_dir})
+        override.enable()
+        self.addCleanup(override.disable)
+        self.cache_dir = cache_dir
+
+    def files(self):
+        return sorted(
+            name for _, _, names in os.walk(self.cache_dir) for name in names
+        )
+
+    def test_key_covers_image_command_and_source(self):
+        language = build_registry(settings.EXECUTION_LANGUAGES)["c"]
+        language.digest = "sha256:1"
+        key = artifact_key(language, "int main(){}")
+        self.assertNotEqual(key, artifact_key(language, "int main(){return 0;}"))
+        language.compile += " -g"
+        self.assertNotEqual(key, artifact_key(language, "int main(){}"))
+        language.digest = "sha256:2"
+        self.assertNotEqual(key, artifact_key(language, "int main(){}"))
+
+    def test_store_and_load(self):
+        self.assertIsNone(load_artifact("ab12"))
+        store_artifact("ab12", b"binary")
+        self.assertEqual(load_artifact("ab12"), b"binary")
+        self.assertEqual(self.files(), ["ab12.tar"])
+
+    def test_failed_store_leaves_no_partial_file(self):
+        with mock.patch("os.replace", side_effect=OSError("disk full")):
+            with self.assertLogs("editor.compiled", "WARNING"):
+                store_artifact("ab12", b"binary")
+        self.assertEqual(self.files(), [])
+
+    def test_evict_removes_least_recently_used(self):
+        for age, key in enumerate(("cc03", "bb02", "aa01")):
+            store_artifact(key, b"x" * 10)
+            path = os.path.join(self.cache_dir, key[:2], f"{key}.tar")
+            os.utime(path, (1000 - age, 1000 - age))
+        load_artifact("aa01")  # touched: now the most recent
+        self.assertEqual(evict(20), 1)
+        self.assertEqual(self.files(), ["aa01.tar", "cc03.tar"])
+
+
+class ReaperTests(SimpleTestCase):
+    def dead_pid(self):
+        process = subprocess.Popen(["true"])
+        process.wait()
+        return process.pid
+
+    def test_owner_gone(self):
+        host = socket.gethostname()
+        self.assertFalse(_owner_gone(f"{host}:{os.getpid()}"))
+        self.assertTrue(_owner_gone(f"{host}:{self.dead_pid()}"))
+        # another host's reaper decides about its own workers
+        self.assertFalse(_owner_gone(f"elsewhere:{self.dead_pid()}"))
+        self.assertFalse(_owner_gone(None))
+
+    @mock.patch("editor.reaper.get_client")
+    def test_only_leaked_containers_are_removed(self, get_client):
+        host, now = socket.gethostname(), time.time()
+
+        def container(id, kind, owner=f"{host}:{os.getpid()}", age=0):
+            labels = {KIND_LABEL: kind, OWNER_LABEL: owner}
+            return {"Id": id, "Labels": labels, "Created": now - age}
+
+        get_client.return_value.list_containers.return_value = [
+            container("old-run", RUN, age=120),
+            container("new-run", RUN, age=30),
+            container("live-pool", POOL),
+            container("dead-pool", POOL, owner=f"{host}:{self.dead_pid()}"),
+            # ended by editor.sessions, not by age
+            container("session", SESSION, age=10_000),
+        ]
+        self.assertEqual(reap_orphans({RUN: 60}), 2)
+        get_client.return_value.list_containers.assert_called_once_with(
+            {"label": [KIND_LABEL]}
+        )
+        removed = [
+            call.args[0] for call in get_client.return_value.remove_container.mock_calls
+        ]
+        self.assertEqual(removed, ["old-run", "dead-pool"])
+
+    def test_leftover_files(self):
+        root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, root)
+        for name in ("editor-old", "editor-new", "other"):
+            os.mkdir(os.path.join(root, name))
+        partial = os.path.join(root, "other", "x.partial")
+        open(partial, "w").close()
+        for path in (os.path.join(root, "editor-old"), partial):
+            os.utime(path, (time.time() - 120, time.time() - 120))
+        removed = reap_files(
+            [os.path.join(root, "editor-*"), os.path.join(root, "*", "*.partial")],
+            60,
+        )
+        self.assertEqual(removed, 2)
+        self.assertEqual(sorted(os.listdir(root)), ["editor-new", "other"])
+        self.assertEqual(os.listdir(os.path.join(root, "other")), [])
+
+
+class QueueTests(SimpleTestCase):
+    def test_executions_are_routed_by_language(self):
+        route = route_execution("editor.tasks.execute_code", ("x", "Ruby"), {}, {})
+        self.assertEqual(route, {"queue": "execute.ruby.interactive"})
+        # unknown languages and other tasks keep Celery's default routing
+        self.assertIsNone(
+            route_execution("editor.tasks.execute_code", ("x", "cobol"), {}, {})
+        )
+        self.assertIsNone(route_execution("accounts.tasks.send_email", (), {}, {}))
+
+    @override_settings(
+        EXECUTION_LANGUAGES={
+            "python": {
+                "IMAGE": "python-executor",
+                "ENTRYPOINT": "python",
+                "EXTENSION": "py",
+            }
+        },
+        CELERY_BROKER_TRANSPORT_OPTIONS={"priority_steps": [0, 3], "sep": ":"},
+    )
+    def test_queue_stats(self):
+        client = mock.Mock()
+        client.hgetall.side_effect = lambda key: (
+            {b"count": b"4", b"total_ms": b"100", b"last_ms": b"12.5"}
+            if key == "execqueue:wait:execute.python.interactive"
+            else {}
+        )
+        client.llen.side_effect = lambda name: {
+            "execute.python.interactive": 2,
+            "execute.python.interactive:3": 1,
+        }.get(name, 0)
+        with mock.patch("editor.queues.get_client", return_value=client):
+            stats = queue_stats()
+        self.assertEqual(
+            priority_lists("execute.python.batch"),
+            ["execute.python.batch", "execute.python.batch:3"],
+        )
+        self.assertEqual(
+            stats,
+            {
+                "execute.python.interactive": {
+                    "depth": 3,
+                    "wait_count": 4,
+                    "wait_avg_ms": 25.0,
+                    "wait_last_ms": 12.5,
+                },
+                "execute.python.batch": {
+                    "depth": 0,
+                    "wait_count": 0,
+                    "wait_avg_ms": 0.0,
+                    "wait_last_ms": 0.0,
+                },
+            },
+        )
+
+
+
+class DeferredThread:
+    """Stands in for threading.Thread; run_all() runs what was started."""
+
+    started = []
+
+    def __init__(self, target, args=(), **kwargs):
+        self.target, self.args = target, args
+
+    def start(self):
+        self.started.append(self)
+
+    @classmethod
+    def run_all(cls):
+        # the pool starts threads while holding its lock; run them after
+        while cls.started:
+            thread = cls.started.pop(0)
+            thread.target(*thread.args)
+
+
+@override_settings(EXECUTOR_POOL={"MIN_SIZE": 1, "MAX_SIZE": 2, "MAX_RUNS": 3})
+class ContainerPoolTests(SimpleTestCase):
+    def setUp(self):
+        self.docker = mock.Mock()
+        self.docker.container_changes.return_value = [{"Path": "/tmp/x"}]
+        for target, value in (
+            ("editor.pool.get_client", mock.Mock(return_value=self.docker)),
+            # editor.pool's own view of the module; other threads stay real
+            (
+                "editor.pool.threading",
+                types.SimpleNamespace(Thread=DeferredThread, Lock=threading.Lock),
+            ),
+        ):
+            patcher = mock.patch(target, value)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        self.addCleanup(DeferredThread.started.clear)
+        self.pool = ContainerPool("python", "python-executor")
+
+    def test_miss_grows_the_pool_and_the_next_acquire_hits(self):
+        self.assertIsNone(self.pool.acquire())
+        DeferredThread.run_all()
+        container = self.pool.acquire()
+        self.assertIsInstance(container, WarmContainer)
+        stats = self.pool.stats()
+        self.assertEqual((stats["hits"], stats["misses"], stats["live"]), (1, 1, 1))
+        # pooled containers never get a network either
+        config = self.docker.create_container.call_args.args[0]
+        self.assertEqual(config["HostConfig"]["NetworkMode"], "none")
+
+    def test_unhealthy_container_is_dropped(self):
+        self.pool.fill(wait=True)
+        self.pool.idle[0].last_checked = 0
+        self.docker.inspect_container.return_value = {"State": {"Running": False}}
+        self.assertIsNone(self.pool.acquire())
+        DeferredThread.run_all()
+        self.assertEqual(self.pool.stats()["recycled"], 1)
+        self.docker.remove_container.assert_called_once()
+
+    def test_scrubbed_container_goes_back_to_idle(self):
+        self.pool.fill(wait=True)
+        container = self.pool.acquire()
+        self.pool.release(container)
+        DeferredThread.run_all()
+        command = self.docker.exec_run.call_args.args[1]
+        self.assertIn("kill -9 -1", command[-1])
+        self.assertEqual(self.pool.idle, [container])
+
+    def test_changes_outside_scratch_recycle_the_container(self):
+        self.pool.fill(wait=True)
+        container = self.pool.acquire()
+        self.docker.container_changes.return_value = [{"Path": "/etc/passwd"}]
+        self.pool.release(container)
+        DeferredThread.run_all()
+        self.assertNotIn(container, self.pool.idle)
+        self.assertEqual(self.pool.stats()["recycled"], 1)
+        self.docker.remove_container.assert_called_once_with(container.name)
+
+    def test_dirty_or_worn_out_containers_are_not_reused(self):
+        self.pool.fill(wait=True)
+        container = self.pool.acquire()
+        self.pool.release(container, dirty=True)
+        DeferredThread.run_all()  # removed, and a replacement started
+        self.assertNotIn(container, self.pool.idle)
+        container = self.pool.acquire()
+        container.runs = 2
+        self.pool.release(container)  # the third run
+        DeferredThread.run_all()
+        self.assertNotIn(container, self.pool.idle)
+        self.docker.exec_run.assert_not_called()
+
+
+def frame(stream_id, payload):
+    return FRAME_HEADER.pack(stream_id, len(payload)) + payload
+
+
+class DockerStreamTests(SimpleTestCase):
+    def test_frames_split_across_reads(self):
+        data = frame(STDOUT, b"hello") + frame(STDERR, b"oops")
+        parser = FrameParser()
+        self.assertEqual(parser.feed(data[:3]), [])
+        self.assertEqual(parser.feed(data[3:15]), [(STDOUT, b"hello")])
+        self.assertEqual(parser.feed(data[15:]), [(STDERR, b"oops")])
+
+    def test_exec_run_returns_exit_code_and_both_streams(self):
+        ours, theirs = socket.socketpair()
+        self.addCleanup(theirs.close)
+        theirs.sendall(frame(STDOUT, b"4\n") + frame(STDERR, b"warn\n"))
+        theirs.shutdown(socket.SHUT_WR)
+        client = DockerClient("/var/run/docker.sock", "v1.43", 1, 5)
+        with mock.patch.object(
+            client, "exec_start", return_value=("e1", RawStream(ours))
+        ), mock.patch.object(client, "exec_exit_code", return_value=3):
+            result = client.exec_run("c1", ["python", "-c", "..."])
+        self.assertEqual(result, (3, b"4\n", b"warn\n"))
+
+    def test_stdin_is_sent_and_closed(self):
+        ours, theirs = socket.socketpair()
+        self.addCleanup(theirs.close)
+        stream = RawStream(ours)
+        stream.send_stdin_in_background(b"2 3\n")
+        received = b""
+        while chunk := theirs.recv(64):
+            received += chunk
+        self.assertEqual(received, b"2 3\n")  # then EOF
+        stream.close()
+
+
+@override_settings(TRACING={"ENABLED": True})
+class TraceparentTests(SimpleTestCase):
+    def test_header_round_trips(self):
+        with mock.patch("core.tracing.export"), start_trace("test") as root:
+            value = root.traceparent
+        self.assertRegex(value, r"^00-[0-9a-f]{32}-[0-9a-f]{16}-01$")
+        self.assertEqual(parse_traceparent(value), (root.trace.trace_id, root.span_id))
+
+    def test_malformed_headers_are_ignored(self):
+        for value in (
+            None,
+            "",
+            "00-abc-def-01",
+            f"00-{'a' * 32}-{'b' * 16}",
+            f"00-{'a' * 31}-{'b' * 17}-01",
+        ):
+            self.assertIsNone(parse_traceparent(value), value)
+
+    def test_published_task_continues_the_trace(self):
+        parent = ("a" * 32, "b" * 16)
+        headers = {}
+        with mock.patch("core.tracing.export") as export:
+            with start_trace("celery.task", parent) as root:
+                inject_trace_context("editor.tasks.execute_code", headers, "q")
+                finish_publish_span()
+        self.assertEqual(root.trace.trace_id, parent[0])
+        self.assertEqual(root.parent_id, parent[1])
+        trace_id, publish_id = parse_traceparent(headers[TRACEPARENT])
+        self.assertEqual(trace_id, parent[0])
+        publish, _ = export.call_args.args[0]
+        self.assertEqual(publish.span_id, publish_id)
+        self.assertEqual(publish.parent_id, root.span_id)
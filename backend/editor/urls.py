@@ -1,8 +1,38 @@
 from django.urls import path
-from .views import CodeExecutionView
+from .views import (
+    CodeExecutionView,
+    CodeExecutionStatusView,
+    ExecutionCacheStatsView,
+    ExecutionMetricsView,
+    ExecutionQueueStatsView,
+    JudgeView,
+    SessionCellView,
+    SessionDetailView,
+    SessionView,
+)
 
 app_name = "editor"
 
 urlpatterns = [
     path("execute", CodeExecutionView.as_view(), name="code_execute"),
+    path("judge", JudgeView.as_view(), name="judge"),
+    path("sessions", SessionView.as_view(), name="sessions"),
+    path(
+        "sessions/<str:session_id>",
+        SessionDetailView.as_view(),
+        name="session_detail",
+    ),
+    path(
+        "sessions/<str:session_id>/run",
+        SessionCellView.as_view(),
+        name="session_run",
+    ),
+    path("cache/stats", ExecutionCacheStatsView.as_view(), name="cache_stats"),
+    path("queues/stats", ExecutionQueueStatsView.as_view(), name="queue_stats"),
+    path("metrics", ExecutionMetricsView.as_view(), name="metrics"),
+    path(
+        "execute/<str:task_id>",
+        CodeExecutionStatusView.as_view(),
+        name="code_execute_status",
+    ),
 ]
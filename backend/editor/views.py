@@ -1,19 +1,369 @@
+import uuid
+
+from celery.exceptions import TimeLimitExceeded
+from celery.result import AsyncResult
+from django.http import HttpResponse
+from rest_framework.permissions import IsAdminUser
 from rest_framework.views import APIView
 from rest_framework.response import Response
 from rest_framework import status
-from .serializers import CodeExecutionSerializer
-from .tasks import execute_code
+from core.tracing import traced
+from .serializers import (
+    CodeExecutionSerializer,
+    JudgeSerializer,
+    SessionCellSerializer,
+    SessionSerializer,
+)
+from .tasks import (
+    execute_code,
+    judge_code,
+    run_session_cell,
+    stop_session,
+    stream_code,
+    execution_result,
+    FINISHED,
+    TIMED_OUT,
+    FAILED,
+)
+from . import cache as result_cache
+from .accounting import build_metrics
+from .admission import (
+    ExecutionThrottle,
+    add_subscriber,
+    execution_owner,
+    is_subscriber,
+    publish_execution,
+    release_slot,
+    remove_subscriber,
+    reserve_slot,
+)
+from .backends import select_backend
+from .syntax import check_syntax, syntax_error_stderr
+from .judge import COMPILE_ERROR
+from .languages import get_language
+from .metrics import HasMetricsToken, render as render_metrics
+from .queues import BATCH, execution_queue, queue_stats
+from .sessions import (
+    SessionLimitExceeded,
+    create_session,
+    end_session,
+    get_session,
+    session_queue,
+    session_setting,
+)
+
+# Celery task states as reported by the execution API
+CELERY_STATES = {
+    "PENDING": "queued",
+    "RECEIVED": "queued",
+    "RETRY": "queued",
+    "STARTED": "running",
+    "REVOKED": "cancelled",
+}
+
+
+def execution_payload(task):
+    """Build the status/result body for an execution task."""
+    payload = {"task_id": task.id}
+    if task.state == "SUCCESS":
+        payload.update(task.result)
+    elif task.state == "FAILURE":
+        # the Celery time_limit backstop fired, or the task crashed
+        timed_out = isinstance(task.result, TimeLimitExceeded)
+        payload.update(
+            execution_result(
+                TIMED_OUT if timed_out else FAILED,
+                error=(
+                    "Execution timed out. Your code took too long."
+                    if timed_out
+                    else "An error occurred during code execution."
+                ),
+            )
+        )
+    else:
+        payload["status"] = CELERY_STATES.get(task.state, "queued")
+    return payload
 
 
 class CodeExecutionView(APIView):
+    throttle_classes = [ExecutionThrottle]
+
+    @traced("view.execute")
     def post(self, request):
         serializer = CodeExecutionSerializer(data=request.data)
         if serializer.is_valid():
             code = serializer.validated_data["code"]
             language = serializer.validated_data["language"]
-            # create  async task for code execution
-            task = execute_code.delay(code, language)
-            result = task.get(timeout=40)
-            print("result", result)
-            return Response({"output": result}, status=status.HTTP_200_OK)
+            # None (unknown language) falls back to the default routing
+            queue = execution_queue(language, serializer.validated_data["lane"])
+            owner = execution_owner(request)
+            stdin = serializer.validated_data["stdin"]
+            if serializer.validated_data["stream"]:
+                # output is relayed by core.asgi; the run starts once a client connects
+                task = publish_execution(
+                    stream_code, (code, language, stdin), {}, owner, queue=queue
+                )
+                return Response(
+                    {
+                        "task_id": task.id,
+                        "status": "queued",
+                        "stream": {
+                            "websocket": f"/ws/editor/execute/{task.id}",
+                            "events": f"/stream/editor/execute/{task.id}",
+                        },
+                    },
+                    status=status.HTTP_202_ACCEPTED,
+                )
+            # code that does not parse is answered here, without a container
+            syntax_error = check_syntax(code, language.lower())
+            if syntax_error is not None:
+                stderr = syntax_error_stderr(syntax_error)
+                result = execution_result(FINISHED, exit_code=1, stderr=stderr)
+                # nothing ran: no container, no CPU time, no memory
+                result["metrics"] = build_metrics(
+                    {},
+                    {"cpu_time_ms": 0, "peak_memory_bytes": 0},
+                    stderr_bytes=len(stderr.encode("utf-8")),
+                )
+                return Response(
+                    {"task_id": None, **result, "syntax_error": syntax_error},
+                    status=status.HTTP_200_OK,
+                )
+            backend = select_backend(language, request.user)
+            cache_key = None
+            profile = get_language(language)
+            if (
+                serializer.validated_data["cache"]
+                and profile is not None
+                and result_cache.cache_setting("ENABLED")
+            ):
+                cache_key = result_cache.cache_key(
+                    code, language.lower(), stdin, profile.image
+                )
+            if cache_key:
+                cached = result_cache.lookup(cache_key)
+                if cached is not None:
+                    return Response(
+                        {"task_id": None, **cached, "cached": True},
+                        status=status.HTTP_200_OK,
+                    )
+                task_id = str(uuid.uuid4())
+                # taken before the claim, so a refused run never holds the key
+                priority = reserve_slot(owner, task_id)
+                running = result_cache.claim(cache_key, task_id)
+                if running is not None:
+                    # an identical run is in flight: poll that one instead
+                    release_slot(owner, task_id)
+                    add_subscriber(running, owner)
+                    return Response(
+                        {"task_id": running, "status": "queued", "coalesced": True},
+                        status=status.HTTP_202_ACCEPTED,
+                    )
+                try:
+                    task = publish_execution(
+                        execute_code,
+                        (code, language, stdin),
+                        {"cache_key": cache_key, "backend": backend},
+                        owner,
+                        task_id,
+                        priority,
+                        queue=queue,
+                    )
+                except Exception:
+                    # otherwise identical runs would wait on one never queued
+                    result_cache.release(cache_key, task_id)
+                    raise
+            else:
+                # create async task for code execution; the client polls for the result
+                task = publish_execution(
+                    execute_code,
+                    (code, language, stdin),
+                    {"backend": backend},
+                    owner,
+                    queue=queue,
+                )
+            return Response(
+                {"task_id": task.id, "status": "queued"},
+                status=status.HTTP_202_ACCEPTED,
+            )
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+
+
+class JudgeView(APIView):
+    """Run one program against many test cases; poll execute/<task_id>."""
+
+    throttle_classes = [ExecutionThrottle]
+
+    @traced("view.judge")
+    def post(self, request):
+        serializer = JudgeSerializer(data=request.data)
+        if not serializer.is_valid():
+            return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+        data = serializer.validated_data
+        cases = data["cases"]
+        syntax_error = check_syntax(data["code"], data["language"].lower())
+        if syntax_error is not None:
+            # every case would fail the same way; no container needed
+            return Response(
+                {
+                    "task_id": None,
+                    "status": FINISHED,
+                    "verdict": COMPILE_ERROR,
+                    "passed": 0,
+                    "total": len(cases),
+                    "syntax_error": syntax_error,
+                    "cases": [],
+                },
+                status=status.HTTP_200_OK,
+            )
+        task = publish_execution(
+            judge_code,
+            (
+                data["code"],
+                data["language"],
+                [dict(case) for case in cases],
+                data["time_limit"],
+                data["memory_limit_mb"] * 1024 * 1024,
+            ),
+            {
+                "comparison": data["comparison"],
+                "stop_on_failure": data["stop_on_failure"],
+            },
+            execution_owner(request),
+            # judge runs never hold up someone pressing Run
+            queue=execution_queue(data["language"], BATCH),
+        )
+        return Response(
+            {"task_id": task.id, "status": "queued"},
+            status=status.HTTP_202_ACCEPTED,
+        )
+
+
+def owned_session(request, session_id):
+    session = get_session(session_id)
+    if session is None or session["owner"] != execution_owner(request):
+        return None
+    return session
+
+
+class SessionView(APIView):
+    """Open a session; its kernel starts with the first cell."""
+
+    def post(self, request):
+        serializer = SessionSerializer(data=request.data)
+        if not serializer.is_valid():
+            return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+        try:
+            session = create_session(
+                execution_owner(request), serializer.validated_data["language"]
+            )
+        except SessionLimitExceeded as e:
+            return Response(
+                {"error": str(e)}, status=status.HTTP_429_TOO_MANY_REQUESTS
+            )
+        return Response(session, status=status.HTTP_201_CREATED)
+
+
+class SessionDetailView(APIView):
+    def delete(self, request, session_id):
+        session = owned_session(request, session_id)
+        if session is None:
+            return Response(
+                {"error": "No such session."}, status=status.HTTP_404_NOT_FOUND
+            )
+        end_session(session_id)
+        if session.get("container"):
+            stop_session.apply_async(
+                (session["container"],), queue=session_queue(session)
+            )
+        return Response(status=status.HTTP_204_NO_CONTENT)
+
+
+class SessionCellView(APIView):
+    """Run a cell in a session; poll execute/<task_id> for the result."""
+
+    throttle_classes = [ExecutionThrottle]
+
+    @traced("view.session_cell")
+    def post(self, request, session_id):
+        serializer = SessionCellSerializer(data=request.data)
+        if not serializer.is_valid():
+            return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+        session = owned_session(request, session_id)
+        if session is None:
+            return Response(
+                {"error": "No such session, or it has expired."},
+                status=status.HTTP_404_NOT_FOUND,
+            )
+        task = publish_execution(
+            run_session_cell,
+            (
+                session_id,
+                serializer.validated_data["code"],
+                serializer.validated_data["stdin"],
+            ),
+            {"language": session["language"]},
+            execution_owner(request),
+            # cells go to the worker that holds the kernel
+            queue=session_queue(session),
+            # a cell for a worker that went away is dropped with its session
+            expires=session_setting("IDLE_TIMEOUT"),
+        )
+        return Response(
+            {"task_id": task.id, "status": "queued", "session_id": session_id},
+            status=status.HTTP_202_ACCEPTED,
+        )
+
+
+def not_found():
+    return Response({"error": "No such execution."}, status=status.HTTP_404_NOT_FOUND)
+
+
+class CodeExecutionStatusView(APIView):
+    @traced("view.execution_status")
+    def get(self, request, task_id):
+        # someone else's run looks the same as one that never existed
+        if not is_subscriber(task_id, execution_owner(request)):
+            return not_found()
+        task = AsyncResult(task_id, app=execute_code.app)
+        return Response(execution_payload(task), status=status.HTTP_200_OK)
+
+    def delete(self, request, task_id):
+        if not is_subscriber(task_id, execution_owner(request)):
+            return not_found()
+        task = AsyncResult(task_id, app=execute_code.app)
+        if task.ready():
+            return Response(execution_payload(task), status=status.HTTP_409_CONFLICT)
+        # a coalesced run keeps going while anyone else is still waiting on it
+        if remove_subscriber(task_id, execution_owner(request)) == 0:
+            # queued tasks are dropped by the worker; running ones are terminated
+            task.revoke(terminate=True)
+        return Response(
+            {"task_id": task.id, "status": "cancelled"},
+            status=status.HTTP_202_ACCEPTED,
+        )
+
+
+class ExecutionCacheStatsView(APIView):
+    permission_classes = [IsAdminUser]
+
+    def get(self, request):
+        return Response(result_cache.stats(), status=status.HTTP_200_OK)
+
+
+class ExecutionQueueStatsView(APIView):
+    permission_classes = [IsAdminUser]
+
+    def get(self, request):
+        return Response(queue_stats(), status=status.HTTP_200_OK)
+
+
+class ExecutionMetricsView(APIView):
+    """Prometheus scrape endpoint."""
+
+    permission_classes = [HasMetricsToken | IsAdminUser]
+
+    def get(self, request):
+        return HttpResponse(
+            render_metrics(), content_type="text/plain; version=0.0.4; charset=utf-8"
+        )
@@ -3,12 +3,36 @@ import Editor from '@monaco-editor/react';
 import axios from 'axios';
 import './App.css';
 
+const EXECUTE_URL = 'http://127.0.0.1:8000/api/v1/editor/execute';
+const POLL_INTERVAL_MS = 300;
+const FINAL_STATES = ['finished', 'timed_out', 'oom_killed', 'truncated', 'failed', 'cancelled'];
+
+// stdout, stderr and exit code come back as separate fields
+const formatExecution = (execution) => {
+    if (execution.status === 'cancelled') {
+        return 'Execution cancelled.';
+    }
+    if (execution.error) {
+        return execution.error;
+    }
+    let text = (execution.stdout || '') + (execution.stderr || '');
+    if (execution.exit_code) {
+        text += `\n[exited with code ${execution.exit_code}]`;
+    }
+    return text;
+};
+
 function CodeEditor() {
     // Available languages
     const languageOptions = [
         { value: 'python', label: 'Python', default: '# Python code\nprint("Hello from Python!")\n\n# You can define functions\ndef greet(name):\n    return f"Hello, {name}!"\n\n# Output example\nprint(greet("User"))' },
         { value: 'javascript', label: 'JavaScript', default: '// JavaScript code\nconsole.log("Hello from JavaScript!");\n\n// You can define functions\nfunction greet(name) {\n  return `Hello, ${name}!`;\n}\n\n// Output example\nconsole.log(greet("User"));' },
-        { value: 'ruby', label: 'Ruby', default: '# Ruby code\nputs "Hello from Ruby!"\n\n# You can define functions\ndef greet(name)\n  "Hello, #{name}!"\nend\n\n# Output example\nputs greet("User")' }
+        { value: 'ruby', label: 'Ruby', default: '# Ruby code\nputs "Hello from Ruby!"\n\n# You can define functions\ndef greet(name)\n  "Hello, #{name}!"\nend\n\n# Output example\nputs greet("User")' },
+        { value: 'c', label: 'C', default: '// C code\n#include <stdio.h>\n\nint main(void) {\n    printf("Hello from C!\\n");\n    return 0;\n}' },
+        { value: 'cpp', label: 'C++', default: '// C++ code\n#include <iostream>\n\nint main() {\n    std::cout << "Hello from C++!" << std::endl;\n    return 0;\n}' },
+        { value: 'go', label: 'Go', default: '// Go code\npackage main\n\nimport "fmt"\n\nfunc main() {\n\tfmt.Println("Hello from Go!")\n}' },
+        { value: 'rust', label: 'Rust', default: '// Rust code\nfn main() {\n    println!("Hello from Rust!");\n}' },
+        { value: 'java', label: 'Java', default: '// Java code: the class must be called Main\npublic class Main {\n    public static void main(String[] args) {\n        System.out.println("Hello from Java!");\n    }\n}' }
     ];
 
     // State for each editor
@@ -92,13 +116,19 @@ function CodeEditor() {
         // Ensure preview is not expanded when running dynamic code
         setIsExpandedPreview(false);
         try {
-            console.log(selectedLanguage);
-            const response = await axios.post('http://127.0.0.1:8000/api/v1/editor/execute', {
+            const submitted = await axios.post(EXECUTE_URL, {
                 code: codeContent,
                 language: selectedLanguage
 
             });
-            setOutput(response.data.output);
+            // Execution runs in the background; poll until it reaches a final state
+            let execution = submitted.data;
+            while (!FINAL_STATES.includes(execution.status)) {
+                await new Promise((resolve) => setTimeout(resolve, POLL_INTERVAL_MS));
+                const response = await axios.get(`${EXECUTE_URL}/${execution.task_id}`);
+                execution = response.data;
+            }
+            setOutput(formatExecution(execution));
             setActiveTab('output');
         } catch (error) {
             setOutput('Error executing code: ' + (error.response?.data?.error || error.message));